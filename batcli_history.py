@@ -0,0 +1,322 @@
+"""
+BatCLI komentohistoria
+Pysyvä historia tiedostoon ja Ctrl-R-haku indeksistä.
+
+Jokainen komento lisätään tiedoston loppuun heti (auki pidettyyn
+tiedostoon, yksi write per komento), joten kaatuminenkaan ei hävitä
+historiaa. Kun tiedostossa on yli kaksi kertaa max_entries riviä, se
+kirjoitetaan uudelleen pelkillä muistissa olevilla komennoilla. Tiedosto
+luetaan vasta kun historiaa ensimmäisen kerran tarvitaan, ja silloinkin
+vain lopusta (max_entries komentoa). Sama komento pidetään muistissa vain
+kerran: uusi käyttö siirtää sen uusimmaksi.
+
+Ctrl-R hakee komentoja joiden jokin sana alkaa haulla ("he" löytää
+"cast heal tiku"). Haku käyttää lajiteltua taulukkoa sanojen alusta
+alkavista loppuosista: kirjain kerrallaan tarkentuva haku on bisect
+edellisen osuma-alueen sisällä. Taulukko rakennetaan taustasäikeessä
+(build_index); sitä uudemmat komennot käydään läpi suoraan.
+"""
+
+import bisect
+import os
+from pathlib import Path
+
+# Historiatiedoston oletusnimi projektikansiossa (HISTORY_FILE vaihtaa)
+HISTORY_FILENAME = ".batcli_history"
+
+# Muistissa pidettävien (eri) komentojen enimmäismäärä
+HISTORY_MAX = 100000
+
+# Indeksin avaimen pituus: pidemmät haut tarkistetaan osumista erikseen
+INDEX_KEY_LEN = 32
+
+# Uusimpia komentoja ei lisätä indeksiin heti vaan ne käydään läpi suoraan;
+# indeksi kannattaa rakentaa uudelleen kun niitä kertyy näin monta
+INDEX_PENDING_MAX = 1024
+
+# Jos hakua vastaa indeksissä enemmän avaimia kuin tämä, osuma löytyy
+# nopeammin käymällä komentoja läpi uusimmasta alkaen
+INDEX_SCAN_THRESHOLD = 512
+
+_READ_BLOCK = 64 * 1024
+
+
+def word_starts(command):
+    """Kohdat joista sana alkaa (alku ja jokaisen välilyönnin jälkeen)."""
+    starts = [0]
+    i = command.find(' ')
+    while i >= 0:
+        if i + 1 < len(command) and command[i + 1] != ' ':
+            starts.append(i + 1)
+        i = command.find(' ', i + 1)
+    return starts
+
+
+def matches_word_start(command, query):
+    """Alkaako jokin komennon sana haulla (sama ehto kuin indeksissä)."""
+    return command.startswith(query) or (' ' + query) in command
+
+
+def read_tail(path, max_lines):
+    """Lue tiedoston viimeiset max_lines riviä lukematta koko tiedostoa."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        data = b""
+        while pos > 0 and data.count(b"\n") <= max_lines:
+            step = min(_READ_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    if pos > 0:
+        lines = lines[1:]  # Ensimmäinen rivi voi olla katkennut
+    return lines[-max_lines:]
+
+
+def build_index(entries):
+    """Lajitellut avaimet ja niiden paikat entries-listasta.
+
+    Ei muuta mitään, joten sen voi ajaa taustasäikeessä listan kopiolle.
+
+    Returns:
+        (avaimet, paikat)
+    """
+    keys = []
+    positions = []
+    for pos, cmd in enumerate(entries):
+        if cmd is not None:
+            for start in word_starts(cmd):
+                keys.append(cmd[start:start + INDEX_KEY_LEN])
+                positions.append(pos)
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return [keys[i] for i in order], [positions[i] for i in order]
+
+
+class CommandHistory:
+    """Komentohistoria: tiedosto, muistissa oleva lista ja hakuindeksi.
+
+    Paikat (pos) ovat indeksejä entries-listaan. Siirretty (myöhemmin
+    uudelleen käytetty) komento jättää listaan None-paikan, joten paikat
+    pysyvät voimassa kunnes lista tiivistetään; tiivistys kasvattaa
+    generationia ja vanhentaa indeksin.
+    """
+
+    def __init__(self, path=None, max_entries=HISTORY_MAX):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.entries = []  # Vanhin ensin, None = siirretty uudemmaksi
+        self.position = {}  # {komento: paikka entries-listassa}
+        self.loaded = self.path is None
+        self.error = None  # Viimeisin tiedostovirhe
+        self.file_lines = 0  # Arvio tiedoston riveistä (vain luettu loppu tunnetaan)
+        self._file = None  # Auki pidetty historiatiedosto (append)
+        self.generation = 0
+        self._index_keys = []  # Lajitellut avaimet (sanan alusta, max INDEX_KEY_LEN)
+        self._index_pos = []  # Avainta vastaava paikka
+        self._indexed = 0  # Montako entries-alkiota indeksi kattaa
+
+    def read(self):
+        """Lue tiedoston viimeiset max_entries riviä (ei muuta tilaa)."""
+        if self.path is None or not self.path.exists():
+            return []
+        return read_tail(self.path, self.max_entries)
+
+    def load(self):
+        """Lue historia heti jos sitä ei ole vielä luettu."""
+        if self.loaded:
+            return
+        try:
+            lines = self.read()
+        except OSError as e:
+            self.error = e
+            lines = []
+        self.merge(lines)
+
+    def merge(self, lines):
+        """Ota luetut rivit käyttöön. Ennen latausta lisätyt jäävät uusimmiksi."""
+        if self.loaded:
+            return
+        self.loaded = True
+        pending = [cmd for cmd in self.entries if cmd is not None]
+        self.entries = []
+        self.position = {}
+        for cmd in lines + pending:
+            self._add(cmd)
+        self._compact()
+        self.file_lines += len(lines)
+        if len(lines) >= self.max_entries and len(lines) > 2 * len(self):
+            self.compact_file()
+
+    def append(self, command):
+        """Lisää komento historiaan ja tiedoston loppuun."""
+        if not command.strip() or '\n' in command:
+            return
+        if self.entries and self.entries[-1] == command:
+            return  # Sama kuin edellinen: ei muistiin eikä tiedostoon
+        self._write(command)
+        self._add(command)
+        if self.loaded and self.file_lines > 2 * self.max_entries:
+            self.compact_file()  # Tiedosto ei kasva rajatta istunnon aikana
+        # Tiivistetään vasta väljyyden jälkeen, ettei jokainen lisäys maksa O(n)
+        if (len(self.entries) > 2 * len(self.position)
+                or len(self.position) > self.max_entries + self.max_entries // 4):
+            self._compact()
+
+    def _write(self, command):
+        if self.path is None:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(command + '\n')
+            self._file.flush()
+        except OSError as e:
+            self.error = e
+            self.close()
+            return
+        self.file_lines += 1
+
+    def close(self):
+        """Sulje auki pidetty historiatiedosto (avataan uudelleen tarvittaessa)."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _add(self, command):
+        old = self.position.get(command)
+        if old is not None:
+            self.entries[old] = None
+        self.position[command] = len(self.entries)
+        self.entries.append(command)
+
+    def _compact(self):
+        """Poista None-paikat ja vanhimmat yli max_entries menevät."""
+        live = [cmd for cmd in self.entries if cmd is not None][-self.max_entries:]
+        self.entries = live
+        self.position = {cmd: i for i, cmd in enumerate(live)}
+        self.generation += 1
+        self._index_keys = []
+        self._index_pos = []
+        self._indexed = 0
+
+    def compact_file(self):
+        """Kirjoita tiedostoon vain muistissa olevat komennot (atominen vaihto)."""
+        if self.path is None:
+            return
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        self.close()  # Vanha kahva osoittaisi korvattuun tiedostoon
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for cmd in self:
+                    f.write(cmd + '\n')
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.error = e
+            return
+        self.file_lines = len(self)
+
+    def __len__(self):
+        return len(self.position)
+
+    def __iter__(self):
+        """Komennot vanhimmasta uusimpaan."""
+        self.load()
+        return (cmd for cmd in self.entries if cmd is not None)
+
+    def previous(self, pos=None):
+        """Uusin komento ennen paikkaa pos (None = lopusta): (paikka, komento) tai None."""
+        self.load()
+        i = len(self.entries) if pos is None else pos
+        while i > 0:
+            i -= 1
+            if self.entries[i] is not None:
+                return i, self.entries[i]
+        return None
+
+    def next(self, pos):
+        """Vanhin komento paikan pos jälkeen: (paikka, komento) tai None."""
+        i = pos + 1
+        while i < len(self.entries):
+            if self.entries[i] is not None:
+                return i, self.entries[i]
+            i += 1
+        return None
+
+    def needs_index(self):
+        """Onko indeksin ulkopuolella niin monta komentoa että se kannattaa rakentaa."""
+        return self.loaded and len(self.entries) - self._indexed > INDEX_PENDING_MAX
+
+    def set_index(self, index, count, generation):
+        """Ota build_indexin tulos käyttöön, ellei lista ole sillä välin tiivistetty.
+
+        Args:
+            index: build_indexin palauttama (avaimet, paikat)
+            count: Montako entries-alkiota kopiossa oli
+            generation: generation kun kopio otettiin
+        """
+        if generation != self.generation:
+            return False
+        self._index_keys, self._index_pos = index
+        self._indexed = count
+        return True
+
+    def index_range(self, query, lo=0, hi=None):
+        """Indeksin alue [lo, hi) jonka avaimet alkavat haulla.
+
+        Tarkentuvassa haussa anna edellisen haun alue: uusi alue on sen sisällä.
+        """
+        key = query[:INDEX_KEY_LEN]
+        if hi is None:
+            hi = len(self._index_keys)
+        start = bisect.bisect_left(self._index_keys, key, lo, hi)
+        end = bisect.bisect_left(self._index_keys, key + '\U0010ffff', start, hi)
+        return start, end
+
+    def search(self, query, before=None, span=None):
+        """Uusin komento jonka jokin sana alkaa haulla, paikkaa before vanhempi.
+
+        Args:
+            query: Haettava teksti
+            before: Hae tätä paikkaa vanhemmista (None = kaikista)
+            span: Saman tai lyhyemmän haun palauttama indeksialue (tarkentuva haku)
+
+        Returns:
+            (paikka, komento, alue) tai None; alue annetaan seuraavalle
+            tarkentuvalle haulle
+        """
+        self.load()
+        if not query:
+            return None
+        end = len(self.entries) if before is None else min(before, len(self.entries))
+
+        # Indeksoimattomat ovat uusimpia: käy ne läpi ensin
+        for pos in range(end - 1, self._indexed - 1, -1):
+            cmd = self.entries[pos]
+            if cmd is not None and matches_word_start(cmd, query):
+                return pos, cmd, span
+        end = min(end, self._indexed)
+
+        lo, hi = self.index_range(query, *(span or (0, None)))
+        if hi - lo > INDEX_SCAN_THRESHOLD:
+            # Yleinen haku: osuma on todennäköisesti lähellä uusinta
+            for pos in range(end - 1, -1, -1):
+                cmd = self.entries[pos]
+                if cmd is not None and matches_word_start(cmd, query):
+                    return pos, cmd, (lo, hi)
+            return None
+
+        best = -1
+        long_query = len(query) > INDEX_KEY_LEN
+        for i in range(lo, hi):
+            pos = self._index_pos[i]
+            if best < pos < end and self.entries[pos] is not None:
+                if not long_query or matches_word_start(self.entries[pos], query):
+                    best = pos
+        if best < 0:
+            return None
+        return best, self.entries[best], (lo, hi)
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+BatCLI lokihakemisto
+Kokotekstihaku kaikkiin sessiolokeihin (SQLite FTS5).
+
+Indeksi päivitetään inkrementaalisesti: jokaisesta lokitiedostosta
+muistetaan koko, muokkausaika ja kuinka pitkälle se on luettu, joten
+kasvanut tiedosto luetaan vain lopustaan ja muuttumattomat ohitetaan.
+Tiedostojen jäsennys hajautetaan prosessipooliin; SQLiteen kirjoittaa
+vain pääprosessi.
+
+Käyttö:
+    batcli-index                  # päivitä indeksi
+    batcli-index kobold kill      # päivitä ja hae
+    batcli-index --no-update -n 50 '"tells you"'
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# Indeksitiedoston nimi logs-kansiossa
+INDEX_FILENAME = ".batcli-index.sqlite3"
+
+# Lokitiedostojen nimimuoto (cmds/log.py ja start_auto_log): YYYYMMDDHHMM.log
+LOG_NAME_RE = re.compile(r'^(\d{12})\.log$')
+
+# Aloitusmerkintä jonka /log ja auto-log kirjoittavat session alkuun
+SESSION_START_RE = re.compile(
+    r'(?:Automaattinen loggaus|Loggaus) aloitettu: (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})')
+
+# Montako riviä lisätään kerralla (executemany)
+INSERT_BATCH = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    offset INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    last_ts TEXT
+);
+CREATE TABLE IF NOT EXISTS log_lines (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    lineno INTEGER NOT NULL,
+    ts TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS log_lines_pos ON log_lines (file_id, lineno);
+CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(
+    text, content='log_lines', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS log_lines_ai AFTER INSERT ON log_lines BEGIN
+    INSERT INTO log_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS log_lines_ad AFTER DELETE ON log_lines BEGIN
+    INSERT INTO log_fts (log_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+class LogIndexError(Exception):
+    """Indeksin käytössä tapahtunut virhe (esim. FTS5 puuttuu)."""
+
+
+def session_timestamp(path):
+    """Päättele session alkuaika tiedostonimestä (YYYYMMDDHHMM.log)."""
+    match = LOG_NAME_RE.match(os.path.basename(path))
+    if match:
+        try:
+            return datetime.strptime(match.group(1), "%Y%m%d%H%M").strftime(
+                "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    return None
+
+
+def parse_log_file(path, offset, lineno, last_ts):
+    """Jäsennä lokitiedosto kohdasta offset eteenpäin.
+
+    Ajetaan prosessipoolissa, joten funktio on moduulitasolla eikä koske
+    tietokantaan. Keskeneräistä viimeistä riviä (kirjoitus kesken) ei
+    lueta; se tulee mukaan seuraavalla päivityksellä.
+
+    Args:
+        path: Lokitiedoston polku
+        offset: Tavukohta josta luku jatkuu
+        lineno: Viimeisen jo indeksoidun rivin numero
+        last_ts: Viimeisin tunnettu aikaleima (session alku)
+
+    Returns:
+        (path, uusi_offset, viimeinen_rivinro, rivit [(rivinro, aikaleima, teksti)],
+        last_ts)
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+
+    end = data.rfind(b'\n')
+    if end < 0:
+        return path, offset, lineno, [], last_ts
+    data = data[:end + 1]
+
+    if last_ts is None:
+        last_ts = session_timestamp(path)
+
+    rows = []
+    for raw in data.split(b'\n')[:-1]:
+        lineno += 1
+        text = raw.decode('utf-8', errors='replace').rstrip('\r')
+        match = SESSION_START_RE.search(text)
+        if match:
+            # Session aloitusmerkintä: vain aikaleima talteen, ei hakuun
+            last_ts = match.group(1)
+            continue
+        if text.strip() and not text.startswith('====='):
+            rows.append((lineno, last_ts, text))
+
+    return path, offset + len(data), lineno, rows, last_ts
+
+
+class LogIndex:
+    """Sessiolokien FTS5-indeksi."""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        try:
+            self.conn.executescript(SCHEMA)
+        except sqlite3.OperationalError as e:
+            self.conn.close()
+            raise LogIndexError(f"SQLite ilman FTS5-tukea: {e}")
+
+    def close(self):
+        self.conn.close()
+
+    def pending_files(self, logs_dir):
+        """Palauta [(path, offset, lineno, last_ts, size, mtime)] päivitettävistä."""
+        known = {
+            path: (size, mtime, offset, lines, last_ts)
+            for path, size, mtime, offset, lines, last_ts in self.conn.execute(
+                "SELECT path, size, mtime, offset, lines, last_ts FROM log_files")
+        }
+        pending = []
+        for entry in sorted(Path(logs_dir).glob("*.log")):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            path = str(entry)
+            old = known.get(path)
+            if old is None:
+                pending.append((path, 0, 0, None, st.st_size, st.st_mtime))
+                continue
+            size, mtime, offset, lines, last_ts = old
+            if st.st_size == size and st.st_mtime == mtime:
+                continue
+            if st.st_size >= offset:
+                # Kasvanut tiedosto: jatketaan siitä mihin viimeksi jäätiin
+                pending.append((path, offset, lines, last_ts, st.st_size, st.st_mtime))
+            else:
+                # Lyhentynyt tai uudelleenkirjoitettu: indeksoidaan alusta
+                self.forget(path)
+                pending.append((path, 0, 0, None, st.st_size, st.st_mtime))
+        return pending
+
+    def forget(self, path):
+        """Poista tiedoston rivit indeksistä."""
+        row = self.conn.execute(
+            "SELECT id FROM log_files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return
+        file_id = row[0]
+        self.conn.execute("DELETE FROM log_lines WHERE file_id = ?", (file_id,))
+        self.conn.execute("DELETE FROM log_files WHERE id = ?", (file_id,))
+
+    def update(self, logs_dir, workers=None):
+        """Indeksoi uudet ja kasvaneet lokitiedostot.
+
+        Args:
+            logs_dir: Lokikansio
+            workers: Prosessipoolin koko (None = CPU-määrä, 1 = ei poolia)
+
+        Returns:
+            (tiedostoja, rivejä) jotka indeksoitiin
+        """
+        pending = self.pending_files(logs_dir)
+        if not pending:
+            return 0, 0
+
+        meta = {p[0]: p for p in pending}
+        jobs = [(p[0], p[1], p[2], p[3]) for p in pending]
+        if workers == 1 or len(jobs) == 1:
+            results = (parse_log_file(*job) for job in jobs)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(parse_log_file, *zip(*jobs), chunksize=4)
+
+        total_lines = 0
+        try:
+            with self.conn:
+                for path, new_offset, lineno, rows, last_ts in results:
+                    size, mtime = meta[path][4:6]
+                    self.conn.execute(
+                        "INSERT INTO log_files (path, size, mtime, offset, lines, last_ts) "
+                        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+                        "size = excluded.size, mtime = excluded.mtime, "
+                        "offset = excluded.offset, lines = excluded.lines, "
+                        "last_ts = excluded.last_ts",
+                        (path, size, mtime, new_offset, lineno, last_ts))
+                    file_id = self.conn.execute(
+                        "SELECT id FROM log_files WHERE path = ?", (path,)).fetchone()[0]
+                    self._insert_rows(file_id, rows)
+                    total_lines += len(rows)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return len(pending), total_lines
+
+    def _insert_rows(self, file_id, rows):
+        # FTS-indeksi päivittyy log_lines-taulun triggereillä
+        for start in range(0, len(rows), INSERT_BATCH):
+            self.conn.executemany(
+                "INSERT INTO log_lines (file_id, lineno, ts, text) VALUES (?, ?, ?, ?)",
+                [(file_id, lineno, ts, text)
+                 for lineno, ts, text in rows[start:start + INSERT_BATCH]])
+
+    def search(self, query, limit=20, context=2):
+        """Hae osumat relevanssijärjestyksessä (bm25).
+
+        Kelvoton FTS5-kysely (esim. pelkkä "-") haetaan uudelleen niin,
+        että jokainen sana on lainausmerkeissä.
+
+        Returns:
+            Lista dict-olioita: path, lineno, ts, text, context [(rivinro, teksti)]
+        """
+        sql = ("SELECT l.file_id, f.path, l.lineno, l.ts, l.text "
+               "FROM log_fts JOIN log_lines l ON l.id = log_fts.rowid "
+               "JOIN log_files f ON f.id = l.file_id "
+               "WHERE log_fts MATCH ? ORDER BY bm25(log_fts) LIMIT ?")
+        try:
+            rows = self.conn.execute(sql, (query, limit)).fetchall()
+        except sqlite3.OperationalError:
+            quoted = " ".join('"' + word.replace('"', '""') + '"'
+                              for word in query.split())
+            if not quoted:
+                return []
+            rows = self.conn.execute(sql, (quoted, limit)).fetchall()
+
+        hits = []
+        for file_id, path, lineno, ts, text in rows:
+            around = self.conn.execute(
+                "SELECT lineno, text FROM log_lines WHERE file_id = ? "
+                "AND lineno BETWEEN ? AND ? ORDER BY lineno",
+                (file_id, lineno - context, lineno + context)).fetchall()
+            hits.append({
+                "path": path, "lineno": lineno, "ts": ts, "text": text,
+                "context": around,
+            })
+        return hits
+
+    def stats(self):
+        """Palauta (tiedostoja, rivejä) indeksissä."""
+        files = self.conn.execute("SELECT COUNT(*) FROM log_files").fetchone()[0]
+        lines = self.conn.execute("SELECT COUNT(*) FROM log_lines").fetchone()[0]
+        return files, lines
+
+
+def default_logs_dir(env=None):
+    """Lokikansio samalla säännöllä kuin clientissa (LOG_DIR tai logs/)."""
+    log_dir = (env or {}).get('LOG_DIR', '')
+    if log_dir:
+        return Path(log_dir)
+    return Path(__file__).resolve().parent / "logs"
+
+
+def format_hit(hit):
+    """Muotoile osuma riveiksi: otsikko ja ympäröivät rivit."""
+    lines = [f"{hit['ts'] or '?'}  {os.path.basename(hit['path'])}:{hit['lineno']}"]
+    for lineno, text in hit["context"]:
+        marker = ">" if lineno == hit["lineno"] else " "
+        lines.append(f"  {marker} {text}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="batcli-index",
+        description="Indeksoi BatCLI:n sessiolokit ja hae niistä (SQLite FTS5).")
+    parser.add_argument("query", nargs="*", help="FTS5-hakulauseke")
+    parser.add_argument("--logs", help="Lokikansio (oletus: LOG_DIR tai logs/)")
+    parser.add_argument("--db", help=f"Indeksitiedosto (oletus: <logs>/{INDEX_FILENAME})")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Jäsentäviä prosesseja (oletus: CPU-määrä)")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Osumia enintään")
+    parser.add_argument("-C", "--context", type=int, default=2,
+                        help="Ympäröiviä rivejä osuman kummallakin puolella")
+    parser.add_argument("--no-update", action="store_true",
+                        help="Älä päivitä indeksiä ennen hakua")
+    args = parser.parse_args(argv)
+
+    if args.logs:
+        logs_dir = Path(args.logs)
+    else:
+        from batclient import load_env
+        logs_dir = default_logs_dir(load_env())
+    if not logs_dir.is_dir():
+        print(f"Lokikansiota ei löydy: {logs_dir}", file=sys.stderr)
+        return 1
+    db_path = Path(args.db) if args.db else logs_dir / INDEX_FILENAME
+
+    try:
+        index = LogIndex(db_path)
+    except LogIndexError as e:
+        print(f"Virhe: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        if not args.no_update:
+            start = time.monotonic()
+            files, lines = index.update(logs_dir, workers=args.workers)
+            if files:
+                print(f"Indeksoitu {lines} riviä {files} tiedostosta "
+                      f"({time.monotonic() - start:.2f} s)", file=sys.stderr)
+
+        if args.query:
+            start = time.monotonic()
+            hits = index.search(" ".join(args.query), args.limit, args.context)
+            elapsed = (time.monotonic() - start) * 1000
+            for hit in hits:
+                print("\n".join(format_hit(hit)))
+                print()
+            print(f"{len(hits)} osumaa ({elapsed:.1f} ms)", file=sys.stderr)
+        elif args.no_update:
+            files, lines = index.stats()
+            print(f"Indeksissä {lines} riviä {files} tiedostosta")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+BatCLI näppäinkartta
+Näppäinten nimet, oletussidonnat ja käyttäjän sidonnat tiedostosta.
+
+Näppäin on get_wch:n palauttama arvo: str (merkki, myös Ctrl-merkit) tai
+int (curses-erikoisnäppäin). Usean näppäimen sarja (M-x, C-x C-s, numero-
+näppäimistön ESC O x) on tuple. Kartta rakennetaan kerran käynnistyksessä,
+joten jokainen näppäinpainallus on yksi dict-haku.
+
+Sidontatiedosto (KEYMAP_FILE, oletus keys.conf projektikansiossa):
+
+    # näppäin = toiminto [argumentti]
+    F1 = send cast 'cure light wounds'
+    M-h = alias hh
+    KP8 = send north
+    C-x C-q = alias /quit
+"""
+
+import curses
+from collections import namedtuple
+from pathlib import Path
+
+# Sidontatiedoston oletusnimi projektikansiossa (KEYMAP_FILE vaihtaa)
+KEYMAP_FILENAME = "keys.conf"
+
+# Toiminnot ja kuvaukset. BatClient toteuttaa jokaisen metodina
+# key_<nimi> (viiva alaviivaksi), joka saa sidonnan argumentin.
+ACTIONS = {
+    "submit": "Suorita syöterivi",
+    "backspace": "Poista merkki kursorin vasemmalta",
+    "delete": "Poista merkki kursorin kohdalta",
+    "left": "Kursori vasemmalle",
+    "right": "Kursori oikealle",
+    "line-start": "Rivin alkuun",
+    "line-end": "Rivin loppuun",
+    "clear-line": "Tyhjennä rivi",
+    "kill-to-end": "Poista kursorista loppuun",
+    "history-prev": "Edellinen komento historiasta",
+    "history-next": "Seuraava komento historiasta",
+    "history-search": "Hae komentohistoriasta (Ctrl-R)",
+    "complete": "Täydennä sana",
+    "page-up": "Vieritä tulostetta ylös",
+    "page-down": "Vieritä tulostetta alas",
+    "scroll-top": "Vieritä alkuun",
+    "scroll-bottom": "Vieritä loppuun",
+    "search": "Hae tulostehistoriasta (Ctrl-F)",
+    "search-older": "Vanhempi hakuosuma",
+    "search-newer": "Uudempi hakuosuma",
+    "cancel": "Peruuta haku",
+    "send": "Lähetä argumentti palvelimelle sellaisenaan",
+    "alias": "Suorita argumentti kuin syöterivi (aliakset, /komennot)",
+    "ignore": "Ei mitään (poistaa oletussidonnan käytöstä)",
+}
+
+Binding = namedtuple("Binding", "action arg method")
+
+# Nimetyt näppäimet; nimellä voi olla useita vaihtoehtoja (Enter tulee
+# päätteestä riippuen \n, \r tai KEY_ENTER)
+NAMED_KEYS = {
+    "enter": ('\n', '\r', curses.KEY_ENTER),
+    "tab": ('\t',),
+    "esc": ('\x1b',),
+    "escape": ('\x1b',),
+    "space": (' ',),
+    "backspace": ('\x7f', '\x08', curses.KEY_BACKSPACE),
+    "delete": (curses.KEY_DC,),
+    "del": (curses.KEY_DC,),
+    "insert": (curses.KEY_IC,),
+    "ins": (curses.KEY_IC,),
+    "up": (curses.KEY_UP,),
+    "down": (curses.KEY_DOWN,),
+    "left": (curses.KEY_LEFT,),
+    "right": (curses.KEY_RIGHT,),
+    "pageup": (curses.KEY_PPAGE,),
+    "pgup": (curses.KEY_PPAGE,),
+    "pagedown": (curses.KEY_NPAGE,),
+    "pgdn": (curses.KEY_NPAGE,),
+    "home": (curses.KEY_HOME,),
+    "end": (curses.KEY_END,),
+}
+
+# Numeronäppäimistö sovellustilassa: ESC O <kirjain>. Kulmat ja keskikohta
+# curses tunnistaa terminfosta (KEY_A1 jne.), muut tulevat merkkijonona.
+_KEYPAD = {
+    "kp0": "p", "kp1": "q", "kp2": "r", "kp3": "s", "kp4": "t",
+    "kp5": "u", "kp6": "v", "kp7": "w", "kp8": "x", "kp9": "y",
+    "kp.": "n", "kp+": "k", "kp-": "m", "kp*": "j", "kp/": "o", "kpenter": "M",
+}
+_KEYPAD_CURSES = {
+    "kp7": curses.KEY_A1, "kp9": curses.KEY_A3, "kp5": curses.KEY_B2,
+    "kp1": curses.KEY_C1, "kp3": curses.KEY_C3, "kpenter": curses.KEY_ENTER,
+}
+for _name, _letter in _KEYPAD.items():
+    NAMED_KEYS[_name] = (('\x1b', 'O', _letter),) + (
+        (_KEYPAD_CURSES[_name],) if _name in _KEYPAD_CURSES else ())
+
+# Oletussidonnat (samat kuin ennen näppäinkarttaa)
+DEFAULT_KEYMAP = {
+    '\n': "submit", '\r': "submit", curses.KEY_ENTER: "submit",
+    '\x7f': "backspace", '\x08': "backspace", curses.KEY_BACKSPACE: "backspace",
+    curses.KEY_DC: "delete",
+    curses.KEY_LEFT: "left",
+    curses.KEY_RIGHT: "right",
+    curses.KEY_UP: "line-start",
+    curses.KEY_DOWN: "line-end",
+    '\t': "complete",
+    '\x10': "history-prev",  # Ctrl-P
+    '\x0e': "history-next",  # Ctrl-N
+    '\x12': "history-search",  # Ctrl-R
+    '\x01': "line-start",  # Ctrl-A
+    '\x05': "line-end",  # Ctrl-E
+    '\x15': "clear-line",  # Ctrl-U
+    '\x0b': "kill-to-end",  # Ctrl-K
+    curses.KEY_PPAGE: "page-up",
+    curses.KEY_NPAGE: "page-down",
+    curses.KEY_HOME: "scroll-top",
+    curses.KEY_END: "scroll-bottom",
+    '\x06': "search",  # Ctrl-F
+    curses.KEY_F3: "search-older",
+    curses.KEY_F15: "search-newer",  # Shift-F3
+    '\x1b': "cancel",
+}
+
+# curses-vakioiden nimet listausta varten (KEY_A1 jne.)
+_CURSES_NAMES = {getattr(curses, name): name for name in dir(curses)
+                 if name.startswith("KEY_") and isinstance(getattr(curses, name), int)}
+_DESCRIBE = {}
+for _name, _alternatives in NAMED_KEYS.items():
+    for _key in _alternatives:
+        _DESCRIBE.setdefault(_key, _name.upper() if _name.startswith("kp") else _name.capitalize())
+
+
+class KeymapError(Exception):
+    """Tuntematon näppäin tai toiminto."""
+
+
+def _parse_token(token):
+    """Yksi välilyönnein erotettu osa: lista vaihtoehtoisia näppäinjonoja (tupleja)."""
+    name = token.lower()
+    if len(token) == 1:
+        return [(token,)]
+    if name in NAMED_KEYS:
+        return [key if isinstance(key, tuple) else (key,) for key in NAMED_KEYS[name]]
+    for prefix in ("m-", "alt-"):
+        if name.startswith(prefix) and len(token) > len(prefix):
+            return [('\x1b',) + keys for keys in _parse_token(token[len(prefix):])]
+    for prefix in ("c-", "ctrl-", "^"):
+        if name.startswith(prefix) and len(token) == len(prefix) + 1:
+            code = ord(token[-1].upper())
+            if code == ord('?'):
+                return [('\x7f',)]
+            if 64 <= code < 96:
+                return [(chr(code & 0x1f),)]
+    if name[0] == "f" and name[1:].isdigit() and 1 <= int(name[1:]) <= 63:
+        return [(curses.KEY_F0 + int(name[1:]),)]
+    if name.startswith("key_"):
+        value = getattr(curses, token.upper(), None)
+        if isinstance(value, int):
+            return [(value,)]
+    if token.startswith("\\e"):
+        return [('\x1b',) + tuple(token[2:])]
+    raise KeymapError(f"Tuntematon näppäin: {token}")
+
+
+def parse_key(spec):
+    """Muunna näppäimen nimi ("F1", "C-x C-s", "M-h", "KP8") näppäimiksi.
+
+    Returns:
+        Lista vaihtoehtoja: yksittäinen näppäin tai tuple näppäinsarjasta
+    """
+    tokens = spec.split()
+    if not tokens:
+        raise KeymapError("Anna näppäin")
+    sequences = [()]
+    for token in tokens:
+        alternatives = _parse_token(token)
+        sequences = [seq + alt for seq in sequences for alt in alternatives]
+    return [seq[0] if len(seq) == 1 else seq for seq in sequences]
+
+
+def describe_key(key):
+    """Näppäimen nimi listaukseen (parse_keyn vastakohta)."""
+    if key in _DESCRIBE:
+        return _DESCRIBE[key]
+    if isinstance(key, tuple):
+        if len(key) == 2 and key[0] == '\x1b':
+            return "M-" + describe_key(key[1])
+        if key[0] == '\x1b' and not any(k in _DESCRIBE for k in key[1:]):
+            return "\\e" + "".join(str(k) for k in key[1:])
+        return " ".join(describe_key(k) for k in key)
+    if isinstance(key, int):
+        if curses.KEY_F0 < key <= curses.KEY_F0 + 63:
+            return f"F{key - curses.KEY_F0}"
+        return _CURSES_NAMES.get(key, str(key))
+    if len(key) == 1 and ord(key) < 32:
+        return "C-" + chr(ord(key) + 64).lower()
+    return key
+
+
+def parse_binding(line):
+    """Jäsennä "näppäin = toiminto [argumentti]".
+
+    Returns:
+        (näppäimet, toiminto, argumentti)
+    """
+    spec, sep, rest = line.partition("=")
+    if not sep:
+        raise KeymapError("Muoto: näppäin = toiminto [argumentti]")
+    action, _, arg = rest.strip().partition(" ")
+    return parse_key(spec), action.lower(), arg.strip()
+
+
+class Keymap:
+    """Näppäinkartta: {näppäin tai tuple: Binding} ja sarjojen alkuosat."""
+
+    def __init__(self):
+        self.bindings = {}
+        self.prefixes = set()  # Sarjojen alkuosat: näppäin tai tuple
+        self.user_keys = set()  # Käyttäjän sitomat (listaukseen)
+        for key, action in DEFAULT_KEYMAP.items():
+            self.bindings[key] = self._binding(action, "")
+
+    @staticmethod
+    def _binding(action, arg):
+        if action not in ACTIONS:
+            raise KeymapError(f"Tuntematon toiminto: {action}")
+        if action == "alias" and not arg:  # send saa olla tyhjä (pelkkä Enter)
+            raise KeymapError("alias tarvitsee suoritettavan rivin")
+        return Binding(action, arg, "key_" + action.replace("-", "_"))
+
+    def bind(self, keys, action, arg=""):
+        """Sido parse_keyn palauttamat näppäimet toimintoon."""
+        binding = self._binding(action, arg)
+        for key in keys:
+            self.bindings[key] = binding
+            self.user_keys.add(key)
+            self._add_prefixes(key)
+
+    def _add_prefixes(self, key):
+        if isinstance(key, tuple):
+            for i in range(1, len(key)):
+                self.prefixes.add(key[0] if i == 1 else key[:i])
+
+    def unbind(self, keys):
+        """Poista käyttäjän sidonta; oletussidonta palaa voimaan.
+
+        Returns:
+            Montako sidontaa poistettiin
+        """
+        removed = 0
+        for key in keys:
+            if key not in self.user_keys:
+                continue
+            self.user_keys.discard(key)
+            removed += 1
+            if key in DEFAULT_KEYMAP:
+                self.bindings[key] = self._binding(DEFAULT_KEYMAP[key], "")
+            else:
+                del self.bindings[key]
+        if removed:
+            self.prefixes = set()
+            for key in self.user_keys:
+                self._add_prefixes(key)
+        return removed
+
+    def is_bound(self, key):
+        """Onko näppäimellä sidonta tai aloittaako se sarjan."""
+        return key in self.bindings or key in self.prefixes
+
+    def load(self, path):
+        """Lue sidonnat tiedostosta. Puuttuva tiedosto ei ole virhe.
+
+        Returns:
+            Virheilmoitukset ("tiedosto:rivi: virhe"); virheelliset rivit ohitetaan
+        """
+        path = Path(path)
+        if not path.exists():
+            return []
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+        except OSError as e:
+            return [f"{path.name}: {e}"]
+        errors = []
+        for lineno, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                self.bind(*parse_binding(line))
+            except KeymapError as e:
+                errors.append(f"{path.name}:{lineno}: {e}")
+        return errors
+
+    def describe(self, key):
+        binding = self.bindings[key]
+        text = f"{binding.action} {binding.arg}".rstrip()
+        return f"{describe_key(key):<12} {text}"
@@ -0,0 +1,298 @@
+"""
+BatCLI automappari
+Huonegraafi kävellessä, tallennus SQLiteen ja lyhimmän polun reititys.
+
+Huoneet tunnistetaan otsikosta ja uloskäynneistä: liikkumiskomento
+merkitään odottamaan, seuraava ei-tyhjä rivi on huoneen otsikko ja
+uloskäyntirivi päättää huoneen. Edellisestä huoneesta tehdään kaari uuteen.
+
+Graafi ladataan muistiin alue kerrallaan vasta kun aluetta tarvitaan
+(nykyinen alue tai reitinhaku saapuu alueelle), joten käynnistys ei lue
+koko karttaa.
+"""
+
+import re
+import sqlite3
+from collections import deque
+from pathlib import Path
+
+# Kartan oletustiedosto projektikansiossa (MAP_DB vaihtaa)
+MAP_FILENAME = "map.sqlite3"
+
+DEFAULT_AREA = "default"
+
+# Liikkumiskomennot lyhyeen muotoon
+DIRECTIONS = {
+    "n": "n", "north": "n", "s": "s", "south": "s",
+    "e": "e", "east": "e", "w": "w", "west": "w",
+    "ne": "ne", "northeast": "ne", "nw": "nw", "northwest": "nw",
+    "se": "se", "southeast": "se", "sw": "sw", "southwest": "sw",
+    "u": "u", "up": "u", "d": "d", "down": "d",
+}
+
+# Uloskäyntirivi (ryhmä exits) ja epäonnistunut liike
+DEFAULT_EXITS_RE = (r'^\s*(?:Obvious exits? (?:are|is):?|Exits:|'
+                    r'You see (?:an )?exits? leading)\s*(?P<exits>.+?)\.?\s*$')
+DEFAULT_FAIL_RE = r"^(?:You can't go that way|Alas, you cannot go that way|You cannot go)"
+
+_EXIT_SPLIT_RE = re.compile(r'\s*(?:,|\band\b)\s*')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    id INTEGER PRIMARY KEY,
+    area TEXT NOT NULL,
+    title TEXT NOT NULL,
+    exits TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rooms_area_title ON rooms(area, title);
+CREATE TABLE IF NOT EXISTS edges (
+    from_id INTEGER NOT NULL,
+    dir TEXT NOT NULL,
+    to_id INTEGER NOT NULL,
+    area TEXT NOT NULL,
+    to_area TEXT NOT NULL,
+    PRIMARY KEY (from_id, dir)
+);
+CREATE INDEX IF NOT EXISTS edges_area ON edges(area);
+"""
+
+
+class MapError(Exception):
+    """Karttaa ei voi avata tai huonetta ei löydy."""
+
+
+def parse_exits(text):
+    """Muunna uloskäyntiteksti ("north, south and east") lyhyiksi suunniksi."""
+    exits = []
+    for word in _EXIT_SPLIT_RE.split(text.strip().lower()):
+        word = word.strip()
+        if word and word not in ("none", "no exits"):
+            exits.append(DIRECTIONS.get(word, word))
+    return ",".join(sorted(set(exits)))
+
+
+def compress_path(directions):
+    """Tiivistä suunnat speedwalk-muotoon: n n n e ne -> 3ne(ne)."""
+    parts = []
+    i = 0
+    while i < len(directions):
+        step = directions[i]
+        count = 1
+        while i + count < len(directions) and directions[i + count] == step:
+            count += 1
+        token = step if len(step) == 1 else f"({step})"
+        parts.append(f"{count}{token}" if count > 1 else token)
+        i += count
+    return "".join(parts)
+
+
+class RoomGraph:
+    """Huoneet ja kaaret SQLitessä, vierekkäisyys muistissa alueittain."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._db = None
+        self.adj = {}  # {huone: {suunta: (kohde, kohteen alue)}}
+        self.room_area = {}  # {huone: alue} ladatuilta alueilta
+        self.loaded_areas = set()
+
+    @property
+    def db(self):
+        """Avaa tietokanta ensimmäisellä käytöllä."""
+        if self._db is None:
+            try:
+                self._db = sqlite3.connect(str(self.path))
+                # Huone tallennetaan jokaisella askeleella tapahtumasilmukassa:
+                # WAL + synchronous=NORMAL ei odota fsynciä joka commitissa
+                # (kaatuessa voi hävitä vain viimeisimmät huoneet, ei tiedosto)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.executescript(SCHEMA)
+            except sqlite3.Error as e:
+                self._db = None
+                raise MapError(f"Karttaa ei voi avata: {e}") from e
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def load_area(self, area):
+        """Lataa alueen huoneet ja kaaret muistiin (kerran)."""
+        if area in self.loaded_areas:
+            return
+        for (room_id,) in self.db.execute("SELECT id FROM rooms WHERE area = ?", (area,)):
+            self.room_area[room_id] = area
+        for from_id, direction, to_id, to_area in self.db.execute(
+                "SELECT from_id, dir, to_id, to_area FROM edges WHERE area = ?", (area,)):
+            self.adj.setdefault(from_id, {})[direction] = (to_id, to_area)
+        self.loaded_areas.add(area)
+
+    def room(self, room_id):
+        """Palauta (id, alue, otsikko, uloskäynnit) tai None."""
+        return self.db.execute(
+            "SELECT id, area, title, exits FROM rooms WHERE id = ?", (room_id,)).fetchone()
+
+    def area_of(self, room_id):
+        area = self.room_area.get(room_id)
+        if area is None:
+            row = self.room(room_id)
+            area = row[1] if row else None
+        return area
+
+    def find_room(self, area, title, exits):
+        """Etsi alueelta huone jolla on sama otsikko ja uloskäynnit."""
+        row = self.db.execute(
+            "SELECT id FROM rooms WHERE area = ? AND title = ? AND exits = ? LIMIT 1",
+            (area, title, exits)).fetchone()
+        return row[0] if row else None
+
+    def add_room(self, area, title, exits):
+        with self.db:
+            cur = self.db.execute(
+                "INSERT INTO rooms (area, title, exits) VALUES (?, ?, ?)", (area, title, exits))
+        room_id = cur.lastrowid
+        self.room_area[room_id] = area
+        return room_id
+
+    def target(self, room_id, direction):
+        """Tunnetun kaaren kohde tai None."""
+        self.load_area(self.area_of(room_id))
+        edge = self.adj.get(room_id, {}).get(direction)
+        return edge[0] if edge else None
+
+    def link(self, from_id, direction, to_id):
+        """Tallenna kaari from_id --suunta--> to_id."""
+        area = self.area_of(from_id)
+        to_area = self.area_of(to_id)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO edges (from_id, dir, to_id, area, to_area) "
+                "VALUES (?, ?, ?, ?, ?)", (from_id, direction, to_id, area, to_area))
+        if area in self.loaded_areas:
+            self.adj.setdefault(from_id, {})[direction] = (to_id, to_area)
+
+    def search(self, text, limit=20):
+        """Huoneet joiden otsikossa on teksti: [(id, alue, otsikko, uloskäynnit)]."""
+        return self.db.execute(
+            "SELECT id, area, title, exits FROM rooms WHERE title LIKE ? "
+            "ORDER BY id LIMIT ?", (f"%{text}%", limit)).fetchall()
+
+    def shortest_path(self, start, goal):
+        """Lyhin reitti leveyshaulla (kaikki kaaret yhtä pitkiä).
+
+        Alueet ladataan sitä mukaa kuin haku saapuu niille.
+
+        Returns:
+            Suuntalista, tai None jos reittiä ei ole
+        """
+        if start == goal:
+            return []
+        self.load_area(self.area_of(start))
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            room = queue.popleft()
+            for direction, (to_id, to_area) in self.adj.get(room, {}).items():
+                if to_id in parents:
+                    continue
+                parents[to_id] = (room, direction)
+                if to_id == goal:
+                    return self._unwind(parents, goal)
+                if to_area not in self.loaded_areas:
+                    self.load_area(to_area)
+                queue.append(to_id)
+        return None
+
+    @staticmethod
+    def _unwind(parents, goal):
+        path = []
+        node = goal
+        while parents[node] is not None:
+            node, direction = parents[node]
+            path.append(direction)
+        path.reverse()
+        return path
+
+    def stats(self):
+        """(huoneita, kaaria) tietokannassa."""
+        rooms = self.db.execute("SELECT COUNT(*) FROM rooms").fetchone()[0]
+        edges = self.db.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+        return rooms, edges
+
+
+class Automapper:
+    """Tunnista huoneet palvelimen riveistä ja kasvata graafia.
+
+    on_command saa jokaisen lähtevän komennon ja on_line jokaisen ANSI-
+    koodeista puhdistetun rivin. Speedwalkin useat liikkeet jonotetaan ja
+    jokainen uloskäyntirivi kuittaa yhden.
+    """
+
+    def __init__(self, graph, exits_re=DEFAULT_EXITS_RE, fail_re=DEFAULT_FAIL_RE):
+        self.graph = graph
+        self.exits_re = re.compile(exits_re)
+        self.fail_re = re.compile(fail_re)
+        self.enabled = False
+        self.area = DEFAULT_AREA
+        self.current = None  # Nykyisen huoneen id
+        self.pending = deque()  # Lähetetyt liikkeet joiden huone ei ole tullut
+        self.capture_title = False
+        self.title = None
+
+    def on_command(self, command):
+        """Lähtevä komento: liike tai look odottaa huonetta."""
+        word = command.strip().lower()
+        direction = DIRECTIONS.get(word)
+        if direction is not None:
+            self.pending.append(direction)
+            self.capture_title = True
+        elif word in ("l", "look"):
+            self.capture_title = True
+
+    def on_line(self, line):
+        """Saapuva rivi (ilman ANSI-koodeja)."""
+        if self.pending and self.fail_re.search(line):
+            self.pending.popleft()
+            self.capture_title = bool(self.pending)
+            self.title = None
+            return
+
+        m = self.exits_re.search(line)
+        if m:
+            self._arrive(parse_exits(m.group("exits")))
+        elif self.capture_title and line.strip():
+            self.title = line.strip()
+            self.capture_title = False
+
+    def _arrive(self, exits):
+        move = self.pending.popleft() if self.pending else None
+        if self.title is None:
+            # Uloskäyntirivi ilman odotettua huonetta (esim. look toisaalle)
+            self.capture_title = bool(self.pending)
+            return
+
+        room = None
+        if move is not None and self.current is not None:
+            room = self.graph.target(self.current, move)
+        if room is None:
+            room = (self.graph.find_room(self.area, self.title, exits)
+                    or self.graph.add_room(self.area, self.title, exits))
+        if move is not None and self.current is not None:
+            self.graph.link(self.current, move, room)
+
+        self.current = room
+        self.title = None
+        self.capture_title = bool(self.pending)
+
+    def set_area(self, area):
+        """Vaihda aluetta johon uudet huoneet tallennetaan."""
+        self.area = area
+        self.graph.load_area(area)
+
+    def reset(self):
+        """Unohda odottavat liikkeet (esim. uuden yhteyden alussa)."""
+        self.pending.clear()
+        self.capture_title = False
+        self.title = None
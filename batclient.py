@@ -4,15 +4,35 @@ BatMUD Terminal Client
 Yksinkertainen telnet-client BatMUD-peliin (bat.org:23)
 """
 
+import argparse
 import asyncio
+import bisect
 import curses
+import errno
+import heapq
+import itertools
+import logging
 import sys
 import re
 import os
+import select
+import socket
+import sqlite3
+import stat
+import threading
+import time
+import types
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 import cmds
+from batcli_history import HISTORY_FILENAME, HISTORY_MAX, CommandHistory, build_index
+from batcli_keys import KEYMAP_FILENAME, Keymap
+from batcli_map import (
+    DEFAULT_EXITS_RE, DEFAULT_FAIL_RE, MAP_FILENAME, Automapper, MapError, RoomGraph,
+)
 
 # BatMUD palvelimen tiedot
 HOST = "bat.org"
@@ -31,6 +51,7 @@ DO = 253
 DONT = 254
 TELOPT_EOR = 25  # End of Record option
 TELOPT_ECHO = 1  # Echo option
+TELOPT_TM = 6  # Timing Mark (RTT-koetin)
 
 # Kuinka pitkän keskeneräisen IAC-sekvenssin puskuroimme pakettirajan yli.
 # Tätä pidempi ei ole kelvollista telnet-dataa, joten se tulkitaan tekstiksi.
@@ -126,6 +147,14 @@ def load_env():
 
     return env_vars
 
+
+def env_float(env, key, default):
+    """Lue .env-asetus lukuna; puuttuva tai virheellinen arvo antaa oletuksen."""
+    try:
+        return float(env.get(key, '').strip() or default)
+    except ValueError:
+        return default
+
 def _to_curses_rgb(value):
     """Muunna 0-255 RGB-arvo curses-asteikolle 0-1000."""
     return max(0, min(1000, round(value * 1000 / 255)))
@@ -172,6 +201,1950 @@ THEMES = {
 }
 
 
+# Näytteistävän profiloijan oletustaajuus (näytettä sekunnissa)
+PROFILE_DEFAULT_HZ = 100
+PROFILE_MAX_HZ = 1000
+
+
+class SamplingProfiler:
+    """Näytteistävä profiloija: lukee kohdesäikeen pinon taustasäikeestä.
+
+    Toisin kuin cProfile, tämä ei koukuta jokaista funktiokutsua, joten
+    mitattavan koodin ajoitus ei juuri muutu. Taustasäie herää `hz` kertaa
+    sekunnissa, lukee pinon sys._current_frames():lla ja laskee montako
+    kertaa kukin pino nähtiin. Tulos kirjoitetaan collapsed-stack-muodossa
+    ("a;b;c 42"), jota flamegraph-työkalut lukevat suoraan.
+    """
+
+    def __init__(self, target_ident=None, hz=PROFILE_DEFAULT_HZ):
+        self.target_ident = target_ident or threading.main_thread().ident
+        self.hz = max(1, min(PROFILE_MAX_HZ, int(hz)))
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._counts = {}  # {(code, code, ...): kpl} juuresta lehteen
+        self._labels = {}  # code -> "tiedosto:funktio" (muotoillaan kerran)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Käynnistä näytteistys taustasäikeessä."""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self.started_at = time.monotonic()
+        self.stopped_at = None
+        self._thread = threading.Thread(
+            target=self._run, name="batcli-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Pysäytä näytteistys ja odota että säie loppuu."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.started_at is not None and self.stopped_at is None:
+            self.stopped_at = time.monotonic()
+
+    def _run(self):
+        interval = 1.0 / self.hz
+        while not self._stop_event.wait(interval):
+            self.sample_once()
+
+    def sample_once(self):
+        """Ota yksi näyte kohdesäikeen pinosta."""
+        frame = sys._current_frames().get(self.target_ident)
+        if frame is None:
+            return
+        # Kerätään koodioliot eikä merkkijonoja: näytteenotto pysyy halpana
+        # ja nimet muotoillaan vasta tulostettaessa
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        key = tuple(reversed(stack))
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.samples += 1
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    def collapsed(self):
+        """Palauta pinot collapsed-muodossa, yleisin ensin."""
+        merged = {}
+        for key, count in list(self._counts.items()):
+            stack = ";".join(self._label(code) for code in key)
+            merged[stack] = merged.get(stack, 0) + count
+        return [f"{stack} {count}" for stack, count
+                in sorted(merged.items(), key=lambda item: -item[1])]
+
+    def top_functions(self, limit=10):
+        """Palauta [(funktio, näytteet)] pinon lehtifunktioista, yleisin ensin."""
+        leaves = {}
+        for key, count in list(self._counts.items()):
+            if key:
+                label = self._label(key[-1])
+                leaves[label] = leaves.get(label, 0) + count
+        return sorted(leaves.items(), key=lambda item: -item[1])[:limit]
+
+    def write_collapsed(self, path):
+        """Kirjoita collapsed-stack-tiedosto flamegraph-työkaluille."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
+
+
+# Latenssihistogrammien lokerorajat sekunteina (Prometheus-tyylinen "le").
+# 0.1 ms - 5 s kattaa sekä yksittäisen rivin käsittelyn että pahat jumit.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+class Histogram:
+    """Kiinteälokeroinen latenssihistogrammi.
+
+    Muisti ei kasva näytteiden mukana: jokainen havainto kasvattaa vain
+    yhden lokeron laskuria. Persentiilit interpoloidaan lokeron sisällä.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)  # viimeinen = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Kirjaa yksi havainto (sekunteina)."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Palauta arvioitu p:s persentiili (0-100) sekunteina."""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                if upper <= lower:
+                    return upper
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def summary(self):
+        """Lyhyt yhteenveto millisekunteina näytölle."""
+        return (f"n={self.count} p50={self.percentile(50) * 1000:.1f} "
+                f"p95={self.percentile(95) * 1000:.1f} "
+                f"p99={self.percentile(99) * 1000:.1f} "
+                f"max={self.max * 1000:.1f} ms")
+
+
+# Tapahtumasilmukan viivevahti: herätysväli ja raja jonka ylittävä viive
+# kirjataan piikiksi. get_wch() odottaa jo itsessään 100 ms (halfdelay),
+# joten raja on tätä selvästi suurempi.
+LAG_INTERVAL = 0.05
+LAG_SPIKE_THRESHOLD = 0.25
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Kerää asyncion debug-tilan hitaiden callbackien ilmoitukset talteen.
+
+    Ilman tätä asyncio kirjoittaisi ne stderriin curses-näytön päälle.
+    """
+
+    def __init__(self, monitor):
+        super().__init__(logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record):
+        try:
+            self.monitor.slow_callbacks.append((time.time(), record.getMessage()))
+        except Exception:
+            pass
+
+
+class LagMonitor:
+    """Mittaa tapahtumasilmukan ajoitusviivettä ja kohdistaa piikit syylliseen.
+
+    Vahti nukkuu LAG_INTERVAL kerrallaan; jos herätys myöhästyy, joku
+    callback on pitänyt silmukkaa varattuna. Tunnetut raskaat toimet
+    (client-komennot, ikkunan koon muutos, get_wch, lokin kirjoitus)
+    merkitään activity()-kontekstilla, jolloin piikki osataan nimetä.
+    """
+
+    def __init__(self, interval=LAG_INTERVAL, threshold=LAG_SPIKE_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.histogram = Histogram()
+        self.spikes = deque(maxlen=50)  # (aika, viive s, syy)
+        self.slow_callbacks = deque(maxlen=50)  # (aika, asyncion viesti)
+        self._activities = deque(maxlen=64)  # (nimi, alku, loppu)
+        self._log_handler = None
+
+    @contextmanager
+    def activity(self, label):
+        """Merkitse mahdollisesti silmukkaa jumittava toiminto."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._activities.append((label, start, time.monotonic()))
+
+    @types.coroutine
+    def timed(self, label, coro):
+        """Aja coroutine ja merkitse toiminnoksi vain sen synkroniset pätkät.
+
+        Await-odotus (esim. /connectin verkkoyhteys) ei varaa silmukkaa,
+        joten sitä ei lasketa toiminnon kestoon: muuten odottava komento
+        saisi syyn muiden aiheuttamista piikeistä.
+        """
+        steps = coro.__await__()
+        send, value = steps.send, None
+        while True:
+            try:
+                with self.activity(label):
+                    signal = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                value = yield signal
+                send = steps.send
+            except GeneratorExit:
+                steps.close()
+                raise
+            except BaseException as e:  # esim. CancelledError välitetään sisään
+                send, value = steps.throw, e
+
+    def blame(self, since):
+        """Palauta pisimpään kestänyt toiminto joka päättyi ajan since jälkeen."""
+        worst = None
+        worst_duration = 0.0
+        for label, start, end in self._activities:
+            if end >= since and end - start > worst_duration:
+                worst, worst_duration = label, end - start
+        return worst
+
+    def record(self, expected, actual):
+        """Kirjaa yksi herätys. Palauttaa (viive, syy) jos kyse oli piikistä."""
+        lag = max(0.0, actual - expected)
+        self.histogram.observe(lag)
+        spike = None
+        if lag >= self.threshold:
+            cause = self.blame(expected - self.interval) or "tuntematon"
+            spike = (lag, cause)
+            self.spikes.append((time.time(), lag, cause))
+        self._activities.clear()
+        return spike
+
+    async def run(self, on_spike=None):
+        """Vahtisilmukka; on_spike(viive, syy) kutsutaan piikin sattuessa."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                spike = self.record(expected, loop.time())
+                if spike and on_spike:
+                    on_spike(*spike)
+        except asyncio.CancelledError:
+            pass
+
+    def set_slow_callback_reporting(self, enabled, loop=None):
+        """Kytke asyncion hitaiden callbackien raportointi (debug-tila)."""
+        loop = loop or asyncio.get_running_loop()
+        logger = logging.getLogger("asyncio")
+        if enabled:
+            if self._log_handler is None:
+                self._log_handler = _SlowCallbackHandler(self)
+                logger.addHandler(self._log_handler)
+                logger.propagate = False
+            loop.slow_callback_duration = self.threshold
+            loop.set_debug(True)
+        else:
+            loop.set_debug(False)
+            if self._log_handler is not None:
+                logger.removeHandler(self._log_handler)
+                logger.propagate = True
+                self._log_handler = None
+
+    @property
+    def slow_callback_reporting(self):
+        return self._log_handler is not None
+
+
+# Yhteyden koetin: väli (s, 0 = pois), vastauksen odotus (s) ja montako
+# vastaamatonta koetinta peräkkäin tulkitaan katkenneeksi yhteydeksi
+PING_INTERVAL = 0.0
+PING_TIMEOUT = 5.0
+PING_MAX_MISSES = 2
+RTT_ALPHA = 0.125  # Liukuvan keskiarvon paino (kuten TCP:n SRTT)
+RTT_SAMPLES = 100  # p95 lasketaan näin monesta viimeisestä mittauksesta
+
+
+class LinkProbe:
+    """Palvelimen kiertoviive (RTT) ja yhteyden terveys.
+
+    Koetin on telnetin IAC DO TIMING-MARK, johon palvelin vastaa WILL tai
+    WONT, tai PING_COMMAND jolloin vastaukseksi lasketaan ensimmäinen data.
+    Jos palvelin on vastannut koettimeen tällä yhteydellä mutta max_misses
+    koetinta peräkkäin jää ilman mitään dataa, yhteys on puoliavoin.
+    """
+
+    def __init__(self, interval=PING_INTERVAL, command="", timeout=PING_TIMEOUT,
+                 max_misses=PING_MAX_MISSES, alpha=RTT_ALPHA):
+        self.interval = interval
+        self.command = command
+        self.timeout = timeout
+        self.max_misses = max_misses
+        self.alpha = alpha
+        self.ewma = None  # Sekunteina
+        self.samples = deque(maxlen=RTT_SAMPLES)
+        self.misses = 0
+        self.answered = False  # Onko palvelin vastannut tällä yhteydellä
+        self.sent = 0
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    @property
+    def payload(self):
+        """Lähetettävät tavut."""
+        if self.command:
+            return (self.command + "\n").encode('iso-8859-1')
+        return bytes([IAC, DO, TELOPT_TM])
+
+    def observe(self, rtt):
+        """Kirjaa vastaus koettimeen."""
+        self.samples.append(rtt)
+        self.ewma = rtt if self.ewma is None else self.ewma + self.alpha * (rtt - self.ewma)
+        self.misses = 0
+        self.answered = True
+
+    def miss(self, data_seen):
+        """Koetin jäi vastaamatta. Palauttaa True jos yhteys on todennäköisesti poikki.
+
+        Muu saapunut data todistaa yhteyden eläväksi, joten se ei ole ohi.
+        """
+        if data_seen:
+            self.misses = 0
+            return False
+        self.misses += 1
+        return self.answered and self.misses >= self.max_misses
+
+    def p95(self):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[-(-len(ordered) * 95 // 100) - 1]  # Lähin sijoitus: ceil(0.95 n)
+
+    def new_connection(self):
+        """Uusi yhteys: vastaamattomat ja vastaustieto nollataan, RTT-historia jää."""
+        self.misses = 0
+        self.answered = False
+
+    def status(self):
+        """Lyhyt muoto statusriville, esim. "RTT 42/80ms"."""
+        if self.ewma is None:
+            return ""
+        return f"RTT {self.ewma * 1000:.0f}/{self.p95() * 1000:.0f}ms"
+
+
+# Latenssin mittauspisteet: nimi -> kuvaus näytölle ja vientitiedostoon
+TRACE_SPANS = (
+    ("server", "socket -> näyttö (reader.read -> doupdate)"),
+    ("process", "process_server_text"),
+    ("render", "refresh_output"),
+    ("input", "Enter -> writer.drain"),
+)
+
+
+class LatencyTracer:
+    """Valinnainen päästä päähän -latenssin mittaus.
+
+    Mittauspisteet ottavat aikaleiman vain kun mittaus on päällä, joten
+    pois päältä ollessaan hinta on yksi attribuuttivertailu. Kestot
+    kootaan Histogram-olioihin, joista saadaan p50/p95/p99.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {name: Histogram() for name, _desc in TRACE_SPANS}
+        self._marks = {}  # Kesken olevat mittaukset: {nimi: alkuaika}
+
+    def start(self):
+        """Palauta aloitusaika, tai None kun mittaus ei ole päällä."""
+        return time.monotonic() if self.enabled else None
+
+    def record(self, span, started):
+        """Kirjaa kesto started-ajasta tähän hetkeen (None = ohita)."""
+        if started is not None:
+            self.histograms[span].observe(time.monotonic() - started)
+
+    def mark(self, span):
+        """Aloita mittaus joka päätetään myöhemmin finish():llä toisaalla."""
+        if self.enabled:
+            self._marks[span] = time.monotonic()
+
+    def finish(self, span):
+        """Päätä mark():lla aloitettu mittaus (ei mitään jos sitä ei ole)."""
+        self.record(span, self._marks.pop(span, None))
+
+    def cancel(self, span):
+        """Hylkää kesken jäänyt mittaus."""
+        self._marks.pop(span, None)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self._marks.clear()
+
+    def report_lines(self):
+        """Palauta taulukko riveinä: mittauspiste ja persentiilit (ms)."""
+        lines = [f"{'mittauspiste':<10} {'n':>7} {'p50':>8} {'p95':>8} "
+                 f"{'p99':>8} {'max':>8}  (ms)"]
+        for name, desc in TRACE_SPANS:
+            h = self.histograms[name]
+            lines.append(
+                f"{name:<10} {h.count:>7} {h.percentile(50) * 1000:>8.2f} "
+                f"{h.percentile(95) * 1000:>8.2f} {h.percentile(99) * 1000:>8.2f} "
+                f"{h.max * 1000:>8.2f}  {desc}")
+        return lines
+
+    def export(self, path):
+        """Kirjoita yhteenveto ja lokerojakaumat tekstitiedostoon."""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"# BatCLI {VERSION} latenssiraportti "
+                    f"{time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            for line in self.report_lines():
+                f.write(line + "\n")
+            f.write("\n# lokerot: mittauspiste le_ms kpl\n")
+            for name, _desc in TRACE_SPANS:
+                h = self.histograms[name]
+                bounds = [f"{b * 1000:g}" for b in h.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, h.counts):
+                    f.write(f"{name} {bound} {count}\n")
+
+
+def _prometheus_histogram(lines, name, help_text, histogram):
+    """Lisää Histogram Prometheuksen tekstimuodossa (kumulatiiviset lokerot)."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum {histogram.sum:.6f}")
+    lines.append(f"{name}_count {histogram.count}")
+
+
+class MetricsServer:
+    """Paikallinen Prometheus-mittaripalvelin (HTTP localhost / Unix-socket).
+
+    Palvelin pyörii samassa asyncio-silmukassa kuin client: jokainen
+    kysely on lyhyt coroutine joka lukee pyynnön, muotoilee mittarit ja
+    sulkee yhteyden, joten syötteen käsittely ei jää odottamaan.
+    """
+
+    def __init__(self, client, port=None, path=None):
+        self.client = client
+        self.port = port
+        self.path = path
+        self.servers = []
+        self._last_scrape = None  # (aika, tavut, rivit) nopeuksien laskuun
+        self._socket_id = None  # (st_dev, st_ino) itse luodulle socketille
+
+    async def start(self):
+        """Avaa määritellyt kuuntelijat.
+
+        Raises:
+            OSError: jos portti tai socket on varattu, tai polussa on jotain
+                muuta kuin socket
+        """
+        if self.port is not None:
+            self.servers.append(await asyncio.start_server(
+                self.handle_request, "127.0.0.1", self.port))
+        if self.path:
+            self.remove_stale_socket()
+            self.servers.append(await asyncio.start_unix_server(
+                self.handle_request, self.path))
+            st = os.lstat(self.path)
+            self._socket_id = (st.st_dev, st.st_ino)
+
+    def remove_stale_socket(self):
+        """Poista edellisen ajon jättämä socket polusta.
+
+        Tavallista tiedostoa (esim. väärin kirjoitettu METRICS_SOCKET joka
+        osoittaa lokiin) tai toisen käynnissä olevan instanssin socketia ei
+        poisteta.
+
+        Raises:
+            OSError: jos polku ei ole socket tai sitä kuunnellaan yhä
+        """
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError(errno.EEXIST, f"{self.path} on olemassa eikä ole socket")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        probe.settimeout(1.0)
+        try:
+            probe.connect(self.path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self.path)  # Edellisen ajon jäänne
+            return
+        finally:
+            probe.close()
+        raise OSError(errno.EADDRINUSE, f"{self.path}: toinen instanssi kuuntelee jo")
+
+    def addresses(self):
+        """Palauta kuunneltavat osoitteet näytettäväksi."""
+        result = []
+        for server in self.servers:
+            for sock in server.sockets:
+                name = sock.getsockname()
+                if isinstance(name, tuple):
+                    result.append(f"http://{name[0]}:{name[1]}/metrics")
+                else:
+                    result.append(f"unix:{name}")
+        return result
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+            try:
+                await server.wait_closed()
+            except Exception:
+                pass
+        self.servers = []
+        if self._socket_id is not None:
+            # Poista vain oma socket, ei sen tilalle myöhemmin tullutta
+            try:
+                st = os.lstat(self.path)
+                if stat.S_ISSOCK(st.st_mode) and (st.st_dev, st.st_ino) == self._socket_id:
+                    os.unlink(self.path)
+            except OSError:
+                pass
+            self._socket_id = None
+
+    async def handle_request(self, reader, writer):
+        """Vastaa yhteen HTTP-pyyntöön (GET /metrics tai /)."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5.0)
+            request_line = head.split(b"\r\n", 1)[0].decode("latin-1").split()
+            target = request_line[1] if len(request_line) > 1 else "/"
+            if target.split("?", 1)[0] in ("/", "/metrics"):
+                status = "200 OK"
+                body = self.render()
+            else:
+                status = "404 Not Found"
+                body = "not found\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def render(self):
+        """Muotoile clientin tila Prometheuksen tekstimuotoon."""
+        c = self.client
+        now = time.monotonic()
+        if self._last_scrape is None:
+            elapsed = max(now - c.started_at, 1e-6)
+            bytes_rate = c.bytes_received / elapsed
+            lines_rate = c.lines_received / elapsed
+        else:
+            last_time, last_bytes, last_lines = self._last_scrape
+            elapsed = max(now - last_time, 1e-6)
+            bytes_rate = (c.bytes_received - last_bytes) / elapsed
+            lines_rate = (c.lines_received - last_lines) / elapsed
+        self._last_scrape = (now, c.bytes_received, c.lines_received)
+
+        connected = c.reader is not None and c.writer is not None
+        lines = [
+            "# HELP batcli_info Client version",
+            "# TYPE batcli_info gauge",
+            f'batcli_info{{version="{VERSION}"}} 1',
+            "# HELP batcli_connected 1 when connected to the server",
+            "# TYPE batcli_connected gauge",
+            f"batcli_connected {int(connected)}",
+            "# HELP batcli_reconnecting 1 while auto-reconnect is running",
+            "# TYPE batcli_reconnecting gauge",
+            f"batcli_reconnecting {int(bool(c.reconnecting))}",
+            "# HELP batcli_reconnect_attempt Current auto-reconnect attempt",
+            "# TYPE batcli_reconnect_attempt gauge",
+            f"batcli_reconnect_attempt {c.reconnect_attempt}",
+            "# HELP batcli_bytes_received_total Bytes received from the server",
+            "# TYPE batcli_bytes_received_total counter",
+            f"batcli_bytes_received_total {c.bytes_received}",
+            "# HELP batcli_lines_received_total Lines received from the server",
+            "# TYPE batcli_lines_received_total counter",
+            f"batcli_lines_received_total {c.lines_received}",
+            "# HELP batcli_bytes_per_second Receive rate since the previous scrape",
+            "# TYPE batcli_bytes_per_second gauge",
+            f"batcli_bytes_per_second {bytes_rate:.3f}",
+            "# HELP batcli_lines_per_second Line rate since the previous scrape",
+            "# TYPE batcli_lines_per_second gauge",
+            f"batcli_lines_per_second {lines_rate:.3f}",
+            "# HELP batcli_rtt_seconds Smoothed round-trip time to the server (0 = not measured)",
+            "# TYPE batcli_rtt_seconds gauge",
+            f"batcli_rtt_seconds {c.link_probe.ewma or 0.0:.6f}",
+            "# HELP batcli_scrollback_lines Lines held in the scrollback buffer",
+            "# TYPE batcli_scrollback_lines gauge",
+            f"batcli_scrollback_lines {len(c.output_lines)}",
+            "# HELP batcli_logging 1 while the session is logged to a file",
+            "# TYPE batcli_logging gauge",
+            f"batcli_logging {int(bool(c.log_file))}",
+        ]
+        _prometheus_histogram(lines, "batcli_process_seconds",
+                              "process_server_text duration",
+                              c.tracer.histograms["process"])
+        _prometheus_histogram(lines, "batcli_render_seconds",
+                              "refresh_output duration",
+                              c.tracer.histograms["render"])
+        _prometheus_histogram(lines, "batcli_server_latency_seconds",
+                              "Socket receive to screen update",
+                              c.tracer.histograms["server"])
+        _prometheus_histogram(lines, "batcli_loop_lag_seconds",
+                              "Event loop scheduling lag",
+                              c.lag_monitor.histogram)
+        return "\n".join(lines) + "\n"
+
+
+# Montako riviä vierityspuskurin haku käy läpi ennen kuin antaa vuoron
+# muille tehtäville (syöte ja palvelimen data eivät jää odottamaan)
+SEARCH_CHUNK_LINES = 500
+
+
+class ScrollbackSearch:
+    """Yhden vierityspuskurihaun tila.
+
+    Osumat tallennetaan absoluuttisina rivinumeroina (kuinka mones rivi
+    output_linesiin on lisätty), jotta ne pysyvät oikeina vaikka uusia
+    rivejä tulee ja vanhimmat putoavat puskurista pois.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.matches = []  # Absoluuttiset rivinumerot, uusin ensin
+        self.position = -1  # Indeksi matchesiin (-1 = ei vielä hypätty)
+        self.done = False
+
+
+class AhoCorasick:
+    """Aho-Corasick-automaatti: kaikki literaalit yhdellä läpikäynnillä.
+
+    Rivin läpikäynnin hinta riippuu rivin pituudesta, ei literaalien
+    määrästä, joten sadat literaalitriggerit maksavat saman kuin yksi.
+    """
+
+    def __init__(self):
+        self._goto = [{}]  # tila -> {merkki: seuraava tila}
+        self._fail = [0]
+        self._out = [()]  # tila -> arvot joiden literaali päättyy tähän
+        self._built = True
+
+    def add(self, word, value):
+        """Lisää literaali; value palautetaan kun literaali löytyy."""
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state] = self._out[state] + (value,)
+        self._built = False
+
+    def build(self):
+        """Laske fail-linkit leveyshaulla (kutsutaan lisäysten jälkeen)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        for state in queue:
+            fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+        self._built = True
+
+    def search(self, text):
+        """Palauta lista arvoista joiden literaali esiintyy tekstissä (kukin kerran)."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = []
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for value in out[state]:
+                    if value not in found:
+                        found.append(value)
+        return found
+
+
+# Takaviittaukset (\1, (?P=nimi)), nimetyt ryhmät (sama nimi kahdessa
+# triggerissä on virhe) ja globaalit liput ((?i) alussa) eivät toimi
+# yhdistetyn lausekkeen sisällä, joten sellaiset triggerit ajetaan erikseen
+_UNCOMBINABLE_RE = re.compile(r'\\[1-9]|\(\?P[=<]|^\(\?[aiLmsux]+\)')
+
+
+class Trigger:
+    """Yksi triggeri: kuvio (literaali tai regex) ja toiminto."""
+
+    def __init__(self, trigger_id, pattern, action, is_regex=False):
+        self.id = trigger_id
+        self.pattern = pattern
+        self.action = action
+        self.is_regex = is_regex
+        self.regex = re.compile(pattern) if is_regex else None
+        self.steps = None  # Monirivisen triggerin askeleet
+        self.cooldown = None  # Oma jäähdytysaika (s), None = oletus
+        self.stream_pattern = None  # StreamPattern jos triggeri on monirivinen
+        self.hits = 0
+        self.action_time = 0.0  # Toimintojen yhteenlaskettu kesto (s)
+
+    def expand_action(self, match):
+        """Korvaa toiminnon $0-$9 osuman ryhmillä ($0 = koko osuma)."""
+        if '$' not in self.action:
+            return self.action
+        if match is None:
+            return self.action.replace('$0', self.pattern)
+
+        def group(m):
+            try:
+                return match.group(int(m.group(1))) or ""
+            except IndexError:
+                return m.group(0)
+        return re.sub(r'\$(\d)', group, self.action)
+
+
+class TriggerEngine:
+    """Triggerit yhdellä läpikäynnillä per rivi.
+
+    Literaalit kootaan Aho-Corasick-automaatiksi, joten rivi käydään läpi
+    kerran riippumatta literaalien määrästä. Säännölliset lausekkeet
+    yhdistetään yhdeksi vaihtoehtolausekkeeksi, jossa kukin on nimetyssä
+    ryhmässä (t0, t1, ...): osuman lastgroup kertoo triggerin, ja vain sen
+    oma lauseke ajetaan uudelleen ryhmiä ($1...) varten. Haku jatkuu
+    seuraavasta kohdasta, ja samasta kohdasta alkavat myöhemmät vaihtoehdot
+    haetaan loppuosalausekkeella, joten päällekkäin osuvat triggerit
+    laukeavat kaikki.
+    """
+
+    rule_class = Trigger
+
+    def __init__(self):
+        self.triggers = {}  # {id: Trigger}
+        self.next_id = 1
+        self.lines_scanned = 0
+        self.scan_histogram = Histogram()
+        self._dirty = True
+        self._literals = None
+        self._combined = None
+        self._combinable = []  # Yhdistettyyn lausekkeeseen kuuluvat triggerit
+        self._tails = {}  # {i: vaihtoehdot i+1... yhdistettynä}, tarpeen mukaan
+        self._separate = []  # Regex-triggerit joita ei voi yhdistää
+
+    def add(self, pattern, action, is_regex=False):
+        """Lisää triggeri.
+
+        Raises:
+            re.error: jos regex on virheellinen
+        """
+        trigger = self.rule_class(self.next_id, pattern, action, is_regex)
+        self.triggers[trigger.id] = trigger
+        self.next_id += 1
+        self.compile()  # Heti, ettei kokoaminen epäonnistu vasta rivejä sovittaessa
+        return trigger
+
+    def add_multiline(self, steps, action):
+        """Rekisteröi monirivinen triggeri listaukseen ja tilastoihin.
+
+        Itse sovitus tapahtuu StreamMatcherissa; yhdistettyyn riviläpikäyntiin
+        monirivisiä ei oteta mukaan.
+
+        Raises:
+            re.error: jos jokin askel on virheellinen
+        """
+        for step in steps:
+            re.compile(step)
+        trigger = Trigger(self.next_id, " ... ".join(steps), action)
+        trigger.is_regex = True
+        trigger.steps = list(steps)
+        self.triggers[trigger.id] = trigger
+        self.next_id += 1
+        return trigger
+
+    def remove(self, trigger_id):
+        """Poista triggeri. Palauttaa True jos se oli olemassa."""
+        if self.triggers.pop(trigger_id, None) is None:
+            return False
+        self._dirty = True
+        return True
+
+    def compile(self):
+        """Kokoa literaali-automaatti ja yhdistetty esisuodatin-regex."""
+        self._literals = AhoCorasick()
+        self._combinable = []
+        self._separate = []
+        for trigger in self.triggers.values():
+            if trigger.steps:
+                continue  # Monirivinen: StreamMatcher hoitaa
+            if not trigger.is_regex:
+                self._literals.add(trigger.pattern, trigger)
+            elif _UNCOMBINABLE_RE.search(trigger.pattern):
+                self._separate.append(trigger)
+            else:
+                self._combinable.append(trigger)
+        self._literals.build()
+        self._combined = None
+        self._tails = {}
+        if self._combinable:
+            try:
+                self._combined = self._alternation(0)
+            except re.error:
+                # Jokin yhdistelmä ei käänny: aja kaikki erikseen
+                self._separate = self._combinable + self._separate
+                self._combinable = []
+        self._dirty = False
+
+    def _alternation(self, first):
+        """Käännä vaihtoehtolauseke triggereistä _combinable[first:]."""
+        return re.compile("|".join(
+            f"(?P<t{i}>{self._combinable[i].pattern})"
+            for i in range(first, len(self._combinable))))
+
+    def _tail(self, index):
+        """Vaihtoehdot indeksin jälkeen; käännetään vasta kun tarvitaan."""
+        if index + 1 >= len(self._combinable):
+            return None
+        tail = self._tails.get(index)
+        if tail is None:
+            tail = self._tails[index] = self._alternation(index + 1)
+        return tail
+
+    def _match_combined(self, line, hits):
+        """Etsi yhdistetyllä lausekkeella kaikki osuvat triggerit."""
+        found = set()
+        pos = 0
+        while pos <= len(line) and len(found) < len(self._combinable):
+            m = self._combined.search(line, pos)
+            if m is None:
+                break
+            pos = m.start()
+            # Samassa kohdassa aiemmat vaihtoehdot eivät osuneet; myöhemmät
+            # kokeillaan loppuosalausekkeella
+            while m is not None:
+                index = int(m.lastgroup[1:])
+                if index not in found:
+                    found.add(index)
+                    trigger = self._combinable[index]
+                    # Oma haku antaa triggerin omat ryhmät ($1...)
+                    hits.append((trigger, trigger.regex.search(line, pos)))
+                tail = self._tail(index)
+                m = tail.match(line, pos) if tail is not None else None
+            pos += 1
+
+    def match(self, line):
+        """Palauta [(Trigger, match tai None)] riville, määrittelyjärjestyksessä."""
+        if self._dirty:
+            self.compile()
+        start = time.monotonic()
+        hits = [(t, None) for t in self._literals.search(line)]
+        if self._combined is not None:
+            self._match_combined(line, hits)
+        for trigger in self._separate:
+            m = trigger.regex.search(line)
+            if m:
+                hits.append((trigger, m))
+        self.lines_scanned += 1
+        self.scan_histogram.observe(time.monotonic() - start)
+        if len(hits) > 1:
+            hits.sort(key=lambda hit: hit[0].id)
+        return hits
+
+
+# Värikoodi jonka sisään /subst ei saa korvata
+_ANSI_CODE_RE = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class FilterRule(Trigger):
+    """/gag- tai /subst-sääntö. action on korvaava teksti, gagilla None."""
+
+    def __init__(self, rule_id, pattern, replacement, is_regex=False):
+        super().__init__(rule_id, pattern, replacement, is_regex)
+        self.saved = 0  # Gagin piilottamat merkit
+
+    @property
+    def is_gag(self):
+        return self.action is None
+
+    def substitute(self, line, stripped):
+        """Tee korvaus riville.
+
+        Korvaus tehdään ensisijaisesti raakariville, jotta värit säilyvät.
+        Jos osuma puuttuu raakariviltä tai osuu ANSI-koodin sisään, korvataan
+        puhdistettuun riviin.
+        """
+        if self.is_regex:
+            spans = [m.span() for m in self.regex.finditer(line)]
+        else:
+            spans = []
+            start = line.find(self.pattern)
+            while start >= 0 and self.pattern:
+                spans.append((start, start + len(self.pattern)))
+                start = line.find(self.pattern, start + len(self.pattern))
+
+        target = line
+        if '\x1b' in line:
+            codes = [m.span() for m in _ANSI_CODE_RE.finditer(line)]
+            if not spans or any(s < ce and cs < e for s, e in spans for cs, ce in codes):
+                target = stripped
+
+        if self.is_regex:
+            return self.regex.sub(self.expand_action, target)
+        return target.replace(self.pattern, self.action)
+
+
+class OutputFilter(TriggerEngine):
+    """/gag ja /subst: rivit sovitetaan kaikkiin sääntöihin yhdellä läpikäynnillä.
+
+    Sama yhdistetty sovitus kuin triggereillä. Gag voittaa: gagattu rivi ei
+    päädy output_linesiin eikä lokiin. Korvaukset tehdään id-järjestyksessä.
+    """
+
+    rule_class = FilterRule
+
+    def __init__(self):
+        super().__init__()
+        self.lines_gagged = 0
+
+    def add_gag(self, pattern, is_regex=False):
+        """Lisää gag. Raises re.error jos regex on virheellinen."""
+        return self.add(pattern, None, is_regex)
+
+    def add_subst(self, pattern, replacement, is_regex=False):
+        """Lisää korvaus. Raises re.error jos regex on virheellinen."""
+        return self.add(pattern, replacement, is_regex)
+
+    def apply(self, line, strip):
+        """Palauta näytettävä rivi, tai None jos rivi gagataan.
+
+        Args:
+            line: Rivi ANSI-koodeineen
+            strip: Funktio joka poistaa rivistä ANSI-koodit
+        """
+        stripped = strip(line)
+        hits = self.match(stripped)
+        if not hits:
+            return line
+        for rule, _match in hits:
+            if rule.is_gag:
+                rule.hits += 1
+                rule.saved += len(line) + 1
+                self.lines_gagged += 1
+                return None
+        for rule, _match in hits:
+            rule.hits += 1
+            line = rule.substitute(line, stripped)
+            stripped = strip(line)
+        return line
+
+
+class TimerHeap:
+    """Ajastetut kutsut yhdessä keossa ja yhdellä loop.call_at-herätyksellä.
+
+    Tapahtumasilmukassa on kerrallaan vain yksi ajastus: keon aikaisimmalle
+    alkiolle. Laukeamisen jälkeen ajetaan kaikki erääntyneet ja ajastetaan
+    seuraava, joten tuhannet ajastukset maksavat yhden herätyksen per laukeama.
+    Poikkeus yhdessä kutsussa ei pysäytä muita: se annetaan on_errorille
+    (tai silmukan poikkeuskäsittelijälle) ja seuraava herätys ajastetaan aina.
+    """
+
+    def __init__(self, on_error=None):
+        self.heap = []  # [when, seq, callback, args, peruttu]
+        self._seq = itertools.count()
+        self._handle = None
+        self._loop = None
+        self.on_error = on_error  # on_error(callback, poikkeus)
+        self.errors = 0
+
+    def time(self):
+        """Tapahtumasilmukan kello (loop.time())."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop.time()
+
+    def push(self, when, callback, *args):
+        """Ajasta callback(*args) hetkelle when (loop.time()-asteikolla)."""
+        entry = [when, next(self._seq), callback, args, False]
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self._arm()
+        return entry
+
+    def cancel(self, entry):
+        """Peru ajastus. Alkio poistuu keosta kun sen vuoro tulee."""
+        entry[4] = True
+
+    def __len__(self):
+        return sum(1 for entry in self.heap if not entry[4])
+
+    def _arm(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self.heap:
+            self.time()
+            self._handle = self._loop.call_at(self.heap[0][0], self._fire)
+
+    def _fire(self):
+        self._handle = None
+        now = self._loop.time()
+        try:
+            while self.heap and self.heap[0][0] <= now:
+                _when, _seq, callback, args, cancelled = heapq.heappop(self.heap)
+                if not cancelled:
+                    try:
+                        callback(*args)
+                    except Exception as e:
+                        self._report(callback, e)
+        finally:
+            self._arm()
+
+    def _report(self, callback, error):
+        self.errors += 1
+        if self.on_error is not None:
+            try:
+                self.on_error(callback, error)
+                return
+            except Exception:
+                pass
+        self._loop.call_exception_handler({
+            "message": f"TimerHeap-kutsu {callback!r} epäonnistui",
+            "exception": error,
+        })
+
+
+# Yhteyden muodostus: kokonaisaika, DNS-välimuistin ikä ja Happy Eyeballs
+# -viive (s) ennen kuin seuraava osoite käynnistetään rinnalle
+CONNECT_TIMEOUT = 10.0
+DNS_TTL = 300.0
+HAPPY_EYEBALLS_DELAY = 0.25
+# Virheet joista näkee että välimuistin osoite itse on väärä (ei vain
+# palvelin alhaalla): silloin seuraava yritys kysyy nimen uudelleen
+_WRONG_ADDRESS_ERRNOS = frozenset(
+    code for code in (getattr(errno, name, None) for name in (
+        'EHOSTUNREACH', 'ENETUNREACH', 'EADDRNOTAVAIL', 'EAFNOSUPPORT'))
+    if code is not None)
+# TCP keepalive: ensimmäinen koetin, koettimien väli (s) ja määrä
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 15
+KEEPALIVE_COUNT = 4
+
+
+def interleave_families(addresses):
+    """Vuorottele osoiteperheitä (RFC 8305): IPv6, IPv4, IPv6, ...
+
+    Ensimmäiseksi tulee resolverin suosima perhe.
+    """
+    by_family = {}
+    for address in addresses:
+        by_family.setdefault(address[0], []).append(address)
+    groups = list(by_family.values())
+    result = []
+    for i in range(max((len(group) for group in groups), default=0)):
+        result.extend(group[i] for group in groups if i < len(group))
+    return result
+
+
+def tune_socket(sock):
+    """TCP_NODELAY ja keepalive, jotta komennot lähtevät heti ja kuollut
+    yhteys huomataan ilman liikennettä. Puuttuvat optiot ohitetaan."""
+    if sock is None:
+        return
+    options = [
+        (socket.IPPROTO_TCP, getattr(socket, 'TCP_NODELAY', None), 1),
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        # macOS:ssä TCP_KEEPIDLE on nimellä TCP_KEEPALIVE
+        (socket.IPPROTO_TCP, getattr(socket, 'TCP_KEEPIDLE',
+                                     getattr(socket, 'TCP_KEEPALIVE', None)), KEEPALIVE_IDLE),
+        (socket.IPPROTO_TCP, getattr(socket, 'TCP_KEEPINTVL', None), KEEPALIVE_INTERVAL),
+        (socket.IPPROTO_TCP, getattr(socket, 'TCP_KEEPCNT', None), KEEPALIVE_COUNT),
+    ]
+    for level, option, value in options:
+        if option is None:
+            continue
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError:
+            pass
+
+
+class Connector:
+    """Yhteyden avaus DNS-välimuistilla ja rinnakkaisilla osoitteilla.
+
+    Nimi selvitetään kerran per ttl, joten uudelleenyhdistyksen yritykset
+    eivät odota resolveria. Osoite pidetään välimuistissa myös kun yhteys
+    epäonnistuu (palvelin alhaalla), ja unohdetaan vain jos virhe kertoo
+    osoitteen olevan väärä; ttl:n umpeuduttua uusi kysely korvaa sen.
+
+    Osoitteita kokeillaan Happy Eyeballs -tyyliin: seuraava käynnistyy
+    happy_eyeballs_delay sekunnin päästä tai heti kun edellinen epäonnistuu,
+    ja ensimmäinen valmis yhteys voittaa.
+    """
+
+    def __init__(self, ttl=DNS_TTL, happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY):
+        self.ttl = ttl
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.cache = {}  # {(host, port): (vanhenee, [(perhe, sockaddr)])}
+        self.lookups = 0  # DNS-kyselyt
+        self.cache_hits = 0
+        self.last_address = None  # Voittaneen yhteyden sockaddr
+
+    async def resolve(self, host, port):
+        """Osoitteet välimuistista tai resolverilta, perheet vuorotellen."""
+        key = (host, port)
+        now = time.monotonic()
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] > now:
+            self.cache_hits += 1
+            return cached[1]
+
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError:
+            if cached is not None:
+                # Vanhentunut osoite on katkoksen aikana parempi kuin ei mitään
+                return cached[1]
+            raise
+        self.lookups += 1
+        addresses = []
+        for family, _type, _proto, _name, sockaddr in infos:
+            if (family, sockaddr) not in addresses:
+                addresses.append((family, sockaddr))
+        addresses = interleave_families(addresses)
+        self.cache[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        """Unohda välimuistissa olevat osoitteet."""
+        self.cache.pop((host, port), None)
+
+    async def open(self, host, port, timeout=CONNECT_TIMEOUT):
+        """Avaa yhteys ja palauta (reader, writer).
+
+        Raises:
+            asyncio.TimeoutError: jos yhteyttä ei saatu timeoutin aikana
+            OSError: jos nimeä ei löydy tai kaikki osoitteet epäonnistuvat
+        """
+        return await asyncio.wait_for(self._open(host, port), timeout)
+
+    async def _open(self, host, port):
+        addresses = await self.resolve(host, port)
+        try:
+            sock, sockaddr = await self._race(addresses)
+        except OSError as e:
+            # Palvelin saattoi vaihtaa osoitetta: seuraava yritys kysyy uudelleen.
+            # Hylätty yhteys tai aikakatkaisu ei kerro sitä, joten niissä
+            # välimuisti säästää katkoksen aikana DNS-kyselyn per yritys.
+            if e.errno in _WRONG_ADDRESS_ERRNOS:
+                self.forget(host, port)
+            raise
+        tune_socket(sock)
+        self.last_address = sockaddr
+        try:
+            return await asyncio.open_connection(sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+
+    async def _race(self, addresses):
+        """Kilpailuta osoitteet ja palauta (socket, sockaddr) voittajalta."""
+        if not addresses:
+            raise OSError("Palvelimelle ei löytynyt osoitteita")
+
+        pending = set()
+        errors = []
+        winner = None
+        remaining = iter(addresses)
+        try:
+            while winner is None:
+                address = next(remaining, None)
+                if address is not None:
+                    pending.add(asyncio.ensure_future(self._connect_one(*address)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED,
+                    timeout=self.happy_eyeballs_delay if address is not None else None)
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        task.result()[0].close()
+        finally:
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(result, tuple):
+                    result[0].close()
+
+        if winner is not None:
+            return winner
+        if all(type(e) is type(errors[0]) for e in errors):
+            raise errors[0]
+        message = ("Yhteys epäonnistui kaikkiin osoitteisiin: "
+                   + ", ".join(str(e) for e in errors))
+        if all(getattr(e, "errno", None) in _WRONG_ADDRESS_ERRNOS for e in errors):
+            raise OSError(errors[0].errno, message)
+        raise OSError(message)
+
+    @staticmethod
+    async def _connect_one(family, sockaddr):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            await loop.sock_connect(sock, sockaddr)
+        except BaseException:
+            sock.close()
+            raise
+        return sock, sockaddr
+
+
+# Aliasten sisäkkäisyyden ja yhden rivin tuottamien komentojen rajat
+ALIAS_MAX_DEPTH = 10
+ALIAS_MAX_COMMANDS = 100
+ALIAS_CACHE_SIZE = 1024
+_ALIAS_PARAM_RE = re.compile(r'\$(\$|\*|[1-9])')
+
+
+class AliasError(Exception):
+    """Aliaksen laajennus ei onnistu (liian syvä tai liian monta komentoa)."""
+
+
+def compile_alias_template(template):
+    """Pilko aliaksen pohja komennoiksi (';') ja ne literaaleiksi ja parametreiksi.
+
+    Pohja jaetaan komennoiksi ennen argumenttien sijoitusta, joten käyttäjän
+    argumenteissa oleva ';' ei erota komentoja.
+
+    Returns:
+        (komennot, onko_parametreja): jokainen komento on osalista, jonka osat
+        ovat merkkijonoja, kokonaislukuja ($1-$9) tai None ($*)
+    """
+    commands = [[]]
+    has_params = False
+    pos = 0
+
+    def literal(text):
+        first, *rest = text.split(';')
+        if first:
+            commands[-1].append(first)
+        for piece in rest:
+            commands.append([piece] if piece else [])
+
+    for m in _ALIAS_PARAM_RE.finditer(template):
+        if m.start() > pos:
+            literal(template[pos:m.start()])
+        token = m.group(1)
+        if token == '$':
+            commands[-1].append('$')
+        else:
+            commands[-1].append(None if token == '*' else int(token))
+            has_params = True
+        pos = m.end()
+    if pos < len(template):
+        literal(template[pos:])
+    return commands, has_params
+
+
+class AliasEngine:
+    """Aliasten laajennus esikäännetyillä pohjilla.
+
+    Pohja käännetään kerran osalistaksi, joten laajennus on pohjan mittainen
+    riippumatta aliasten määrästä. Tuloksena on komentolista (';' pohjassa
+    erottaa; argumenttien ';' kuuluu komentoon).
+    Sisäkkäiset aliakset laajennetaan; polulla jo oleva alias lähetetään
+    sellaisenaan, joten silmukat katkeavat (esim. "alias look look;glance").
+    Valmiit laajennukset pidetään välimuistissa niin kauan kuin niiden
+    käyttämät aliakset ovat ennallaan.
+    """
+
+    def __init__(self):
+        self._compiled = {}  # {nimi: (pohja, osat, onko_parametreja)}
+        self._cache = {}  # {rivi: (komennot, [(nimi, pohja), ...])}
+        self.cache_hits = 0
+
+    def _template(self, name, template):
+        compiled = self._compiled.get(name)
+        if compiled is None or compiled[0] is not template:
+            compiled = (template, *compile_alias_template(template))
+            self._compiled[name] = compiled
+        return compiled
+
+    def expand(self, line, aliases):
+        """Laajenna rivi komentolistaksi.
+
+        Args:
+            line: Käyttäjän rivi
+            aliases: {nimi: pohja}
+
+        Raises:
+            AliasError: jos laajennus on liian syvä tai tuottaa liikaa komentoja
+        """
+        if not aliases or not line:
+            return [line]
+
+        cached = self._cache.get(line)
+        if cached is not None and all(aliases.get(n) is t for n, t in cached[1]):
+            self.cache_hits += 1
+            return list(cached[0])
+
+        deps = []
+        commands = []
+        self._expand(line, aliases, (), commands, deps)
+        if len(self._cache) >= ALIAS_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[line] = (commands, deps)
+        return list(commands)
+
+    def _expand(self, line, aliases, stack, out, deps):
+        words = line.split(maxsplit=1)
+        name = words[0] if words else ""
+        template = aliases.get(name) if name not in stack else None
+        deps.append((name, template))
+        if template is None:
+            if len(out) >= ALIAS_MAX_COMMANDS:
+                raise AliasError(f"laajennus tuottaa yli {ALIAS_MAX_COMMANDS} komentoa")
+            out.append(line)
+            return
+        if len(stack) >= ALIAS_MAX_DEPTH:
+            raise AliasError(f"aliakset sisäkkäin yli {ALIAS_MAX_DEPTH} tasoa ({name})")
+
+        rest = words[1] if len(words) > 1 else ""
+        _template, commands, has_params = self._template(name, template)
+        texts = []
+        if has_params:
+            args = rest.split()
+            for parts in commands:
+                pieces = []
+                for part in parts:
+                    if part is None:
+                        pieces.append(rest)
+                    elif isinstance(part, int):
+                        pieces.append(args[part - 1] if part <= len(args) else "")
+                    else:
+                        pieces.append(part)
+                texts.append("".join(pieces))
+        else:
+            # Ei parametreja: argumentit viimeisen komennon perään kuten ennenkin
+            texts = ["".join(parts) for parts in commands]
+            if rest:
+                texts[-1] = f"{texts[-1]} {rest}"
+
+        stack = stack + (name,)
+        for command in texts:
+            self._expand(command.strip(), aliases, stack, out, deps)
+
+
+# Lyhin sallittu ajastimen väli, ettei väärä arvo tukehduta yhteyttä
+TIMER_MIN_INTERVAL = 0.1
+
+
+class UserTimer:
+    """Käyttäjän ajastin: komento, väli ja jäljellä olevat ajot."""
+
+    def __init__(self, timer_id, interval, command, count=None):
+        self.id = timer_id
+        self.interval = interval
+        self.command = command
+        self.remaining = count  # None = toistuu kunnes poistetaan
+        self.due = 0.0  # Seuraava laukeama (loop.time())
+        self.runs = 0
+        self.entry = None  # TimerHeapin alkio
+
+
+class TimerManager:
+    """/timer ja /repeat: kaikki ajastimet samassa TimerHeapissa.
+
+    Toistuva ajastin ajastetaan edellisestä eräpäivästä eikä laukeamishetkestä,
+    joten aikataulu ei valu. Jos silmukka on jäänyt jälkeen yli välin,
+    väliin jääneet ajot ohitetaan eikä niitä ajeta ryöppynä.
+    """
+
+    def __init__(self, timers, run):
+        self.timers = timers  # TimerHeap
+        self.run = run  # async run(komento)
+        self.active = {}  # {id: UserTimer}
+        self.next_id = 1
+        self._tasks = set()
+
+    def add(self, interval, command, count=None, delay=None):
+        """Lisää ajastin.
+
+        Args:
+            interval: väli sekunteina
+            command: ajettava komentorivi
+            count: montako kertaa ajetaan (None = toistuu)
+            delay: ensimmäisen ajon viive (oletus interval)
+        """
+        timer = UserTimer(self.next_id, max(interval, TIMER_MIN_INTERVAL), command, count)
+        self.next_id += 1
+        timer.due = self.timers.time() + (timer.interval if delay is None else delay)
+        timer.entry = self.timers.push(timer.due, self._fire, timer)
+        self.active[timer.id] = timer
+        return timer
+
+    def remove(self, timer_id):
+        """Poista ajastin. Palauttaa True jos se oli olemassa."""
+        timer = self.active.pop(timer_id, None)
+        if timer is None:
+            return False
+        self.timers.cancel(timer.entry)
+        return True
+
+    def clear(self):
+        """Poista kaikki ajastimet."""
+        for timer_id in list(self.active):
+            self.remove(timer_id)
+
+    def _fire(self, timer):
+        timer.runs += 1
+        task = asyncio.create_task(self.run(timer.command))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if timer.remaining is not None:
+            timer.remaining -= 1
+            if timer.remaining <= 0:
+                self.active.pop(timer.id, None)
+                return
+
+        now = self.timers.time()
+        timer.due += timer.interval
+        if timer.due <= now:
+            missed = int((now - timer.due) // timer.interval) + 1
+            timer.due += missed * timer.interval
+        timer.entry = self.timers.push(timer.due, self._fire, timer)
+
+
+# Lähtevien komentojen prioriteetit: käyttäjän syöte ohittaa triggerit ja
+# ajastimet, ne puolestaan massalähetykset (speedwalk)
+PRIORITY_USER = 0
+PRIORITY_ACTION = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = ("user", "action", "bulk")
+
+# Automaattinen kirjautuminen odottaa palvelimen kehotetta: tunnukselle
+# prompt (IAC GA/EOR) tai kehoteteksti, salasanalle WILL ECHO tai kehote.
+# Jos kehotetta ei tunnisteta ajassa, lähetetään silti (vanha käytös).
+LOGIN_PROMPT_RE = r'(?i)(?:name|login|account|user(?:name)?)\W*$'
+PASSWORD_PROMPT_RE = r'(?i)password\W*$'
+LOGIN_TIMEOUT = 10.0
+
+# Promptiin tahditettu speedwalk: kauanko odotetaan promptia askelten välissä
+# ennen kuin loput askeleet lähetetään kerralla
+WALK_PROMPT_TIMEOUT = 3.0
+
+# Token bucket: komentoja sekunnissa ja kerralla enintään (0 = ei rajaa)
+SEND_RATE = 10.0
+SEND_BURST = 20
+
+
+class OutboundQueue:
+    """Lähtevien komentojen prioriteettijono ja token bucket -nopeusraja.
+
+    Jokainen komento kuluttaa yhden tokenin; tokeneita kertyy rate sekunnissa
+    burstiin asti. Jonosta otetaan aina ensin korkein prioriteetti, joten
+    käyttäjän komento ohittaa jonottavat automaatiokomennot. Jonossa on
+    (komento, salainen) -pareja, jotta salasanaa ei näytetä /queuessa.
+    """
+
+    def __init__(self, rate=SEND_RATE, burst=SEND_BURST):
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated = None
+        self.queues = [deque() for _ in PRIORITY_NAMES]
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.dropped = 0
+
+    def _refill(self, now):
+        if self.updated is not None and self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def push(self, commands, priority=PRIORITY_USER, secret=()):
+        """Lisää komennot prioriteettiluokan jonoon.
+
+        Args:
+            secret: Salaisten komentojen indeksit (peitetään peek:ssä)
+        """
+        self.queues[priority].extend(
+            (cmd, i in secret) for i, cmd in enumerate(commands))
+
+    def peek(self, priority):
+        """Luokan seuraava komento näytettäväksi (salainen peitettynä) tai None."""
+        queue = self.queues[priority]
+        if not queue:
+            return None
+        command, secret = queue[0]
+        return "********" if secret else command
+
+    def take(self, now):
+        """Ota jonosta kaikki komennot joille on nyt tokeneita."""
+        self._refill(now)
+        out = []
+        for priority, queue in enumerate(self.queues):
+            while queue and (self.rate <= 0 or self.tokens >= 1):
+                out.append(queue.popleft()[0])
+                if self.rate > 0:
+                    self.tokens -= 1
+                self.sent[priority] += 1
+        return out
+
+    def pending(self):
+        """Jonossa odottavien komentojen määrä."""
+        return sum(len(queue) for queue in self.queues)
+
+    def next_ready(self, now):
+        """Hetki jolloin seuraava token on käytettävissä."""
+        if self.rate <= 0:
+            return now
+        return now + max(0.0, 1 - self.tokens) / self.rate
+
+    def clear(self, priority=None):
+        """Tyhjennä jono (tai yksi luokka). Palauttaa poistettujen määrän."""
+        queues = self.queues if priority is None else [self.queues[priority]]
+        count = 0
+        for queue in queues:
+            count += len(queue)
+            queue.clear()
+        self.dropped += count
+        return count
+
+
+# Triggerien toimintojen ajastus: saman komennon uusinta-aika (s) ja
+# kuinka monta komentoa sekunnissa triggerit saavat enintään lähettää
+ACTION_COOLDOWN = 1.0
+ACTION_RATE = 5.0
+ACTION_LAST_RUN_MAX = 1024
+
+
+class ActionScheduler:
+    """Triggerien komentojen jono: jäähdytys, yhdistäminen ja nopeusraja.
+
+    - Sama komento jo jonossa: uusi pyyntö yhdistetään siihen
+    - Sama komento ajettu jäähdytysajan sisällä: pyyntö hylätään
+    - Komennot ajetaan enintään rate kappaletta sekunnissa
+
+    Näin sadan osuvan rivin purske tuottaa yhden reaktion.
+    """
+
+    def __init__(self, timers, run, rate=ACTION_RATE, cooldown=ACTION_COOLDOWN):
+        self.timers = timers  # TimerHeap
+        self.run = run  # async run(komento)
+        self.rate = rate
+        self.cooldown = cooldown
+        self.pending = set()
+        self.last_run = {}  # {komento: loop.time()}
+        self.next_slot = 0.0
+        self.submitted = 0
+        self.coalesced = 0
+        self.suppressed = 0
+        self.executed = 0
+        self._tasks = set()
+
+    def submit(self, command, cooldown=None):
+        """Jonota komento. Palauttaa True jos se ajetaan, False jos ohitettiin."""
+        self.submitted += 1
+        if command in self.pending:
+            self.coalesced += 1
+            return False
+
+        now = self.timers.time()
+        cooldown = self.cooldown if cooldown is None else cooldown
+        last = self.last_run.get(command)
+        if last is not None and now - last < cooldown:
+            self.suppressed += 1
+            return False
+
+        due = max(now, self.next_slot)
+        self.next_slot = due + 1.0 / self.rate if self.rate > 0 else due
+        self.pending.add(command)
+        self.timers.push(due, self._execute, command)
+        return True
+
+    def _execute(self, command):
+        self.pending.discard(command)
+        now = self.timers.time()
+        if len(self.last_run) >= ACTION_LAST_RUN_MAX:
+            # Jäähtyneet pois, ettei taulu kasva loputtomasti
+            self.last_run = {cmd: t for cmd, t in self.last_run.items()
+                             if now - t < self.cooldown}
+        self.last_run[command] = now
+        self.executed += 1
+        task = asyncio.create_task(self.run(command))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+# Tab-täydennyksen sanaindeksi: sanojen enimmäismäärä, puoliintumisaika
+# riveinä ja sanan vähimmäispituus
+COMPLETE_MAX_WORDS = 20000
+COMPLETE_HALF_LIFE = 2000
+COMPLETE_MIN_LEN = 3
+_WORD_RE = re.compile(r"[^\W\d_][\w'-]*")
+
+
+class WordIndex:
+    """Palvelimen tulosteen sanat Tab-täydennystä varten.
+
+    Jokainen rivi pilkotaan kerran. Sanan paino vanhenee eksponentiaalisesti
+    rivien myötä: vanhenemista ei lasketa joka sanalle, vaan uusien osumien
+    painoa kasvatetaan (boost), jolloin vanhat painot pienenevät suhteessa.
+    Avaimet (pienaakkosin) pidetään lajiteltuna listana, joten alkuosalla
+    haku on bisect ja vain osuvat sanat järjestetään painon mukaan.
+    """
+
+    def __init__(self, max_words=COMPLETE_MAX_WORDS, half_life=COMPLETE_HALF_LIFE,
+                 min_len=COMPLETE_MIN_LEN):
+        self.max_words = max_words
+        self.min_len = min_len
+        self.growth = 2 ** (1.0 / half_life)  # Boostin kasvu per rivi
+        self.enabled = True
+        self.boost = 1.0
+        self.words = {}  # {avain: [paino boost-asteikolla, viimeksi nähty muoto]}
+        self.keys = []  # Lajitellut avaimet
+        self.lines_indexed = 0
+
+    def add_line(self, line):
+        """Lisää ANSI-koodeista puhdistetun rivin sanat."""
+        self.lines_indexed += 1
+        self.boost *= self.growth
+        if self.boost > 1e100:
+            self._rescale()
+        for word in _WORD_RE.findall(line):
+            if len(word) < self.min_len:
+                continue
+            word = word.rstrip("'-")
+            key = word.lower()
+            entry = self.words.get(key)
+            if entry is None:
+                self.words[key] = [self.boost, word]
+                bisect.insort(self.keys, key)
+            else:
+                entry[0] += self.boost
+                entry[1] = word
+        if len(self.words) > self.max_words + self.max_words // 4:
+            self._prune()
+
+    def _rescale(self):
+        for entry in self.words.values():
+            entry[0] /= self.boost
+        self.boost = 1.0
+
+    def _prune(self):
+        """Pudota kevyimmät sanat max_words:iin."""
+        ranked = sorted(self.words.items(), key=lambda item: item[1][0], reverse=True)
+        self.words = dict(ranked[:self.max_words])
+        self.keys = sorted(self.words)
+
+    def score(self, key):
+        """Sanan vanhennettu paino (1.0 = yksi osuma juuri nyt)."""
+        entry = self.words.get(key)
+        return entry[0] / self.boost if entry else 0.0
+
+    def complete(self, prefix, limit=20):
+        """Sanat jotka alkavat prefixillä (kirjainkoosta välittämättä), painavin ensin."""
+        key = prefix.lower()
+        lo = bisect.bisect_left(self.keys, key)
+        hi = bisect.bisect_left(self.keys, key + '\U0010ffff', lo)
+        matches = [k for k in self.keys[lo:hi] if k != key]
+        best = heapq.nlargest(limit, matches, key=lambda k: self.words[k][0])
+        return [self.words[k][1] for k in best]
+
+    def clear(self):
+        self.words.clear()
+        self.keys = []
+        self.boost = 1.0
+
+
+# Spämmin taitto: exact = vain identtiset rivit, numbers = myös rivit jotka
+# eroavat vain numeroiltaan (esim. vahinkoluvut)
+FOLD_MODES = ("off", "exact", "numbers")
+_FOLD_NUMBER_RE = re.compile(r'\d+')
+
+
+class SpamFolder:
+    """Peräkkäisten samanlaisten rivien taitto yhdeksi riviksi "(xN)"-laskurilla."""
+
+    def __init__(self, mode="off"):
+        self.mode = mode if mode in FOLD_MODES else "off"
+        self.lines_folded = 0  # Rivit jotka eivät tulleet puskuriin
+        self.reset()
+
+    def reset(self):
+        """Unohda edellinen rivi (esim. puskurin tyhjennyksen jälkeen)."""
+        self.last_key = None
+        self.count = 0
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.reset()
+
+    def fold(self, line, stripped):
+        """Palauta edellisen rivin uusi teksti jos rivi taitetaan, muuten None.
+
+        Taitettaessa näytetään uusin rivi, jotta numerot ovat ajan tasalla.
+        Tyhjiä rivejä ei taiteta.
+        """
+        if not stripped.strip():
+            self.reset()
+            return None
+        key = _FOLD_NUMBER_RE.sub('#', stripped) if self.mode == "numbers" else stripped
+        if key != self.last_key:
+            self.last_key = key
+            self.count = 1
+            return None
+        self.count += 1
+        self.lines_folded += 1
+        return f"{line} (x{self.count})"
+
+
+# Monirivisen sovittimen ikkuna: montako viimeisintä riviä pidetään
+# muistissa, ja oletus sille montako muuta riviä kuvion askelten väliin mahtuu
+MULTILINE_WINDOW = 50
+MULTILINE_MAX_GAP = 20
+
+
+class MultiLineMatch:
+    """Valmis monirivinen osuma: rivit ja kaappaukset kaikista askelista."""
+
+    def __init__(self, pattern, lines, groups, named):
+        self.pattern = pattern
+        self.lines = lines  # Osuman rivit ensimmäisestä viimeiseen
+        self.groups = tuple(groups)  # Numeroidut ryhmät askel kerrallaan
+        self.named = named  # Nimetyt ryhmät {nimi: arvo}
+
+    def group(self, n):
+        """Kuten re.Match.group: 0 = ensimmäinen rivi, 1.. = kaappaukset."""
+        if n == 0:
+            return self.lines[0] if self.lines else ""
+        return self.groups[n - 1]
+
+
+class StreamPattern:
+    """Monirivinen kuvio: askelten regexit järjestyksessä."""
+
+    def __init__(self, steps, handler, max_gap=MULTILINE_MAX_GAP):
+        self.steps = list(steps)
+        self.regexes = [re.compile(step) for step in self.steps]
+        self.handler = handler
+        self.max_gap = max_gap  # Muita rivejä sallittu askelten välissä
+        self.hits = 0
+
+
+class _PartialMatch:
+    """Kesken oleva osuma: monesko askel seuraavaksi ja kaappaukset tähän asti."""
+
+    __slots__ = ("pattern", "step", "start", "last", "groups", "named")
+
+    def __init__(self, pattern, seq, match):
+        self.pattern = pattern
+        self.step = 1
+        self.start = seq
+        self.last = seq
+        self.groups = list(match.groups())
+        self.named = match.groupdict()
+
+
+class StreamMatcher:
+    """Inkrementaalinen monirivinen sovitin.
+
+    Jokainen uusi rivi sovitetaan vain kesken olevien osumien seuraavaan
+    askeleeseen ja kuvioiden ensimmäiseen askeleeseen - ikkunaa ei käydä
+    uudelleen läpi. Ikkuna pitää viimeisimmät rivit, jotta valmiin osuman
+    kaikki rivit voidaan antaa käsittelijälle. Käsittelijät ovat
+    coroutineja ja ajetaan omina taskeinaan.
+    """
+
+    def __init__(self, window=MULTILINE_WINDOW):
+        self.window = deque(maxlen=window)
+        self.patterns = []
+        self.partials = []
+        self.seq = 0
+        self._tasks = set()
+
+    def add(self, steps, handler, max_gap=MULTILINE_MAX_GAP):
+        """Lisää kuvio.
+
+        Raises:
+            re.error: jos jokin askel on virheellinen
+        """
+        pattern = StreamPattern(steps, handler, max_gap)
+        self.patterns.append(pattern)
+        return pattern
+
+    def remove(self, pattern):
+        """Poista kuvio ja sen keskeneräiset osumat."""
+        if pattern in self.patterns:
+            self.patterns.remove(pattern)
+        self.partials = [p for p in self.partials if p.pattern is not pattern]
+
+    def _complete(self, partial):
+        count = self.seq - partial.start + 1
+        lines = list(self.window)[-count:]
+        partial.pattern.hits += 1
+        return MultiLineMatch(partial.pattern, lines, partial.groups, partial.named)
+
+    def feed(self, line):
+        """Syötä yksi ANSI-koodeista puhdistettu rivi.
+
+        Returns:
+            Lista tällä rivillä valmistuneista MultiLineMatch-osumista
+        """
+        self.seq += 1
+        seq = self.seq
+        self.window.append(line)
+        completed = []
+        survivors = []
+
+        for partial in self.partials:
+            pattern = partial.pattern
+            m = pattern.regexes[partial.step].search(line)
+            if m:
+                partial.groups.extend(m.groups())
+                partial.named.update(m.groupdict())
+                partial.step += 1
+                partial.last = seq
+                if partial.step == len(pattern.regexes):
+                    completed.append(self._complete(partial))
+                    continue
+                survivors.append(partial)
+            elif (seq - partial.last <= pattern.max_gap
+                    and seq - partial.start < self.window.maxlen):
+                survivors.append(partial)
+
+        for pattern in self.patterns:
+            m = pattern.regexes[0].search(line)
+            if not m:
+                continue
+            partial = _PartialMatch(pattern, seq, m)
+            if len(pattern.regexes) == 1:
+                completed.append(self._complete(partial))
+                continue
+            # Uusi alku korvaa saman kuvion osuman joka ei ole edennyt
+            # ensimmäistä askelta pidemmälle: näin osumia on kuviota kohti
+            # korkeintaan askelten verran, vaikka alkuaskel osuisi joka riviin
+            survivors = [p for p in survivors
+                         if not (p.pattern is pattern and p.step == 1)]
+            survivors.append(partial)
+
+        self.partials = survivors
+
+        for match in completed:
+            handler = match.pattern.handler
+            if handler is not None:
+                task = asyncio.create_task(handler(match))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return completed
+
+
+# Liitetyn tekstin käsittely: montako näppäintä luetaan kerralla enintään
+PASTE_MAX_KEYS = 65536
+
+
+def group_paste_keys(keys, keymap=None):
+    """Ryhmittele näppäimet: vähintään kahden tavallisen merkin jonot
+    (tulostettavat ja rivinvaihdot) yhdistetään tekstiksi. Näppäinkarttaan
+    sidotut tulostettavat merkit käsitellään erikseen.
+
+    Tekstin keskellä oleva sarkain on liitetyn tekstin osa ja muutetaan
+    välilyönniksi; jonon alussa tai lopussa se jää näppäimeksi (täydennys).
+
+    Returns:
+        [(True, teksti) tai (False, näppäin)]
+    """
+    segments = []
+    run = []
+
+    def flush():
+        start, end = 0, len(run)
+        while start < end and run[start] == '\t':
+            start += 1
+        while end > start and run[end - 1] == '\t':
+            end -= 1
+        segments.extend((False, key) for key in run[:start])
+        if end - start > 1:
+            segments.append((True, "".join(run[start:end]).replace('\t', ' ')))
+        else:
+            segments.extend((False, key) for key in run[start:end])
+        segments.extend((False, key) for key in run[end:])
+        run.clear()
+
+    for key in keys:
+        if isinstance(key, str) and (key in '\r\n\t' or (
+                key.isprintable() and not (keymap and keymap.is_bound(key)))):
+            run.append(key)
+        else:
+            flush()
+            segments.append((False, key))
+    flush()
+    return segments
+
+
 class BatClient:
     def __init__(self, stdscr):
         self.stdscr = stdscr
@@ -182,8 +2155,17 @@ class BatClient:
         self.scroll_offset = 0
         self.reader = None
         self.writer = None
-        self.command_history = deque(maxlen=100)
-        self.history_index = -1
+        self.command_history = CommandHistory()  # Korvataan tiedostollisella .env:n jälkeen
+        self.history_index = -1  # Ctrl-P/N: paikka historiassa, -1 = ei selata
+        self.history_task = None  # Historian lataus / indeksointi taustalla
+        self.history_search_mode = False  # Ctrl-R: käänteinen haku historiasta
+        self.history_search_states = []  # [(haku, osuman paikka, indeksialue, löytyikö)]
+        self.history_saved_input = ""
+        self.word_index = WordIndex()  # Tab-täydennyksen sanat tulosteesta
+        self.completion = None  # [alku, alkuperäinen sana, ehdokkaat, valittu] Tabin kierrossa
+        self.keymap = Keymap()  # Korvataan KEYMAP_FILEn sidonnoilla .env:n jälkeen
+        self.keymap_errors = []
+        self.key_pending = ()  # Kesken oleva näppäinsarja (M-x, C-x C-s...)
         self.mud_prompt = ""  # MUD:n lähettämä prompt (IAC GA/EOR jälkeen)
         self.partial_line = ""  # Keskeneräinen rivi (ei vielä \n tai IAC GA/EOR)
         self.telnet_partial = b""  # Pakettirajalle katkennut IAC-sekvenssi
@@ -192,8 +2174,41 @@ class BatClient:
         self.log_file = None  # Lokitiedosto (avattu file handle)
         self.log_filename = None  # Lokitiedoston polku
         self.user_aliases = {}  # Käyttäjän aliakset {nimi: komento}
+        self.alias_engine = AliasEngine()
         self.echo_off = False  # Salasanatila (TELOPT ECHO)
         self.exit_message = None  # Viesti joka näytetään ohjelman lopussa
+        self.profiler = None  # SamplingProfiler kun /profile sample on päällä
+        self.lag_monitor = LagMonitor()  # Tapahtumasilmukan viivevahti (/stats)
+        self.lag_task = None
+        self.ping_event = asyncio.Event()  # Asetetaan kun TIMING-MARK vastaus saapuu
+        self.ping_task = None
+        self.metrics_server = None  # MetricsServer kun METRICS_PORT/SOCKET asetettu
+        self.started_at = time.monotonic()
+        self.bytes_received = 0  # Palvelimelta luetut tavut (mittarit)
+        self.lines_received = 0  # Palvelimelta tulleet rivit (mittarit)
+        self.lines_appended = 0  # Kaikkiaan output_linesiin lisätyt rivit
+        self.strip_cache = {}  # {rivi: rivi ilman ANSI-koodeja}
+        self.row_cache = {}  # {rivi: näyttörivien määrä leveydellä row_cache_width}
+        self.row_cache_width = None
+        self.search = None  # ScrollbackSearch (/search, Ctrl-F)
+        self.search_task = None
+        self.search_mode = False  # Ctrl-F: syöterivi kysyy hakulauseketta
+        self.search_saved_input = ""  # Syöte joka palautetaan haun jälkeen
+        self.triggers = TriggerEngine()  # /trigger
+        self.stream_matcher = StreamMatcher()  # Moniriviset kuviot
+        self.output_filter = OutputFilter()  # /gag ja /subst
+        # Kaikki ajastukset yhdellä herätyksellä
+        self.timers = TimerHeap(on_error=self.on_timer_error)
+        self.user_timers = TimerManager(  # /timer
+            self.timers, lambda cmd: self.execute_line(cmd, PRIORITY_ACTION))
+        self.outbound_wakeup = None  # TimerHeapin alkio kun jonossa odottaa
+        self.outbound_task = None
+        self.prompt_event = asyncio.Event()  # Asetetaan kun IAC GA/EOR saapuu
+        self.server_event = asyncio.Event()  # Asetetaan kun palvelimelta tulee dataa
+        self.prompts_seen = 0  # IAC GA/EOR -promptit tällä yhteydellä
+        self.last_server_text = ""  # Viimeisin tulostettu palvelinteksti
+        self.walk_task = None  # /walk taustalla
+        self.walk_progress = (0, 0)  # (lähetetty, yhteensä)
 
         # Auto-reconnect tila
         self.reconnecting = False  # Onko uudelleenyhdistys käynnissä
@@ -214,6 +2229,72 @@ class BatClient:
         self.theme_name = self.env.get('THEME', 'default').strip().lower() or 'default'
         # Auto-reconnect päällä oletuksena, pois jos AUTO_RECONNECT=false
         self.auto_reconnect = self.env.get('AUTO_RECONNECT', 'true').strip().lower() != 'false'
+        try:
+            self.profile_hz = int(self.env.get('PROFILE_HZ', '') or PROFILE_DEFAULT_HZ)
+        except ValueError:
+            self.profile_hz = PROFILE_DEFAULT_HZ
+        self.slow_callbacks = self.env.get('SLOW_CALLBACKS', '').lower() == 'true'
+        # Latenssin mittaus (/trace), päälle käynnistyksessä TRACE=true
+        self.tracer = LatencyTracer(self.env.get('TRACE', '').lower() == 'true')
+        # Triggerien toiminnot: jäähdytys (s) ja komentoja sekunnissa
+        self.action_scheduler = ActionScheduler(
+            self.timers, lambda cmd: self.execute_line(cmd, PRIORITY_ACTION),
+            rate=env_float(self.env, 'TRIGGER_RATE', ACTION_RATE),
+            cooldown=env_float(self.env, 'TRIGGER_COOLDOWN', ACTION_COOLDOWN))
+        # Lähtevien komentojen nopeusraja (/queue): komentoja/s ja purske
+        self.outbound = OutboundQueue(
+            rate=env_float(self.env, 'SEND_RATE', SEND_RATE),
+            burst=env_float(self.env, 'SEND_BURST', SEND_BURST))
+        # Automappari (/map, /path): MAP=true käynnistää, MAP_DB vaihtaa tiedoston.
+        # Tietokanta avataan vasta kun karttaa käytetään.
+        map_db = self.env.get('MAP_DB', '').strip() or Path(__file__).resolve().parent / MAP_FILENAME
+        self.automapper = Automapper(
+            RoomGraph(map_db),
+            exits_re=self.env.get('MAP_EXITS_RE', '').strip() or DEFAULT_EXITS_RE,
+            fail_re=self.env.get('MAP_FAIL_RE', '').strip() or DEFAULT_FAIL_RE)
+        self.automapper.enabled = self.env.get('MAP', '').lower() == 'true'
+        # Yhteyden avaus: DNS-välimuistin ikä ja rinnakkaisten osoitteiden viive (s)
+        self.connector = Connector(
+            ttl=env_float(self.env, 'DNS_TTL', DNS_TTL),
+            happy_eyeballs_delay=env_float(self.env, 'HAPPY_EYEBALLS_DELAY', HAPPY_EYEBALLS_DELAY))
+        # Pysyvä komentohistoria: HISTORY_FILE (off = ei tiedostoa), HISTORY_SIZE
+        history_file = self.env.get('HISTORY_FILE', '').strip()
+        if history_file.lower() == 'off':
+            history_file = None
+        elif not history_file:
+            history_file = Path(__file__).resolve().parent / HISTORY_FILENAME
+        self.command_history = CommandHistory(
+            history_file, max_entries=int(env_float(self.env, 'HISTORY_SIZE', HISTORY_MAX)))
+        # Näppäinkartta: oletukset + KEYMAP_FILE (oletus keys.conf projektikansiossa).
+        # Ladataan vain kerran; /bind muuttaa sidontoja istunnon ajaksi.
+        keymap_file = self.env.get('KEYMAP_FILE', '').strip()
+        if not keymap_file:
+            keymap_file = Path(__file__).resolve().parent / KEYMAP_FILENAME
+        self.keymap_errors = self.keymap.load(keymap_file)
+        # Yhteyden koetin (RTT statusrivillä): PING_INTERVAL s välein, 0 = pois
+        self.link_probe = LinkProbe(
+            interval=env_float(self.env, 'PING_INTERVAL', PING_INTERVAL),
+            command=self.env.get('PING_COMMAND', '').strip(),
+            timeout=env_float(self.env, 'PING_TIMEOUT', PING_TIMEOUT))
+        # Kirjautumisen kehotteet ja odotusaika (s)
+        self.login_prompt_re = re.compile(
+            self.env.get('LOGIN_PROMPT_RE', '').strip() or LOGIN_PROMPT_RE)
+        self.password_prompt_re = re.compile(
+            self.env.get('PASSWORD_PROMPT_RE', '').strip() or PASSWORD_PROMPT_RE)
+        self.login_timeout = env_float(self.env, 'LOGIN_TIMEOUT', LOGIN_TIMEOUT)
+        # Toistuvien rivien taitto (/fold): FOLD_SPAM=exact|numbers
+        self.spam_folder = SpamFolder(self.env.get('FOLD_SPAM', 'off').strip().lower())
+        # Tab-täydennys tulosteen sanoista; COMPLETE_WORDS=false ei kerää sanoja
+        self.word_index.enabled = self.env.get('COMPLETE_WORDS', 'true').strip().lower() != 'false'
+        # Gagatut rivit kirjoitetaan silti lokiin jos GAG_LOG=true
+        self.gag_log = self.env.get('GAG_LOG', '').lower() == 'true'
+        # Paikallinen mittaripalvelin: METRICS_PORT (localhost HTTP) ja/tai
+        # METRICS_SOCKET (Unix-socketin polku). Oletuksena pois päältä.
+        try:
+            self.metrics_port = int(self.env.get('METRICS_PORT', '').strip() or -1)
+        except ValueError:
+            self.metrics_port = -1
+        self.metrics_socket = self.env.get('METRICS_SOCKET', '').strip()
 
         # Curses asetukset
         curses.start_color()
@@ -450,18 +2531,19 @@ class BatClient:
 
         return rows
 
-    def build_display_rows(self, width, max_rows=None):
+    def build_display_rows(self, width, max_rows=None, skip_lines=0):
         """Rakenna näyttörivit output_linesista uusimmasta päästä alkaen.
 
         Args:
             width: rivin maksimileveys merkkeinä
             max_rows: kerätään enintään näin monta riviä lopusta (None = kaikki)
+            skip_lines: ohitetaan näin monta uusinta riviä parsimatta
 
         Returns:
             Lista näyttöriveistä vanhimmasta uusimpaan.
         """
         rows = []
-        for line in reversed(self.output_lines):
+        for line in itertools.islice(reversed(self.output_lines), skip_lines, None):
             rows[:0] = self.wrap_segments(self.parse_ansi(line), width)
             if max_rows is not None and len(rows) >= max_rows:
                 break
@@ -481,19 +2563,24 @@ class BatClient:
         total_rows = len(self.build_display_rows(self.width - 1))
         return max(0, total_rows - output_height)
 
-    def add_output(self, text):
+    def write_log(self, text):
+        """Kirjoita teksti lokiin ilman ANSI-koodeja."""
+        try:
+            with self.lag_monitor.activity("lokin kirjoitus"):
+                clean_text = self.strip_ansi(text.replace('\r', ''))
+                self.log_file.write(clean_text)
+                self.log_file.flush()
+        except Exception:
+            pass  # Älä kaada ohjelmaa loggausvirheeseen
+
+    def add_output(self, text, log=True):
         """Lisää tekstiä output-ikkunaan"""
         # Poista CR (telnet käyttää CR+LF, meille riittää LF)
         text = text.replace('\r', '')
 
         # Kirjoita lokiin (ilman ANSI-koodeja)
-        if self.log_file:
-            try:
-                clean_text = self.strip_ansi(text)
-                self.log_file.write(clean_text)
-                self.log_file.flush()
-            except Exception:
-                pass  # Älä kaada ohjelmaa loggausvirheeseen
+        if self.log_file and log:
+            self.write_log(text)
 
         # Käsittele rivinvaihdot
         lines = text.split('\n')
@@ -505,30 +2592,64 @@ class BatClient:
         for line in lines:
             # Poista muut kontrollimerkit paitsi ANSI (ESC)
             clean_line = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1a\x1c-\x1f]', '', line)
+            if self.spam_folder.mode != "off":
+                if not self.output_lines:
+                    self.spam_folder.reset()
+                folded = self.spam_folder.fold(clean_line, self.stripped_line(clean_line))
+                if folded is not None:
+                    # Päivitä edellinen rivi paikallaan, ei uutta riviä puskuriin
+                    self.output_lines[-1] = folded
+                    continue
             self.output_lines.append(clean_line)
+            self.lines_appended += 1
 
         self.refresh_output()
 
-    def refresh_output(self):
-        """Päivitä output-ikkuna"""
-        self.output_win.erase()
+    def scrolled_rows(self, width, output_height):
+        """Rakenna scroll_offsetin kohdalla näkyvät näyttörivit.
 
-        output_height = self.height - 2
+        Kokonaan näkymän alapuolelle jäävistä riveistä tarvitaan vain
+        rivimäärä, joten ne lasketaan välimuistista (line_rows) parsimatta.
+
+        Returns:
+            (rivit, ohitettujen näyttörivien määrä)
+        """
+        skipped = 0
+        skip_lines = 0
+        if self.scroll_offset > 0:
+            for line in reversed(self.output_lines):
+                line_rows = self.line_rows(line, width)
+                if skipped + line_rows > self.scroll_offset:
+                    break
+                skipped += line_rows
+                skip_lines += 1
 
         # Pitkät rivit wrapataan, joten haetaan näyttörivejä sen verran kuin
-        # ruudulle mahtuu plus scrollauksen verran taaksepäin
+        # ruudulle mahtuu plus loput scrollauksesta taaksepäin
         rows = self.build_display_rows(
-            self.width - 1,
-            max_rows=output_height + self.scroll_offset
+            width,
+            max_rows=output_height + self.scroll_offset - skipped,
+            skip_lines=skip_lines
         )
+        return rows, skipped
+
+    def refresh_output(self):
+        """Päivitä output-ikkuna"""
+        trace_start = self.tracer.start()
+        self.output_win.erase()
+
+        output_height = self.height - 2
+        width = self.width - 1
+        rows, skipped = self.scrolled_rows(width, output_height)
 
         # Älä anna scrollin jäädä puskurin ulkopuolelle (esim. ikkunan koon
         # muuttuessa tai kun rivit wrappautuvat eri tavalla)
-        max_offset = max(0, len(rows) - output_height)
+        max_offset = max(0, skipped + len(rows) - output_height)
         if self.scroll_offset > max_offset:
             self.scroll_offset = max_offset
+            rows, skipped = self.scrolled_rows(width, output_height)
 
-        end = len(rows) - self.scroll_offset
+        end = len(rows) - (self.scroll_offset - skipped)
         start = max(0, end - output_height)
 
         for i, row in enumerate(rows[start:end]):
@@ -543,6 +2664,7 @@ class BatClient:
                 col += len(text)
 
         self.output_win.noutrefresh()
+        self.tracer.record("render", trace_start)
 
     def refresh_status(self):
         """Päivitä status bar"""
@@ -553,6 +2675,9 @@ class BatClient:
             conn_status = f"RECONNECTING {self.reconnect_attempt}/{self.reconnect_max_attempts}"
         elif self.reader is not None and self.writer is not None:
             conn_status = "CONNECTED"
+            rtt = self.link_probe.status()
+            if rtt:
+                conn_status += f" {rtt}"
         else:
             conn_status = "DISCONNECTED"
 
@@ -563,6 +2688,10 @@ class BatClient:
             status += " | 🐛" if self.status_emoji else " | DBG"
         if self.scroll_offset > 0:
             status += f" | ↑{self.scroll_offset}"
+        if self.search and self.search.matches:
+            more = "" if self.search.done else "+"
+            status += (f" | HAKU {self.search.position + 1}/"
+                       f"{len(self.search.matches)}{more}")
         # Täytä koko rivi välilyönneillä jotta tausta on yhtenäinen
         status = status.ljust(self.width - 1)
         try:
@@ -575,6 +2704,131 @@ class BatClient:
         """Poista ANSI-koodit tekstistä"""
         return re.sub(r'\x1b\[[0-9;]*m', '', text)
 
+    def stripped_line(self, line):
+        """Palauta rivi ilman ANSI-koodeja välimuistista.
+
+        Sama rivi haetaan usein monta kertaa (toistuvat haut), joten
+        strippaus tehdään vain kerran. Välimuisti tyhjennetään kun se
+        kasvaa puskuria selvästi suuremmaksi.
+        """
+        stripped = self.strip_cache.get(line)
+        if stripped is None:
+            if len(self.strip_cache) > 2 * (self.output_lines.maxlen or 10000):
+                self.strip_cache.clear()
+            stripped = self.strip_ansi(line)
+            self.strip_cache[line] = stripped
+        return stripped
+
+    def line_rows(self, line, width):
+        """Palauta montako näyttöriviä rivi vie leveydellä width, välimuistista.
+
+        Katkaisukohta riippuu vain näkyvistä merkeistä, joten lasketaan
+        ANSI-koodeista riisutusta rivistä ilman parse_ansi():a. Haun osumaan
+        hyppääminen laskee kaikki osuman alapuoliset rivit; välimuistin
+        ansiosta vain ensimmäinen hyppy (tai leveyden muutos) maksaa.
+        """
+        if width != self.row_cache_width:
+            self.row_cache.clear()
+            self.row_cache_width = width
+        rows = self.row_cache.get(line)
+        if rows is None:
+            if len(self.row_cache) > 2 * (self.output_lines.maxlen or 10000):
+                self.row_cache.clear()
+            rows = len(self.wrap_segments([(self.stripped_line(line), 0)], width))
+            self.row_cache[line] = rows
+        return rows
+
+    def first_line_number(self):
+        """Absoluuttinen rivinumero output_linesin vanhimmalle riville."""
+        return self.lines_appended - len(self.output_lines)
+
+    def start_search(self, regex):
+        """Aloita vierityspuskurin haku taustalla.
+
+        Raises:
+            re.error: jos lauseke on virheellinen
+        """
+        pattern = re.compile(regex)
+        self.cancel_search()
+        self.search = ScrollbackSearch(pattern)
+        self.search_task = asyncio.create_task(self.scan_scrollback(self.search))
+        return self.search
+
+    def cancel_search(self):
+        """Lopeta käynnissä oleva haku ja unohda osumat."""
+        if self.search_task and not self.search_task.done():
+            self.search_task.cancel()
+        self.search_task = None
+        self.search = None
+
+    async def scan_scrollback(self, search):
+        """Käy puskuri läpi uusimmasta vanhimpaan paloissa.
+
+        Palojen välissä annetaan vuoro muille tehtäville. Ensimmäiseen
+        osumaan hypätään heti, loput kerätään indeksiin taustalla.
+        """
+        seq = self.lines_appended - 1  # Hakua myöhemmin tulleita ei haeta
+        try:
+            while seq >= 0:
+                base = self.first_line_number()
+                if seq < base:
+                    break  # Loput ovat jo pudonneet puskurista
+                stop = max(base, seq - SEARCH_CHUNK_LINES + 1)
+                for n in range(seq, stop - 1, -1):
+                    line = self.output_lines[n - base]
+                    if search.pattern.search(self.stripped_line(line)):
+                        search.matches.append(n)
+                        if len(search.matches) == 1:
+                            self.search_step(1)
+                seq = stop - 1
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            return
+        search.done = True
+        if not search.matches:
+            self.add_output(f"*** Ei osumia: {search.pattern.pattern} ***\n")
+        self.refresh_status()
+        curses.doupdate()
+
+    def search_step(self, direction):
+        """Siirry hakuosumaan: 1 = vanhempi osuma, -1 = uudempi.
+
+        Returns:
+            bool: True jos osumaan hypättiin
+        """
+        search = self.search
+        if not search or not search.matches:
+            return False
+        position = search.position + direction
+        base = self.first_line_number()
+        # Ohita osumat jotka ovat jo pudonneet puskurista
+        while 0 <= position < len(search.matches) and search.matches[position] < base:
+            position += direction
+        if not 0 <= position < len(search.matches):
+            return False
+        search.position = position
+        self.scroll_to_line(search.matches[position])
+        return True
+
+    def scroll_to_line(self, seq):
+        """Vieritä niin että absoluuttinen rivi seq näkyy ruudun keskellä."""
+        index = seq - self.first_line_number()
+        if index < 0 or index >= len(self.output_lines):
+            return
+        width = self.width - 1
+        rows_below = sum(self.line_rows(line, width)
+                         for line in itertools.islice(self.output_lines, index + 1, None))
+        line_rows = self.line_rows(self.output_lines[index], width)
+        output_height = self.height - 2
+        self.scroll_offset = max(0, rows_below - max(0, output_height - line_rows) // 2)
+        self.refresh_output()
+        self.refresh_status()
+
+    def history_search_prompt(self):
+        """Ctrl-R-tilan kehote, esim. "(r-haku) 'he': "."""
+        query, _match, _span, found = self.history_search_states[-1]
+        return f"(r-haku{'' if found else ' ei löydy'}) '{query}': "
+
     def get_prompt_display_length(self):
         """Laske promptin näyttöpituus (ilman ANSI-koodeja)"""
         return len(self.strip_ansi(self.mud_prompt))
@@ -583,8 +2837,15 @@ class BatClient:
         """Päivitä input-ikkuna MUD-promptilla"""
         self.input_win.erase()
 
-        # Käytä MUD:n promptia jos se on asetettu, muuten "> "
-        if self.mud_prompt:
+        # Hakutilassa kysytään lauseketta, muuten MUD:n prompt tai "> "
+        if self.search_mode or self.history_search_mode:
+            prompt = "haku: " if self.search_mode else self.history_search_prompt()
+            try:
+                self.input_win.addstr(0, 0, prompt, curses.A_BOLD)
+            except curses.error:
+                pass
+            prompt_len = len(prompt)
+        elif self.mud_prompt:
             # Näytä prompt väreineen
             prompt_col = 0
             parsed = self.parse_ansi(self.mud_prompt)
@@ -658,11 +2919,8 @@ class BatClient:
         self.add_output(f"*** Yhdistetään palvelimeen {host}:{port}... ***\n")
         curses.doupdate()  # Päivitä näyttö heti
         try:
-            # Yhteyden muodostus timeoutilla (10 sekuntia)
-            self.reader, self.writer = await asyncio.wait_for(
-                asyncio.open_connection(host, port),
-                timeout=10.0
-            )
+            # Yhteyden muodostus timeoutilla (CONNECT_TIMEOUT)
+            await self.open_server(host, port)
             self.add_output("*** TCP-yhteys muodostettu, odotetaan palvelimen vastausta... ***\n")
             curses.doupdate()  # Päivitä näyttö heti
 
@@ -678,6 +2936,7 @@ class BatClient:
                     return False
 
                 # Palvelin vastasi - käsittele ensimmäinen data
+                self.bytes_received += len(first_data)
                 self.add_output("*** Yhteys muodostettu! ***\n")
                 self.intentional_disconnect = False
 
@@ -713,20 +2972,28 @@ class BatClient:
             self.add_output(f"*** Yhteysvirhe: {e} ***\n")
             return False
 
+    def start_profiler(self, hz=None):
+        """Käynnistä näytteistävä profiloija pääsäikeelle ja palauta se."""
+        if self.profiler:
+            self.profiler.stop()
+        self.profiler = SamplingProfiler(hz=hz or PROFILE_DEFAULT_HZ)
+        self.profiler.start()
+        return self.profiler
+
+    def logs_path(self):
+        """Palauta logs-kansion polku (.env:n LOG_DIR tai projektin logs/)."""
+        if self.log_dir:
+            return Path(self.log_dir)
+        return Path(__file__).resolve().parent / "logs"
+
     def start_auto_log(self):
         """Käynnistä automaattinen loggaus jos asetettu .env:ssä."""
         if not self.auto_log:
             return
 
         from datetime import datetime
-        from pathlib import Path
-
-        # Määritä logs-kansio
-        if self.log_dir:
-            logs_dir = Path(self.log_dir)
-        else:
-            logs_dir = Path(__file__).resolve().parent / "logs"
 
+        logs_dir = self.logs_path()
         logs_dir.mkdir(exist_ok=True)
 
         # Luo tiedostonimi
@@ -747,18 +3014,136 @@ class BatClient:
         except Exception as e:
             self.add_output(f"*** Auto-log virhe: {e} ***\n")
 
+    async def open_server(self, host, port):
+        """Avaa yhteys palvelimeen ja nollaa yhteyskohtainen tila.
+
+        Yhteinen connect(), reconnect_loop() ja /connect -komennolle:
+        DNS-välimuisti, rinnakkaiset osoitteet, TCP_NODELAY ja keepalive.
+        """
+        self.reader, self.writer = await self.connector.open(host, port)
+        self.reset_session()
+
+    def reset_session(self):
+        """Nollaa yhteyskohtainen tila uuden yhteyden alussa."""
+        self.echo_off = False
+        self.prompts_seen = 0
+        self.link_probe.new_connection()
+        self.partial_line = ""
+        self.mud_prompt = ""
+        self.last_server_text = ""
+
+    def server_tail_matches(self, pattern):
+        """Osuuko kuvio palvelimen viimeisimpään tekstiin (kesken oleva rivi,
+        prompt tai viimeinen valmis rivi)."""
+        last_line = self.last_server_text.rstrip('\r\n').rsplit('\n', 1)[-1]
+        return any(pattern.search(self.strip_ansi(tail).rstrip())
+                   for tail in (self.partial_line, self.mud_prompt, last_line) if tail)
+
+    async def wait_server(self, ready, timeout):
+        """Odota kunnes ready() on tosi; tarkistetaan aina kun dataa saapuu.
+
+        Returns:
+            True jos ehto täyttyi, False jos aika loppui tai yhteys katkesi
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not ready():
+            remaining = deadline - loop.time()
+            if self.writer is None or remaining <= 0:
+                return False
+            self.server_event.clear()
+            try:
+                await asyncio.wait_for(self.server_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return ready()
+        return True
+
     async def auto_login(self):
-        """Automaattinen kirjautuminen .env tiedoista"""
-        if self.username and self.password:
-            self.add_output("*** Automaattinen kirjautuminen... ***\n")
-            # Odota hetki että palvelin on valmis
-            await asyncio.sleep(1.0)
-            await self.send_command(self.username)
-            await asyncio.sleep(0.5)
-            await self.send_command(self.password, is_password=True)
-        elif self.username:
-            await asyncio.sleep(1.0)
-            await self.send_command(self.username)
+        """Automaattinen kirjautuminen .env tiedoista.
+
+        Tunnus lähetetään heti kun palvelin kysyy sitä ja salasana vasta
+        kun palvelin kytkee echon pois (WILL ECHO) tai kysyy salasanaa.
+        Muu välikysymys ("Create a new character?") ei vapauta salasanaa,
+        eikä salasanaa lähetetä sokkona aikarajan jälkeen.
+        """
+        if not self.username:
+            return
+        self.add_output("*** Automaattinen kirjautuminen... ***\n")
+
+        def login_ready():
+            return self.prompts_seen > 0 or self.server_tail_matches(self.login_prompt_re)
+
+        if not await self.wait_server(login_ready, self.login_timeout):
+            if self.writer is None:
+                return
+            self.add_output("*** Kirjautumiskehotetta ei tunnistettu - lähetetään tunnus ***\n")
+        await self.send_command(self.username)
+        if not self.password:
+            return
+
+        def password_ready():
+            return self.echo_off or self.server_tail_matches(self.password_prompt_re)
+
+        if not await self.wait_server(password_ready, self.login_timeout):
+            if self.writer is not None:
+                self.add_output("*** Salasanakehotetta ei tunnistettu - kirjoita salasana itse ***\n")
+            return
+        await self.send_command(self.password, is_password=True)
+
+    async def ping_loop(self):
+        """Lähetä koetin link_probe.interval välein ja mittaa vastausaika.
+
+        Puoliavoin yhteys (palvelin ei enää vastaa, mutta reader.read ei
+        palauta tyhjää) katkaistaan ja uudelleenyhdistys alkaa heti.
+
+        Komentokoetin (PING_COMMAND) kulkee lähtevän jonon kautta
+        PRIORITY_BULK-luokassa, jotta se kuluttaa nopeusrajaa kuten palvelimen
+        tulvasuojakin sen laskee eikä ohita jonottavia komentoja. Kun jonossa
+        on jo komentoja, kierros jätetään väliin.
+        """
+        probe = self.link_probe
+        loop = asyncio.get_running_loop()
+        try:
+            while self.running:
+                await asyncio.sleep(probe.interval)
+                writer = self.writer
+                if writer is None:
+                    continue
+                if probe.command and self.outbound.pending():
+                    continue  # Jonotusaika näkyisi RTT:nä
+                # Komentokoettimelle vastaus on mikä tahansa palvelimen data
+                event = self.server_event if probe.command else self.ping_event
+                event.clear()
+                bytes_before = self.bytes_received
+
+                async def roundtrip():
+                    if probe.command:
+                        self.outbound.push([probe.command], PRIORITY_BULK)
+                        await self.flush_outbound()
+                    else:
+                        writer.write(probe.payload)
+                        await writer.drain()  # Täysi lähetyspuskuri kuuluu myös aikarajaan
+                    await event.wait()
+
+                sent = loop.time()
+                probe.sent += 1
+                try:
+                    await asyncio.wait_for(roundtrip(), probe.timeout)
+                except asyncio.TimeoutError:
+                    if writer is not self.writer:
+                        continue
+                    if probe.miss(self.bytes_received != bytes_before):
+                        self.close_connection()
+                        self.handle_connection_lost(
+                            f"Palvelin ei vastannut {probe.misses} koettimeen - yhteys katkennut")
+                    continue
+                except (ConnectionError, OSError):
+                    continue  # read_from_server huomaa katkoksen
+                probe.observe(loop.time() - sent)
+                self.refresh_status()
+                curses.doupdate()
+        except asyncio.CancelledError:
+            pass
 
     def cancel_reconnect(self):
         """Peruuta käynnissä oleva uudelleenyhdistys."""
@@ -778,6 +3163,8 @@ class BatClient:
         """
         self.reader = None
         self.writer = None
+        self.outbound.clear()  # Jonossa olleet eivät kuulu uuteen yhteyteen
+        self.automapper.reset()
 
         # Käyttäjän tarkoituksellinen katkaisu - älä meluta äläkä yhdistä
         if self.intentional_disconnect:
@@ -818,10 +3205,7 @@ class BatClient:
 
                 host, port = self.resolve_host_port()
                 try:
-                    self.reader, self.writer = await asyncio.wait_for(
-                        asyncio.open_connection(host, port),
-                        timeout=10.0
-                    )
+                    await self.open_server(host, port)
                     self.intentional_disconnect = False
                     self.reconnecting = False
                     self.reconnect_attempt = 0
@@ -851,6 +3235,110 @@ class BatClient:
             )
             curses.doupdate()
 
+    def output_server_text(self, text):
+        """Tulosta palvelimen valmiit rivit ja aja niille triggerit.
+
+        /gag ja /subst ajetaan ennen tulostusta; triggerit näkevät silti
+        palvelimen alkuperäisen tekstin.
+        """
+        self.last_server_text = text
+        shown = text
+        log = True
+        if self.output_filter.triggers:
+            shown = self.filter_output(text)
+            if self.gag_log and self.log_file and shown != text:
+                self.write_log(text)  # Lokiin alkuperäinen teksti
+                log = False
+        if shown:
+            self.add_output(shown, log=log)
+        if (self.triggers.triggers or self.stream_matcher.patterns or self.automapper.enabled
+                or self.word_index.enabled):
+            self.check_triggers(text)
+
+    def filter_output(self, text):
+        """Aja /gag- ja /subst-säännöt valmiille riveille.
+
+        Returns:
+            Näytettävä teksti, josta gagatut rivit puuttuvat
+        """
+        lines = text.split('\n')
+        tail = lines.pop()  # Tyhjä kun teksti päättyy rivinvaihtoon
+        kept = []
+        for line in lines:
+            line = line.replace('\r', '')
+            try:
+                line = self.output_filter.apply(line, self.stripped_line)
+            except re.error as e:
+                self.add_output(f"*** Virhe: /gag- tai /subst-sovitus epäonnistui: {e} ***\n")
+            if line is not None:
+                kept.append(line + '\n')
+        kept.append(tail)
+        return ''.join(kept)
+
+    def check_triggers(self, text):
+        """Sovita jokainen rivi triggereihin ja käynnistä osuneiden toiminnot.
+
+        Moniriviset kuviot saavat saman puhdistetun rivin; niiden
+        käsittelijät käynnistyvät StreamMatcherin omina taskeina.
+        """
+        lines = text.replace('\r', '').split('\n')
+        if lines and lines[-1] == '':
+            lines.pop()
+        for line in lines:
+            stripped = self.stripped_line(line)
+            if self.triggers.triggers:
+                try:
+                    hits = self.triggers.match(stripped)
+                except re.error as e:
+                    # Ei saa katkaista yhteyttä (read_from_serverin except)
+                    hits = []
+                    self.add_output(f"*** Virhe: Triggerien sovitus epäonnistui: {e} ***\n")
+                for trigger, match in hits:
+                    trigger.hits += 1
+                    started = time.monotonic()
+                    self.fire_trigger(trigger, match)
+                    trigger.action_time += time.monotonic() - started
+            if self.stream_matcher.patterns:
+                self.stream_matcher.feed(stripped)
+            if self.word_index.enabled:
+                self.word_index.add_line(stripped)
+            if self.automapper.enabled:
+                try:
+                    self.automapper.on_line(stripped)
+                except (MapError, sqlite3.Error) as e:
+                    self.automapper.enabled = False
+                    self.add_output(f"*** Virhe: Automappari pois päältä: {e} ***\n")
+
+    def add_multiline_trigger(self, steps, action, max_gap=MULTILINE_MAX_GAP):
+        """Lisää monirivinen triggeri (askeleet regexeinä järjestyksessä).
+
+        Raises:
+            re.error: jos jokin askel on virheellinen
+        """
+        trigger = self.triggers.add_multiline(steps, action)
+
+        async def handler(match):
+            trigger.hits += 1
+            self.fire_trigger(trigger, match)
+
+        trigger.stream_pattern = self.stream_matcher.add(steps, handler, max_gap)
+        return trigger
+
+    def remove_trigger(self, trigger_id):
+        """Poista triggeri (yksi- tai monirivinen). True jos se oli olemassa."""
+        trigger = self.triggers.triggers.get(trigger_id)
+        if trigger is not None and trigger.stream_pattern is not None:
+            self.stream_matcher.remove(trigger.stream_pattern)
+        return self.triggers.remove(trigger_id)
+
+    def fire_trigger(self, trigger, match):
+        """Jonota triggerin toiminto (komento palvelimelle tai /komento).
+
+        ActionScheduler yhdistää toistot ja rajoittaa nopeutta.
+        """
+        command = trigger.expand_action(match)
+        self.action_scheduler.submit(command, trigger.cooldown)
+
     def process_server_text(self, text, prompt_detected):
         """Käsittele palvelimelta tullut teksti.
 
@@ -862,16 +3350,23 @@ class BatClient:
             text: Telnet-komennoista puhdistettu teksti
             prompt_detected: Tuliko datan mukana IAC GA/EOR
         """
+        trace_start = self.tracer.start()
+
+        self.lines_received += text.count('\n')
+
         # Yhdistä edellinen keskeneräinen rivi
         text = self.partial_line + text
         self.partial_line = ""
 
+        self.server_event.set()
         if prompt_detected:
+            self.prompts_seen += 1
+            self.prompt_event.set()
             # Etsi viimeinen rivinvaihto - sen jälkeinen teksti on prompt
             last_newline = text.rfind('\n')
             if last_newline >= 0:
                 # Tulosta kaikki ennen promptia
-                self.add_output(text[:last_newline + 1])
+                self.output_server_text(text[:last_newline + 1])
                 # Tallenna prompt
                 self.mud_prompt = text[last_newline + 1:]
             else:
@@ -883,12 +3378,14 @@ class BatClient:
             if text and not text.endswith('\n'):
                 last_newline = text.rfind('\n')
                 if last_newline >= 0:
-                    self.add_output(text[:last_newline + 1])
+                    self.output_server_text(text[:last_newline + 1])
                     self.partial_line = text[last_newline + 1:]
                 else:
                     self.partial_line = text
             else:
-                self.add_output(text)
+                self.output_server_text(text)
+
+        self.tracer.record("process", trace_start)
 
     async def read_from_server(self):
         """Lue dataa palvelimelta"""
@@ -907,6 +3404,8 @@ class BatClient:
                     if not data:
                         self.handle_connection_lost("Yhteys katkennut")
                         continue
+                    trace_start = self.tracer.start()
+                    self.bytes_received += len(data)
 
                     # Debug: näytä raakadata luettavassa muodossa
                     if self.debug_mode:
@@ -924,6 +3423,7 @@ class BatClient:
 
                     self.refresh_status()
                     curses.doupdate()
+                    self.tracer.record("server", trace_start)
 
                 except asyncio.TimeoutError:
                     pass
@@ -996,13 +3496,19 @@ class BatClient:
                             # Palvelin hoitaa echon (salasana) - vastaa DO
                             response = bytes([IAC, DO, TELOPT_ECHO])
                             self.echo_off = True
+                        elif opt == TELOPT_TM:
+                            # Vastaus RTT-koettimeen - ei kuitata
+                            response = None
+                            self.ping_event.set()
                         else:
                             # Muut - vastaa DONT
                             response = bytes([IAC, DONT, opt])
-                        if self.writer:
+                        if self.writer and response:
                             self.writer.write(response)
 
                     elif cmd == WONT:
+                        if opt == TELOPT_TM:
+                            self.ping_event.set()  # Vastaus RTT-koettimeen
                         if opt == TELOPT_ECHO:
                             # Palvelin ei enää hoida echoa - vastaa DONT
                             response = bytes([IAC, DONT, TELOPT_ECHO])
@@ -1072,15 +3578,44 @@ class BatClient:
             # Etsi komento moduuleista ja luo instanssi
             command = cmds.create_command(cmd_name, self)
             if command:
-                result = await command.execute(args)
+                result = await self.lag_monitor.timed(f"/{cmd_name}", command.execute(args))
                 if result is False:
                     return False
             else:
                 self.add_output(f"*** Tuntematon komento: /{cmd_name} - kirjoita /help ***\n")
 
-        self.refresh_output()
+        with self.lag_monitor.activity("uudelleenpiirto"):
+            self.refresh_output()
         return True
 
+    async def start_metrics_server(self):
+        """Käynnistä paikallinen Prometheus-mittaripalvelin."""
+        port = self.metrics_port if self.metrics_port >= 0 else None
+        server = MetricsServer(self, port=port, path=self.metrics_socket or None)
+        try:
+            await server.start()
+        except OSError as e:
+            await server.close()
+            self.add_output(f"*** Mittaripalvelimen käynnistys epäonnistui: {e} ***\n")
+            return
+        self.metrics_server = server
+        # Render- ja käsittelyajat tulevat latenssimittauksesta
+        self.tracer.enabled = True
+        for address in server.addresses():
+            self.add_output(f"*** Mittarit: {address} ***\n")
+
+    def on_lag_spike(self, lag, cause):
+        """Viivevahdin piikki: näytä debug-tilassa."""
+        if self.debug_mode:
+            self.add_output(
+                f"[DEBUG] Silmukka jumissa {lag * 1000:.0f} ms ({cause})\n")
+            curses.doupdate()
+
+    def on_timer_error(self, callback, error):
+        """Ajastettu kutsu kaatui: näytä virhe, muut ajastukset jatkavat."""
+        name = getattr(callback, "__qualname__", repr(callback))
+        self.add_output(f"*** Virhe: Ajastus {name} kaatui: {error!r} ***\n")
+
     async def send_command(self, cmd, is_password=False):
         """Lähetä komento palvelimelle.
 
@@ -1090,41 +3625,639 @@ class BatClient:
                 Silloin komentoa ei talleteta historiaan riippumatta siitä
                 onko palvelin ehtinyt neuvotella ECHO-option päälle.
         """
+        await self.send_commands([cmd], secret=(0,) if is_password else ())
+
+    async def send_commands(self, commands, secret=(), priority=PRIORITY_USER):
+        """Lähetä monta komentoa yhdellä kirjoituksella ja yhdellä drainilla.
+
+        Komennot kulkevat prioriteettijonon ja nopeusrajan kautta; se mikä
+        ei nyt mahdu lähtee ajastetusti myöhemmin. Historiaan tallennetaan
+        komennot yksitellen samoin säännöin kuin send_command: ei tyhjiä,
+        ei kun ECHO on pois, ei salaisia. Automaation (triggerit, ajastimet,
+        kävely) komennot eivät mene historiaan.
+
+        Args:
+            commands: Lähetettävät komennot
+            secret: Salasanakomentojen indeksit (ei historiaan)
+            priority: PRIORITY_USER, PRIORITY_ACTION tai PRIORITY_BULK
+        """
         if self.writer is None or self.reader is None:
             self.add_output("\n*** Ei yhteyttä palvelimelle - käytä /connect ***\n")
             return
 
+        # Lisää käyttäjän komennot historiaan (ei salasanoja)
+        if not self.echo_off and priority == PRIORITY_USER:
+            for i, cmd in enumerate(commands):
+                if cmd.strip() and i not in secret:
+                    self.command_history.append(cmd)
+            self.history_index = -1
+            if self.command_history.needs_index() and (
+                    self.history_task is None or self.history_task.done()):
+                self.history_task = asyncio.create_task(self.index_history())
+
+        if self.automapper.enabled:
+            for cmd in commands:
+                self.automapper.on_command(cmd)
+
+        # ECHO pois = palvelin kysyy salasanaa: kaikki rivit ovat salaisia
+        hidden = range(len(commands)) if self.echo_off else secret
+        self.outbound.push(commands, priority, hidden)
+        await self.flush_outbound()
+
+    def start_walk(self, steps, paced=False):
+        """Aloita speedwalk taustalla. Edellinen kävely perutaan.
+
+        Args:
+            steps: Liikkumiskomennot järjestyksessä
+            paced: Odota promptia (IAC GA/EOR) jokaisen askeleen jälkeen
+        """
+        self.cancel_walk()
+        self.walk_progress = (0, len(steps))
+        self.walk_task = asyncio.create_task(self._walk(list(steps), paced))
+        return self.walk_task
+
+    def cancel_walk(self):
+        """Peru käynnissä oleva kävely ja sen jonottavat askeleet.
+
+        Returns:
+            True jos kävely oli käynnissä
+        """
+        running = self.walk_task is not None and not self.walk_task.done()
+        if running:
+            self.walk_task.cancel()
+        self.walk_task = None
+        self.outbound.clear(PRIORITY_BULK)
+        return running
+
+    async def _walk(self, steps, paced):
+        total = len(steps)
+        done = 0
+        if paced:
+            while done < total:
+                self.prompt_event.clear()
+                await self.send_commands([steps[done]], priority=PRIORITY_BULK)
+                done += 1
+                self.walk_progress = (done, total)
+                if done == total:
+                    break
+                try:
+                    await asyncio.wait_for(self.prompt_event.wait(), WALK_PROMPT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.add_output("*** Ei promptia - loput askeleet kerralla ***\n")
+                    break
+        # Loput yhtenä eränä (ilman tahdistusta koko polku)
+        if done < total:
+            await self.send_commands(steps[done:], priority=PRIORITY_BULK)
+            self.walk_progress = (total, total)
+
+    def _outbound_due(self):
+        """TimerHeap: tokeneita on taas, lähetä jonoa eteenpäin."""
+        self.outbound_wakeup = None
+        self.outbound_task = asyncio.create_task(self.flush_outbound())
+
+    async def flush_outbound(self):
+        """Kirjoita jonosta kaikki mitä nopeusraja nyt sallii, yhdellä drainilla."""
+        now = self.timers.time()
+        commands = self.outbound.take(now)
+        if self.outbound.pending() and self.outbound_wakeup is None:
+            self.outbound_wakeup = self.timers.push(
+                self.outbound.next_ready(now), self._outbound_due)
+        if not commands or self.writer is None:
+            return
+
         try:
-            self.writer.write((cmd + "\n").encode('iso-8859-1'))
+            data = "".join(cmd + "\n" for cmd in commands).encode('iso-8859-1')
+            self.writer.write(data)
             await self.writer.drain()
-
-            # Lisää komento historiaan (ei salasanoja)
-            if cmd.strip() and not self.echo_off and not is_password:
-                self.command_history.append(cmd)
-                self.history_index = -1
+            self.tracer.finish("input")
         except Exception as e:
             self.add_output(f"\nLähetysvirhe: {e}\n")
             self.reader = None
             self.writer = None
+            self.outbound.clear()
             self.refresh_status()
 
     def expand_alias(self, cmd):
-        """Laajenna alias jos löytyy."""
-        if not cmd or not self.user_aliases:
-            return cmd
+        """Laajenna alias jos löytyy. Useampi komento yhdistetään ';':lla.
 
-        # Tarkista onko ensimmäinen sana alias
-        parts = cmd.split(maxsplit=1)
-        first_word = parts[0]
+        Raises:
+            AliasError: ks. AliasEngine.expand
+        """
+        return ';'.join(self.expand_commands(cmd))
+
+    def expand_commands(self, cmd):
+        """Laajenna rivi aliaksineen komentolistaksi.
+
+        Raises:
+            AliasError: ks. AliasEngine.expand
+        """
+        return self.alias_engine.expand(cmd, self.user_aliases)
+
+    async def execute_line(self, cmd, priority=PRIORITY_USER):
+        """Suorita syöterivi kuten Enter: //, /komento tai palvelimelle.
+
+        Käytetään sekä näppäimistöltä että triggereistä ym. automaatiosta;
+        automaatio antaa matalamman prioriteetin lähtevälle jonolle.
+
+        Returns:
+            bool: False jos client pitää sulkea (/quit)
+        """
+        return await self.execute_lines([cmd], priority)
+
+    async def execute_lines(self, lines, priority=PRIORITY_USER):
+        """Suorita rivit järjestyksessä kuten execute_line.
+
+        Peräkkäiset palvelinkomennot (myös aliasten laajennukset) lähetetään
+        yhtenä eränä; /komento välissä lähettää kertyneen erän ensin.
+
+        Returns:
+            bool: False jos client pitää sulkea (/quit)
+        """
+        batch = []
+        for line in lines:
+            if line.startswith('/'):
+                commands = [line]
+            else:
+                # Alias voi tuottaa useita komentoja, myös /client-komentoja
+                try:
+                    commands = self.expand_commands(line)
+                except AliasError as e:
+                    self.add_output(f"*** Virhe: Alias: {e} ***\n")
+                    continue
+            for command in commands:
+                if command.startswith('//'):
+                    # // -> lähetä palvelimelle yhdellä /
+                    batch.append(command[1:])
+                elif command.startswith('/'):
+                    if batch:
+                        await self.send_commands(batch, priority=priority)
+                        batch = []
+                    if not await self.handle_client_command(command):
+                        return False
+                else:
+                    # Palvelimelle (myös tyhjä rivi)
+                    batch.append(command)
+        if batch:
+            await self.send_commands(batch, priority=priority)
+        return True
+
+    async def load_history(self):
+        """Lue historiatiedoston loppu ja rakenna Ctrl-R-indeksi taustasäikeessä."""
+        history = self.command_history
+        if not history.loaded:
+            loop = asyncio.get_running_loop()
+            try:
+                lines = await loop.run_in_executor(None, history.read)
+            except OSError as e:
+                self.add_output(f"*** Historiaa ei voitu lukea: {e} ***\n")
+                lines = []
+            history.merge(lines)
+        await self.index_history()
+
+    async def index_history(self):
+        """Rakenna hakuindeksi historian kopiosta; haku toimii sillä välin ilman sitä."""
+        history = self.command_history
+        snapshot = list(history.entries)
+        generation = history.generation
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(None, build_index, snapshot)
+        history.set_index(index, len(snapshot), generation)
+
+    def completion_candidates(self, prefix, first_word):
+        """Täydennysehdokkaat: ensimmäiselle sanalle client-komennot ja aliakset,
+        muuten (ja niiden jälkeen) tulosteen sanat painavin ensin."""
+        candidates = []
+        if first_word and prefix.startswith('/'):
+            names = set(cmds.get_all_commands()) | set(cmds.get_aliases())
+            word = prefix[1:].lower()
+            return ['/' + name for name in sorted(names) if name.startswith(word) and name != word]
+        if first_word:
+            lower = prefix.lower()
+            candidates.extend(name for name in sorted(self.user_aliases)
+                              if name.lower().startswith(lower) and name != prefix)
+        for word in self.word_index.complete(prefix):
+            if word not in candidates:
+                candidates.append(word)
+        return candidates
+
+    def complete_word(self):
+        """Tab: täydennä kursorin edessä oleva sana; uusi Tab vaihtaa ehdokasta.
+
+        Kierros palaa lopuksi alkuperäiseen sanaan.
+        """
+        if self.completion is None:
+            start = self.cursor_pos
+            while start > 0 and not self.input_buffer[start - 1].isspace():
+                start -= 1
+            prefix = self.input_buffer[start:self.cursor_pos]
+            if not prefix:
+                return
+            candidates = self.completion_candidates(prefix, not self.input_buffer[:start].strip())
+            if not candidates:
+                return
+            self.completion = [start, prefix, candidates + [prefix], -1]
+
+        start, prefix, candidates, current = self.completion
+        end = self.cursor_pos
+        current = (current + 1) % len(candidates)
+        word = candidates[current]
+        self.input_buffer = self.input_buffer[:start] + word + self.input_buffer[end:]
+        self.cursor_pos = start + len(word)
+        self.completion[3] = current
+        self.refresh_input()
+
+    def history_step(self, older):
+        """Ctrl-P / Ctrl-N: selaa historiaa yksi komento kerrallaan."""
+        history = self.command_history
+        if older:
+            found = history.previous(None if self.history_index < 0 else self.history_index)
+            if found is None:
+                return
+        elif self.history_index < 0:
+            return
+        else:
+            found = history.next(self.history_index) or (-1, "")
+        self.history_index, self.input_buffer = found
+        self.cursor_pos = len(self.input_buffer)
+        self.refresh_input()
+
+    def start_history_search(self):
+        """Ctrl-R: aloita käänteinen haku historiasta."""
+        self.history_search_mode = True
+        self.history_search_states = [("", None, None, True)]
+        self.history_saved_input = self.input_buffer
+        self.refresh_input()
+
+    def history_search_update(self, query, older=False):
+        """Hae uusi tila: tarkentuva haku tai (older) seuraava vanhempi osuma.
+
+        Epäonnistunut haku pitää edellisen osuman ja jää pinoon, jotta
+        Backspace palaa siitä.
+        """
+        _query, match, span, _found = self.history_search_states[-1]
+        if older:
+            before = match
+        else:
+            before = None if match is None else match + 1
+            if len(query) < len(_query) or not query.startswith(_query):
+                span = None
+        result = self.command_history.search(query, before=before, span=span)
+        if result is None:
+            self.history_search_states.append((query, match, span, False))
+        else:
+            pos, command, span = result
+            self.history_search_states.append((query, pos, span, True))
+            self.input_buffer = command
+            self.cursor_pos = max(0, command.find(query))
+        self.refresh_input()
+
+    def history_search_key(self, keycode, char):
+        """Käsittele näppäin Ctrl-R-tilassa.
+
+        Returns:
+            True jos näppäin käsiteltiin, False jos haku päättyi ja
+            näppäin pitää käsitellä tavalliseen tapaan (esim. Enter suorittaa)
+        """
+        query = self.history_search_states[-1][0]
+        if keycode == 18:  # Ctrl-R - vanhempi osuma
+            if query:
+                self.history_search_update(query, older=True)
+            return True
+        if keycode in (curses.KEY_BACKSPACE, 127, 8):
+            if len(self.history_search_states) > 1:
+                self.history_search_states.pop()
+                match = self.history_search_states[-1][1]
+                if match is not None:
+                    self.input_buffer = self.command_history.entries[match] or ""
+                else:
+                    self.input_buffer = self.history_saved_input
+                self.cursor_pos = len(self.input_buffer)
+                self.refresh_input()
+            return True
+        if keycode in (27, 7):  # ESC / Ctrl-G - peruuta
+            self.finish_history_search(accept=False)
+            return True
+        if char is not None and char.isprintable():
+            self.history_search_update(query + char)
+            return True
+        # Muut näppäimet (Enter, nuolet, Ctrl-A...) hyväksyvät osuman
+        self.finish_history_search(accept=True)
+        return False
+
+    def finish_history_search(self, accept):
+        """Poistu Ctrl-R-tilasta; osuma jää syöteriville jos accept."""
+        self.history_search_mode = False
+        self.history_search_states = []
+        if not accept:
+            self.input_buffer = self.history_saved_input
+        self.cursor_pos = len(self.input_buffer)
+        self.history_saved_input = ""
+        self.refresh_input()
+
+    def finish_search_prompt(self, run):
+        """Poistu Ctrl-F-hakutilasta ja aloita haku jos run ja lauseke annettu."""
+        regex = self.input_buffer
+        self.search_mode = False
+        self.input_buffer = self.search_saved_input
+        self.cursor_pos = len(self.input_buffer)
+        self.search_saved_input = ""
+        if run and regex:
+            try:
+                self.start_search(regex)
+            except re.error as e:
+                self.add_output(f"*** Virhe: Virheellinen hakulauseke: {e} ***\n")
+        self.refresh_input()
+
+    async def handle_keys(self, keys):
+        """Käsittele kerralla luetut näppäimet.
+
+        Hakutilojen ulkopuolella vähintään kahden tavallisen merkin jono
+        (myös rivinvaihdot) liitetään insert_textillä yhtenä muokkauksena.
+        Kesken olevan näppäinsarjan aikana merkit käsitellään yksitellen.
+
+        Returns:
+            False jos client pitää sulkea (/quit)
+        """
+        if self.search_mode or self.history_search_mode or len(keys) == 1:
+            segments = [(False, key) for key in keys]
+        else:
+            segments = group_paste_keys(keys, self.keymap)
+        for is_text, item in segments:
+            if is_text and self.key_pending:
+                for key in item:
+                    if not await self.handle_key(key):
+                        return False
+            elif is_text:
+                self.completion = None
+                if not await self.insert_text(item):
+                    return False
+            elif not await self.handle_key(item):
+                return False
+        return True
 
-        if first_word in self.user_aliases:
-            alias_cmd = self.user_aliases[first_word]
-            # Jos oli argumentteja, lisää ne aliaksen perään
-            if len(parts) > 1:
-                return f"{alias_cmd} {parts[1]}"
-            return alias_cmd
+    async def handle_key(self, key):
+        """Käsittele yksi näppäin näppäinkartan kautta.
 
-        return cmd
+        Näppäinsarjan alkuosa jää odottamaan seuraavaa näppäintä. Jos sarja
+        ei täsmää, odottaneet näppäimet käsitellään yksitellen.
+
+        Returns:
+            False jos client pitää sulkea (/quit)
+        """
+        if key == curses.KEY_RESIZE:
+            with self.lag_monitor.activity("resize"):
+                self.setup_windows()
+                self.refresh_output()
+                self.refresh_status()
+                self.refresh_input()
+            return True
+
+        if self.history_search_mode:
+            # get_wch palauttaa joko int (erikoisnäppäin) tai str (merkki)
+            char = key if isinstance(key, str) else None
+            self.completion = None
+            if self.history_search_key(ord(key) if char is not None else key, char):
+                return True
+
+        seq = self.key_pending + (key,) if self.key_pending else key
+        if seq in self.keymap.prefixes:
+            self.key_pending = seq if self.key_pending else (key,)
+            return True
+        binding = self.keymap.bindings.get(seq)
+        if binding is None and self.key_pending:
+            if not await self.flush_key_pending():
+                return False
+            return await self.handle_key(key)
+        self.key_pending = ()
+        return await self.run_key(key, binding)
+
+    async def flush_key_pending(self):
+        """Käsittele kesken jääneen sarjan näppäimet yksitellen (esim. pelkkä ESC).
+
+        Returns:
+            False jos client pitää sulkea (/quit)
+        """
+        pending, self.key_pending = self.key_pending, ()
+        for key in pending:
+            if not await self.run_key(key, self.keymap.bindings.get(key)):
+                return False
+        return True
+
+    async def run_key(self, key, binding):
+        """Aja sidottu toiminto, tai lisää sitomaton tulostettava merkki syötteeseen.
+
+        Returns:
+            False jos client pitää sulkea (/quit)
+        """
+        if binding is None:
+            self.completion = None
+            if isinstance(key, str) and key.isprintable():  # Unicode-merkki
+                self.input_buffer = (
+                    self.input_buffer[:self.cursor_pos] +
+                    key +
+                    self.input_buffer[self.cursor_pos:]
+                )
+                self.cursor_pos += 1
+                self.refresh_input()
+            return True
+        if binding.action != "complete":
+            self.completion = None  # Tab-kierros päättyy muuhun näppäimeen
+        return await getattr(self, binding.method)(binding.arg) is not False
+
+    # Näppäinkartan toiminnot (batcli_keys.ACTIONS): key_<nimi>(argumentti).
+    # Palauttaa False jos client pitää sulkea.
+
+    async def key_submit(self, _arg):
+        if self.search_mode:
+            self.finish_search_prompt(run=True)
+            return True
+        cmd = self.input_buffer.strip()
+        self.tracer.mark("input")
+        scroll_before = self.scroll_offset
+
+        if not await self.execute_line(cmd):
+            return False  # /quit
+
+        self.tracer.cancel("input")  # Client-komento ei lähettänyt mitään
+        self.input_buffer = ""
+        self.cursor_pos = 0
+        # Palaa loppuun, ellei komento itse vierittänyt (/search)
+        if self.scroll_offset == scroll_before:
+            self.scroll_offset = 0
+        self.refresh_input()
+        self.refresh_output()
+        return True
+
+    async def key_backspace(self, _arg):
+        if self.cursor_pos > 0:
+            self.input_buffer = (
+                self.input_buffer[:self.cursor_pos - 1] +
+                self.input_buffer[self.cursor_pos:]
+            )
+            self.cursor_pos -= 1
+            self.refresh_input()
+
+    async def key_delete(self, _arg):
+        if self.cursor_pos < len(self.input_buffer):
+            self.input_buffer = (
+                self.input_buffer[:self.cursor_pos] +
+                self.input_buffer[self.cursor_pos + 1:]
+            )
+            self.refresh_input()
+
+    async def key_left(self, _arg):
+        if self.cursor_pos > 0:
+            self.cursor_pos -= 1
+            self.refresh_input()
+
+    async def key_right(self, _arg):
+        if self.cursor_pos < len(self.input_buffer):
+            self.cursor_pos += 1
+            self.refresh_input()
+
+    async def key_line_start(self, _arg):
+        self.cursor_pos = 0
+        self.refresh_input()
+
+    async def key_line_end(self, _arg):
+        self.cursor_pos = len(self.input_buffer)
+        self.refresh_input()
+
+    async def key_clear_line(self, _arg):
+        self.input_buffer = ""
+        self.cursor_pos = 0
+        self.refresh_input()
+
+    async def key_kill_to_end(self, _arg):
+        self.input_buffer = self.input_buffer[:self.cursor_pos]
+        self.refresh_input()
+
+    async def key_history_prev(self, _arg):
+        self.history_step(older=True)
+
+    async def key_history_next(self, _arg):
+        self.history_step(older=False)
+
+    async def key_history_search(self, _arg):
+        if not self.search_mode:
+            self.start_history_search()
+
+    async def key_complete(self, _arg):
+        if not self.search_mode:
+            self.complete_word()
+
+    async def key_page_up(self, _arg):
+        # refresh_output rajaa ylisuuren arvon, joten tässä ei
+        # tarvitse käydä koko puskuria läpi ylärajan laskemiseksi
+        self.scroll_offset += (self.height - 3)
+        self.refresh_output()
+        self.refresh_status()
+
+    async def key_page_down(self, _arg):
+        self.scroll_offset = max(0, self.scroll_offset - (self.height - 3))
+        self.refresh_output()
+        self.refresh_status()
+
+    async def key_scroll_top(self, _arg):
+        self.scroll_offset = self.max_scroll_offset()
+        self.refresh_output()
+        self.refresh_status()
+
+    async def key_scroll_bottom(self, _arg):
+        self.scroll_offset = 0
+        self.refresh_output()
+        self.refresh_status()
+
+    async def key_search(self, _arg):
+        if not self.search_mode:
+            self.search_mode = True
+            self.search_saved_input = self.input_buffer
+            self.input_buffer = ""
+            self.cursor_pos = 0
+            self.refresh_input()
+
+    async def key_search_older(self, _arg):
+        self.search_step(1)
+
+    async def key_search_newer(self, _arg):
+        self.search_step(-1)
+
+    async def key_cancel(self, _arg):
+        if self.search_mode:
+            self.finish_search_prompt(run=False)
+
+    async def key_send(self, arg):
+        """Lähetä sidottu komento palvelimelle; syöteriviin ei kosketa."""
+        await self.send_commands([arg])
+
+    async def key_alias(self, arg):
+        """Suorita sidottu rivi kuin Enter (aliakset, /komennot); syöteriviin ei kosketa."""
+        return await self.execute_line(arg)
+
+    async def key_ignore(self, _arg):
+        pass
+
+    async def insert_text(self, text):
+        """Liitä teksti kursorin kohdalle yhtenä muokkauksena ja piirrä kerran.
+
+        Rivinvaihdot toimivat kuin Enter: valmiit rivit suoritetaan yhtenä
+        eränä execute_linesillä ja viimeinen (kesken jäänyt) rivi jää syötteeseen.
+
+        Returns:
+            False jos client pitää sulkea (/quit)
+        """
+        parts = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        before = self.input_buffer[:self.cursor_pos]
+        after = self.input_buffer[self.cursor_pos:]
+        if len(parts) == 1:
+            self.input_buffer = before + text + after
+            self.cursor_pos += len(text)
+            self.refresh_input()
+            return True
+
+        lines = [(before + parts[0] + after).strip()] + [line.strip() for line in parts[1:-1]]
+        self.input_buffer = parts[-1]
+        self.cursor_pos = len(self.input_buffer)
+        self.tracer.mark("input")
+        scroll_before = self.scroll_offset
+        if not await self.execute_lines(lines):
+            return False
+        self.tracer.cancel("input")
+        if self.scroll_offset == scroll_before:
+            self.scroll_offset = 0
+        self.refresh_input()
+        self.refresh_output()
+        return True
+
+    def read_pending_keys(self):
+        """Lue kaikki jo saapuneet näppäimet odottamatta (liitetty teksti).
+
+        Tavallisessa kirjoituksessa syötteessä ei ole mitään odottamassa,
+        joten tilaa vaihdetaan vain kun select näyttää lisää dataa.
+        """
+        if not self.input_pending():
+            return []
+        keys = []
+        curses.cbreak()  # halfdelay pois, jotta nodelay palaa heti
+        self.input_win.nodelay(True)
+        try:
+            while len(keys) < PASTE_MAX_KEYS:
+                try:
+                    keys.append(self.input_win.get_wch())
+                except curses.error:
+                    break
+        finally:
+            self.input_win.nodelay(False)
+            curses.halfdelay(1)
+        return keys
+
+    @staticmethod
+    def input_pending():
+        """Onko päätteeltä tullut lukematonta syötettä."""
+        try:
+            return bool(select.select([sys.stdin], [], [], 0)[0])
+        except (OSError, ValueError):
+            return False
 
     async def handle_input(self):
         """Käsittele käyttäjän syöte"""
@@ -1133,151 +4266,21 @@ class BatClient:
                 try:
                     # Käytä get_wch() unicode-tukeen
                     try:
-                        key = self.input_win.get_wch()
+                        with self.lag_monitor.activity("get_wch"):
+                            key = self.input_win.get_wch()
                     except curses.error:
-                        # halfdelay timeout - anna muille tehtäville aikaa
+                        # halfdelay timeout - anna muille tehtäville aikaa.
+                        # Kesken jäänyt sarja (esim. pelkkä ESC) käsitellään nyt.
+                        if self.key_pending and not await self.flush_key_pending():
+                            break  # /quit
                         await asyncio.sleep(0)
                         continue
 
-                    # get_wch palauttaa joko int (erikoisnäppäin) tai str (merkki)
-                    if isinstance(key, str):
-                        char = key
-                        keycode = ord(char)
-                    else:
-                        char = None
-                        keycode = key
-
-                    if keycode == curses.KEY_RESIZE:
-                        self.setup_windows()
-                        self.refresh_output()
-                        self.refresh_status()
-                        self.refresh_input()
-
-                    elif keycode in (curses.KEY_ENTER, 10, 13):  # Enter
-                        cmd = self.input_buffer.strip()
-
-                        if cmd.startswith('//'):
-                            # // -> lähetä palvelimelle yhdellä /
-                            await self.send_command(cmd[1:])
-                        elif cmd.startswith('/'):
-                            # Client-komento
-                            if not await self.handle_client_command(cmd):
-                                break  # /quit
-                        else:
-                            # Lähetä palvelimelle (myös tyhjä rivi)
-                            expanded = self.expand_alias(cmd) if cmd else ""
-                            await self.send_command(expanded)
-
-                        self.input_buffer = ""
-                        self.cursor_pos = 0
-                        self.scroll_offset = 0
-                        self.refresh_input()
-                        self.refresh_output()
-
-                    elif keycode in (curses.KEY_BACKSPACE, 127, 8):  # Backspace
-                        if self.cursor_pos > 0:
-                            self.input_buffer = (
-                                self.input_buffer[:self.cursor_pos - 1] +
-                                self.input_buffer[self.cursor_pos:]
-                            )
-                            self.cursor_pos -= 1
-                            self.refresh_input()
-
-                    elif keycode == curses.KEY_DC:  # Delete
-                        if self.cursor_pos < len(self.input_buffer):
-                            self.input_buffer = (
-                                self.input_buffer[:self.cursor_pos] +
-                                self.input_buffer[self.cursor_pos + 1:]
-                            )
-                            self.refresh_input()
-
-                    elif keycode == curses.KEY_LEFT:  # Nuoli vasemmalle - kursori vasemmalle
-                        if self.cursor_pos > 0:
-                            self.cursor_pos -= 1
-                            self.refresh_input()
-
-                    elif keycode == curses.KEY_RIGHT:  # Nuoli oikealle - kursori oikealle
-                        if self.cursor_pos < len(self.input_buffer):
-                            self.cursor_pos += 1
-                            self.refresh_input()
-
-                    elif keycode == curses.KEY_UP:  # Nuoli ylös - rivin alkuun
-                        self.cursor_pos = 0
-                        self.refresh_input()
-
-                    elif keycode == curses.KEY_DOWN:  # Nuoli alas - rivin loppuun
-                        self.cursor_pos = len(self.input_buffer)
-                        self.refresh_input()
-
-                    elif keycode == 16:  # Ctrl-P - edellinen historia
-                        if self.command_history:
-                            if self.history_index < len(self.command_history) - 1:
-                                self.history_index += 1
-                                self.input_buffer = self.command_history[-(self.history_index + 1)]
-                                self.cursor_pos = len(self.input_buffer)
-                                self.refresh_input()
-
-                    elif keycode == 14:  # Ctrl-N - seuraava historia
-                        if self.history_index > 0:
-                            self.history_index -= 1
-                            self.input_buffer = self.command_history[-(self.history_index + 1)]
-                            self.cursor_pos = len(self.input_buffer)
-                        elif self.history_index == 0:
-                            self.history_index = -1
-                            self.input_buffer = ""
-                            self.cursor_pos = 0
-                        self.refresh_input()
-
-                    elif keycode == 1:  # Ctrl-A - rivin alkuun
-                        self.cursor_pos = 0
-                        self.refresh_input()
-
-                    elif keycode == 5:  # Ctrl-E - rivin loppuun
-                        self.cursor_pos = len(self.input_buffer)
-                        self.refresh_input()
-
-                    elif keycode == 21:  # Ctrl-U - tyhjennä rivi
-                        self.input_buffer = ""
-                        self.cursor_pos = 0
-                        self.refresh_input()
-
-                    elif keycode == 11:  # Ctrl-K - poista kursorista loppuun
-                        self.input_buffer = self.input_buffer[:self.cursor_pos]
-                        self.refresh_input()
-
-                    elif keycode == curses.KEY_PPAGE:  # Page Up - scroll
-                        # refresh_output rajaa ylisuuren arvon, joten tässä ei
-                        # tarvitse käydä koko puskuria läpi ylärajan laskemiseksi
-                        self.scroll_offset += (self.height - 3)
-                        self.refresh_output()
-                        self.refresh_status()
-
-                    elif keycode == curses.KEY_NPAGE:  # Page Down - scroll
-                        self.scroll_offset = max(0, self.scroll_offset - (self.height - 3))
-                        self.refresh_output()
-                        self.refresh_status()
-
-                    elif keycode == curses.KEY_HOME:  # Home - scroll alkuun
-                        self.scroll_offset = self.max_scroll_offset()
-                        self.refresh_output()
-                        self.refresh_status()
-
-                    elif keycode == curses.KEY_END:  # End - scroll loppuun
-                        self.scroll_offset = 0
-                        self.refresh_output()
-                        self.refresh_status()
-
-                    elif keycode == 27:  # ESC - ei tehdä mitään (tai voi poistua)
-                        pass
-
-                    elif char is not None and char.isprintable():  # Unicode-merkki
-                        self.input_buffer = (
-                            self.input_buffer[:self.cursor_pos] +
-                            char +
-                            self.input_buffer[self.cursor_pos:]
-                        )
-                        self.cursor_pos += 1
-                        self.refresh_input()
+                    # Liitetty teksti saapuu merkki kerrallaan: lue kaikki jo
+                    # odottavat näppäimet ja käsittele tavalliset merkit yhtenä eränä
+                    keys = [key] + self.read_pending_keys()
+                    if not await self.handle_keys(keys):
+                        break  # /quit
 
                 except curses.error:
                     await asyncio.sleep(0.01)
@@ -1287,10 +4290,23 @@ class BatClient:
 
     async def run(self):
         """Pääsilmukka"""
+        for error in self.keymap_errors:
+            self.add_output(f"*** Näppäinkartta: {error} ***\n")
         self.refresh_output()
         self.refresh_status()
         self.refresh_input()
 
+        # Viivevahti pyörii koko ajan; asyncion debug-tila vain pyydettäessä
+        self.lag_task = asyncio.create_task(self.lag_monitor.run(self.on_lag_spike))
+        if self.slow_callbacks:
+            self.lag_monitor.set_slow_callback_reporting(True)
+        if self.link_probe.enabled:
+            self.ping_task = asyncio.create_task(self.ping_loop())
+        # Historia luetaan taustalla; Ctrl-P/R lukee sen heti jos ehtii ensin
+        self.history_task = asyncio.create_task(self.load_history())
+        if self.metrics_port >= 0 or self.metrics_socket:
+            await self.start_metrics_server()
+
         # Yritä yhdistää alkuun, mutta jatka vaikka epäonnistuisi
         if await self.connect():
             # Aloita automaattinen loggaus jos määritelty
@@ -1318,6 +4334,16 @@ class BatClient:
             input_task.cancel()
             if self.reconnect_task and not self.reconnect_task.done():
                 self.reconnect_task.cancel()
+            if self.profiler:
+                self.profiler.stop()
+            if self.lag_task:
+                self.lag_task.cancel()
+            if self.ping_task:
+                self.ping_task.cancel()
+            if self.metrics_server:
+                await self.metrics_server.close()
+            self.automapper.graph.close()
+            self.command_history.close()
 
             if self.writer:
                 self.writer.close()
@@ -1327,6 +4353,145 @@ class BatClient:
                     pass
 
 
+# Offline-analyysin (--analyze) tunnistimet. Jokaisella on halpa
+# esisuodatin (alimerkkijono), jotta säännöllinen lauseke ajetaan vain
+# riveille joilla se voi osua.
+ANALYZE_KILL_RE = re.compile(r'^(.+?) is DEAD, R\.I\.P\.')
+ANALYZE_EXP_RE = re.compile(r'\b(?:gain|get|receive)s? (\d+) (?:points of )?exp(?:erience)?\b',
+                            re.IGNORECASE)
+ANALYZE_DEATH_RE = re.compile(r'^(?:You die\.|You have died|YOU ARE DEAD)')
+ANALYZE_CHANNEL_RE = re.compile(r'^\S+ \[([\w-]+)\]: ')
+ANALYZE_SESSION_RE = re.compile(r'(?:Automaattinen loggaus|Loggaus) aloitettu: ')
+
+
+def _log_lines(path):
+    """Lue lokitiedosto rivi kerrallaan (generaattori, ei koko tiedostoa muistiin)."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+
+def new_log_stats():
+    """Tyhjä analyysin välitulos."""
+    return {
+        "files": 0, "lines": 0, "sessions": 0, "kills": 0, "deaths": 0,
+        "exp_gains": 0, "exp": 0, "channels": {}, "victims": {},
+    }
+
+
+def analyze_log_file(path):
+    """Laske yhden lokitiedoston tapahtumat. Ajetaan prosessipoolissa."""
+    stats = new_log_stats()
+    stats["files"] = 1
+    channels = stats["channels"]
+    victims = stats["victims"]
+    lines = 0
+    for line in _log_lines(path):
+        lines += 1
+        if "R.I.P." in line:
+            match = ANALYZE_KILL_RE.match(line)
+            if match:
+                stats["kills"] += 1
+                victim = match.group(1)
+                victims[victim] = victims.get(victim, 0) + 1
+                continue
+        if "xp" in line or "XP" in line:
+            match = ANALYZE_EXP_RE.search(line)
+            if match:
+                stats["exp_gains"] += 1
+                stats["exp"] += int(match.group(1))
+                continue
+        if "]: " in line:
+            match = ANALYZE_CHANNEL_RE.match(line)
+            if match:
+                channel = match.group(1)
+                channels[channel] = channels.get(channel, 0) + 1
+                continue
+        if line.startswith(("You", "YOU")) and ANALYZE_DEATH_RE.match(line):
+            stats["deaths"] += 1
+        elif "aloitettu: " in line and ANALYZE_SESSION_RE.search(line):
+            stats["sessions"] += 1
+    stats["lines"] = lines
+    return stats
+
+
+def merge_log_stats(total, part):
+    """Yhdistä tiedostokohtainen välitulos kokonaistulokseen (paikallaan)."""
+    for key, value in part.items():
+        if isinstance(value, dict):
+            bucket = total[key]
+            for name, count in value.items():
+                bucket[name] = bucket.get(name, 0) + count
+        else:
+            total[key] += value
+    return total
+
+
+def analyze_logs(log_dir, workers=None):
+    """Analysoi kaikki kansion .log-tiedostot rinnakkain.
+
+    Args:
+        log_dir: Lokikansio
+        workers: Prosessien määrä (None = CPU-määrä, 1 = ilman poolia)
+
+    Returns:
+        Yhdistetty tulos (ks. new_log_stats)
+    """
+    files = sorted(str(p) for p in Path(log_dir).glob("*.log"))
+    total = new_log_stats()
+    if workers == 1 or len(files) <= 1:
+        for part in map(analyze_log_file, files):
+            merge_log_stats(total, part)
+        return total
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for part in executor.map(analyze_log_file, files, chunksize=8):
+            merge_log_stats(total, part)
+    return total
+
+
+def format_log_stats(stats, top=10):
+    """Muotoile analyysin tulos tulostettaviksi riveiksi."""
+    lines = [
+        f"Tiedostoja:   {stats['files']}",
+        f"Sessioita:    {stats['sessions']}",
+        f"Rivejä:       {stats['lines']}",
+        f"Tappoja:      {stats['kills']}",
+        f"Kuolemia:     {stats['deaths']}",
+        f"Exp-saaliita: {stats['exp_gains']} (yhteensä {stats['exp']})",
+    ]
+    for title, key in (("Eniten tapetut", "victims"), ("Kanavat", "channels")):
+        items = sorted(stats[key].items(), key=lambda item: -item[1])[:top]
+        if items:
+            lines.append("")
+            lines.append(f"{title}:")
+            for name, count in items:
+                lines.append(f"  {count:>8}  {name}")
+    return lines
+
+
+def run_analyze(log_dir, workers=None):
+    """--analyze: tulosta lokikansion yhteenveto ilman curses-käyttöliittymää."""
+    if not Path(log_dir).is_dir():
+        print(f"Lokikansiota ei löydy: {log_dir}", file=sys.stderr)
+        return 1
+    start = time.monotonic()
+    stats = analyze_logs(log_dir, workers=workers)
+    print("\n".join(format_log_stats(stats)))
+    print(f"\n({time.monotonic() - start:.2f} s)", file=sys.stderr)
+    return 0
+
+
+def parse_args(argv=None):
+    """Komentoriviargumentit. Ilman argumentteja käynnistyy client."""
+    parser = argparse.ArgumentParser(
+        prog="batcli", description="BatMUD terminal client")
+    parser.add_argument("--analyze", metavar="LOG_DIR",
+                        help="Analysoi sessiolokit (tapot, exp, kuolemat, kanavat) ja poistu")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Rinnakkaisia prosesseja --analyze-tilassa (oletus: CPU-määrä)")
+    return parser.parse_args(argv)
+
+
 exit_message = None
 
 
@@ -1339,6 +4504,9 @@ def main(stdscr):
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.analyze:
+        sys.exit(run_analyze(args.analyze, workers=args.jobs))
     try:
         curses.wrapper(main)
         if exit_message:
@@ -9,7 +9,7 @@ class AliasCommand(Command):
     name = "alias"
     aliases = ["al"]
     description = "Luo ja hallitse pikakomentoja"
-    usage = "/alias [nimi] [komento] | /alias -d <nimi> | /alias -l"
+    usage = "/alias [nimi] [komento] | /alias -d <nimi> | /alias -l | /alias -x <rivi>"
 
     async def execute(self, args):
         """Hallitse aliaksia."""
@@ -33,6 +33,14 @@ class AliasCommand(Command):
             self.show_aliases()
             return True
 
+        # Näytä mitä rivi lähettäisi
+        if first == "-x" or first == "--expand":
+            if len(parts) < 2:
+                self.error("Anna laajennettava rivi")
+                return True
+            self.show_expansion(parts[1])
+            return True
+
         # Näytä tai luo alias
         alias_name = first
 
@@ -72,6 +80,17 @@ class AliasCommand(Command):
         else:
             self.error(f"Alias '{name}' ei ole olemassa")
 
+    def show_expansion(self, line):
+        """Näytä rivin laajennus komennoiksi lähettämättä mitään."""
+        try:
+            commands = self.client.expand_commands(line)
+        except Exception as e:
+            self.error(f"Alias: {e}")
+            return
+        self.info(f"{line} -> {len(commands)} komentoa")
+        for command in commands:
+            self.output(f"  {command}\n")
+
     def show_alias(self, name):
         """Näytä yksittäinen alias."""
         if name.startswith('/'):
@@ -91,6 +110,10 @@ class AliasCommand(Command):
             self.info("Ei aliaksia")
             self.output("  Luo: /alias <nimi> <komento>\n")
             self.output("  Esim: /alias kk kill kobold\n")
+            self.output("  Parametrit: /alias gt tell $1 $2  ($1-$9 sanat, $* kaikki, $$ = $)\n")
+            self.output("  Useita komentoja: /alias kl kill $1;get all from corpse\n")
+            self.output("  Ilman parametreja argumentit lisätään viimeiseen komentoon:\n")
+            self.output("  /alias two smile;bow  ->  two bob = smile; bow bob\n")
             return
 
         self.info(f"Aliakset ({len(aliases)} kpl)")
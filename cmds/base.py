@@ -2,6 +2,27 @@
 Komentojen base-luokka ja apufunktiot.
 """
 
+import re
+
+_INTERVAL_RE = re.compile(r'^(\d+(?:\.\d+)?)(ms|s|m|h)?$')
+_INTERVAL_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def parse_interval(text, require_unit=False):
+    """Muunna aika ("5", "1.5s", "2m", "1h", "250ms") sekunneiksi.
+
+    Args:
+        text: aika tekstinä, ilman yksikköä sekunteja
+        require_unit: hyväksy vain yksiköllinen aika (esim. "2s")
+
+    Returns:
+        Sekunnit, tai None jos teksti ei ole aika
+    """
+    m = _INTERVAL_RE.match(text.strip().lower())
+    if not m or (require_unit and m.group(2) is None):
+        return None
+    return float(m.group(1)) * _INTERVAL_UNITS[m.group(2)]
+
 
 class Command:
     """
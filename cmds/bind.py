@@ -0,0 +1,92 @@
+"""
+/bind - Näppäinsidonnat
+"""
+
+from batcli_keys import (
+    ACTIONS, DEFAULT_KEYMAP, KeymapError, describe_key, parse_binding, parse_key,
+)
+from cmds.base import Command
+
+
+class BindCommand(Command):
+    name = "bind"
+    aliases = ["key"]
+    description = "Sido näppäimiä toimintoihin ja komentoihin"
+    usage = "/bind <näppäin> = <toiminto> [argumentti] | /bind -d <näppäin> | /bind -l | /bind -a"
+
+    async def execute(self, args):
+        """Hallitse näppäinsidontoja."""
+        args = args.strip()
+        parts = args.split(maxsplit=1)
+        first = parts[0] if parts else ""
+
+        if not args:
+            self.show_bindings(user_only=True)
+        elif first in ("-l", "--list"):
+            self.show_bindings(user_only=False)
+        elif first in ("-a", "--actions"):
+            self.show_actions()
+        elif first in ("-d", "--delete"):
+            if len(parts) < 2:
+                self.error("Anna poistettava näppäin")
+                return True
+            self.delete_binding(parts[1])
+        elif "=" in args:
+            self.create_binding(args)
+        else:
+            self.show_usage()
+
+        return True
+
+    def create_binding(self, line):
+        """Sido näppäin tämän istunnon ajaksi (pysyvästi: KEYMAP_FILE)."""
+        try:
+            keys, action, arg = parse_binding(line)
+            self.client.keymap.bind(keys, action, arg)
+        except KeymapError as e:
+            self.error(str(e))
+            return
+        self.info(f"Sidottu: {describe_key(keys[0])} = {action} {arg}".rstrip())
+
+    def delete_binding(self, spec):
+        """Poista käyttäjän sidonta; oletussidonta palaa voimaan."""
+        try:
+            keys = parse_key(spec)
+        except KeymapError as e:
+            self.error(str(e))
+            return
+        if not self.client.keymap.unbind(keys):
+            self.error(f"Näppäimellä {spec} ei ole omaa sidontaa")
+            return
+        restored = [key for key in keys if key in DEFAULT_KEYMAP]
+        if restored:
+            binding = self.client.keymap.bindings[restored[0]]
+            self.info(f"Oletus palautettu: {describe_key(restored[0])} = {binding.action}")
+        else:
+            self.info(f"Sidonta poistettu: {spec}")
+
+    def show_bindings(self, user_only):
+        """Listaa omat (tai kaikki) sidonnat."""
+        keymap = self.client.keymap
+        keys = keymap.user_keys if user_only else keymap.bindings
+        if not keys:
+            self.info("Ei omia näppäinsidontoja")
+            self.output("  Luo: /bind <näppäin> = <toiminto> [argumentti]\n")
+            self.output("  Esim: /bind F1 = send cast 'cure light wounds'\n")
+            self.output("        /bind M-h = alias hh\n")
+            self.output("  Kaikki sidonnat: /bind -l, toiminnot: /bind -a\n")
+            return
+
+        lines = sorted(keymap.describe(key) for key in keys)
+        self.info(f"Näppäinsidonnat ({len(lines)} kpl)")
+        for line in lines:
+            self.output(f"  {line}\n")
+
+    def show_actions(self):
+        """Listaa toiminnot joihin näppäimen voi sitoa."""
+        self.info("Toiminnot")
+        for name, description in ACTIONS.items():
+            self.output(f"  {name:<15} {description}\n")
+        self.output("  Näppäimet: a, Enter, Tab, Esc, F1-F63, C-x, M-x, KP0-KP9, KP+,\n")
+        self.output("  KPEnter, Up, PageUp, Home, Insert, KEY_<curses-nimi>, \\e<merkit>;\n")
+        self.output("  sarja välilyönnein: C-x C-s\n")
@@ -77,7 +77,7 @@ class ConnectCommand(Command):
         import asyncio
         self.output(f"Yhdistetään palvelimeen {host}:{port}...\n")
         try:
-            self.client.reader, self.client.writer = await asyncio.open_connection(host, port)
+            await self.client.open_server(host, port)
             self.info("Yhteys muodostettu!\n")
 
             # Päivitä statusbaari
@@ -90,10 +90,13 @@ class ConnectCommand(Command):
             if not hasattr(self.client, 'read_task') or self.client.read_task.done():
                 self.client.read_task = asyncio.create_task(self.client.read_from_server())
 
-            # Käynnistä auto-login jos määritelty
-            if self.client.username and self.client.password:
+            # Käynnistä auto-login jos määritelty (odottaa palvelimen kehotetta)
+            if self.client.username:
                 asyncio.create_task(self.client.auto_login())
 
+            return True
+        except asyncio.TimeoutError:
+            self.error("Yhteysaikakatkaisu - palvelimeen ei saatu yhteyttä\n")
             return True
         except Exception as e:
             self.error(f"Yhteysvirhe: {e}\n")
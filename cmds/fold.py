@@ -0,0 +1,29 @@
+"""
+/fold - Taita toistuvat rivit yhdeksi riviksi laskurilla
+"""
+
+from cmds.base import Command
+
+
+class FoldCommand(Command):
+    name = "fold"
+    aliases = []
+    description = "Taita peräkkäiset samanlaiset rivit (xN)"
+    usage = "/fold [off|exact|numbers]"
+
+    async def execute(self, args):
+        """Vaihda taittotila tai näytä nykyinen."""
+        mode = args.strip().lower()
+        folder = self.client.spam_folder
+
+        if not mode:
+            self.info(f"Taitto: {folder.mode}, {folder.lines_folded} riviä taitettu")
+            self.output("  exact   = identtiset rivit\n")
+            self.output("  numbers = myös rivit jotka eroavat vain numeroiltaan\n")
+        elif mode in ("off", "exact", "numbers"):
+            folder.set_mode(mode)
+            self.info(f"Taitto: {mode}")
+        else:
+            self.show_usage()
+
+        return True
@@ -0,0 +1,78 @@
+"""
+/gag - Piilota palvelimen rivit (esim. muiden pelaajien taistelurivit)
+"""
+
+import re
+
+from cmds.base import Command
+
+
+class GagCommand(Command):
+    name = "gag"
+    aliases = []
+    description = "Piilota rivit jotka osuvat kuvioon"
+    usage = "/gag <teksti|/regex/> | /gag -d <id> | /gag"
+
+    async def execute(self, args):
+        """Lisää, poista tai listaa gagit."""
+        args = args.strip()
+        if not args or args in ("-l", "--list"):
+            self.show_rules()
+            return True
+
+        parts = args.split(maxsplit=1)
+        if parts[0] in ("-d", "--delete"):
+            if len(parts) < 2:
+                self.error("Anna poistettavan gagin numero")
+            else:
+                self.delete_rule(parts[1])
+            return True
+
+        is_regex = len(args) >= 2 and args.startswith('/') and args.endswith('/')
+        pattern = args[1:-1] if is_regex else args
+        try:
+            rule = self.client.output_filter.add_gag(pattern, is_regex=is_regex)
+        except re.error as e:
+            self.error(f"Virheellinen lauseke: {e}")
+            return True
+
+        self.info(f"Gag #{rule.id} luotu: {self.describe(rule)}")
+        return True
+
+    def delete_rule(self, arg):
+        """Poista gag numerolla."""
+        try:
+            rule_id = int(arg.lstrip('#'))
+        except ValueError:
+            self.error(f"Virheellinen numero: {arg}")
+            return
+
+        rule = self.client.output_filter.triggers.get(rule_id)
+        if rule is None or not rule.is_gag:
+            self.error(f"Gagia #{rule_id} ei ole olemassa")
+            return
+        self.client.output_filter.remove(rule_id)
+        self.info(f"Gag #{rule_id} poistettu")
+
+    @staticmethod
+    def describe(rule):
+        """Säännön kuvio listaukseen."""
+        return f"/{rule.pattern}/" if rule.is_regex else rule.pattern
+
+    def show_rules(self):
+        """Listaa gagit ja paljonko kukin on säästänyt."""
+        rules = [r for r in self.client.output_filter.triggers.values() if r.is_gag]
+        if not rules:
+            self.info("Ei gageja")
+            self.output("  Luo: /gag <teksti> tai /gag /regex/\n")
+            self.output("  Esim: /gag /^\\w+ (hits|misses) \\w+/\n")
+            return
+
+        total = sum(r.hits for r in rules)
+        self.info(f"Gagit ({len(rules)} kpl, {total} riviä piilotettu)")
+        if self.client.gag_log:
+            self.output("  Gagatut rivit kirjoitetaan silti lokiin (GAG_LOG=true)\n")
+        self.output(f"  {'#':<5} {'rivejä':>7} {'säästö':>9}  kuvio\n")
+        for rule in sorted(rules, key=lambda r: -r.saved):
+            self.output(f"  #{rule.id:<4} {rule.hits:>7} {rule.saved:>8}B  "
+                        f"{self.describe(rule)}\n")
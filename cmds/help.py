@@ -89,10 +89,15 @@ class HelpCommand(Command):
             "  Nuoli ←/→     - Siirrä kursoria",
             "  Nuoli ↑/↓     - Rivin alkuun / loppuun",
             "  Ctrl-P/N      - Komentohistoria",
+            "  Ctrl-R        - Hae komentohistoriasta (uudelleen: vanhempi osuma)",
+            "  Tab           - Täydennä sana (tulosteen sanat, /komennot, aliakset)",
             "  Ctrl-A/E      - Rivin alku/loppu",
             "  Ctrl-U/K      - Tyhjennä rivi / poista kursorista loppuun",
             "  Page Up/Down  - Vieritä tulostetta",
             "  Home/End      - Vieritä alkuun / loppuun",
+            "  Ctrl-F        - Hae tulostehistoriasta",
+            "  F3/Shift-F3   - Vanhempi / uudempi hakuosuma",
+            "  Omat sidonnat: keys.conf tai /bind (toiminnot: /bind -a)",
             "",
             "Kirjoita /help <komento> saadaksesi lisätietoja.",
             "",
@@ -0,0 +1,67 @@
+"""
+/logsearch - Kokotekstihaku kaikista sessiolokeista (SQLite FTS5)
+"""
+
+import asyncio
+import time
+
+from batcli_index import INDEX_FILENAME, LogIndex, LogIndexError, format_hit
+from cmds.base import Command
+
+
+def _update_and_search(logs_dir, query, limit):
+    """Päivitä indeksi ja hae. Ajetaan säiepoolissa, ei tapahtumasilmukassa.
+
+    Indeksointi tehdään tässä säikeessä (workers=1): prosessipooli forkkaisi
+    monisäikeisen curses-prosessin. Rinnakkainen indeksointi: batcli-index.
+    """
+    index = LogIndex(logs_dir / INDEX_FILENAME)
+    try:
+        files, lines = index.update(logs_dir, workers=1)
+        start = time.monotonic()
+        hits = index.search(query, limit=limit)
+        elapsed = time.monotonic() - start
+    finally:
+        index.close()
+    return files, lines, hits, elapsed
+
+
+class LogSearchCommand(Command):
+    name = "logsearch"
+    aliases = ["lgrep"]
+    description = "Hae kaikista sessiolokeista"
+    usage = "/logsearch <hakusanat>"
+
+    async def execute(self, args):
+        """Hae lokeista; indeksi päivitetään ensin uusilla riveillä."""
+        query = args.strip()
+        if not query:
+            self.show_usage()
+            return True
+
+        logs_dir = self.client.logs_path()
+        if not logs_dir.is_dir():
+            self.error(f"Lokikansiota ei löydy: {logs_dir}")
+            return True
+
+        # Loki on auki, joten viimeisimmät rivit halutaan mukaan hakuun
+        if self.client.log_file:
+            self.client.log_file.flush()
+
+        loop = asyncio.get_running_loop()
+        try:
+            files, lines, hits, elapsed = await loop.run_in_executor(
+                None, _update_and_search, logs_dir, query, 10)
+        except LogIndexError as e:
+            self.error(str(e))
+            return True
+        except Exception as e:
+            self.error(f"Lokihaku epäonnistui: {e}")
+            return True
+
+        if files:
+            self.output(f"  (indeksoitu {lines} uutta riviä {files} tiedostosta)\n")
+        self.info(f"Lokihaku '{query}': {len(hits)} osumaa ({elapsed * 1000:.1f} ms)")
+        for hit in hits:
+            self.output("\n".join(format_hit(hit)) + "\n")
+        return True
@@ -0,0 +1,86 @@
+"""
+/map - Automappari: huonegraafi kävellessä
+"""
+
+import sqlite3
+
+from batcli_map import MapError
+from cmds.base import Command
+
+
+class MapCommand(Command):
+    name = "map"
+    aliases = []
+    description = "Automappari: tallenna huoneet ja uloskäynnit"
+    usage = "/map [on|off] | /map area <nimi> | /map find <teksti> | /map where"
+
+    async def execute(self, args):
+        """Hallitse automapparia."""
+        parts = args.split(maxsplit=1) if args else []
+        action = parts[0].lower() if parts else "status"
+        mapper = self.client.automapper
+
+        try:
+            if action == "on":
+                mapper.enabled = True
+                mapper.set_area(mapper.area)  # Avaa kartta ja lataa alue nyt
+                self.info(f"Automappari ON (alue: {mapper.area})")
+            elif action == "off":
+                mapper.enabled = False
+                mapper.reset()
+                self.info("Automappari OFF")
+            elif action == "area":
+                if len(parts) < 2:
+                    self.info(f"Alue: {mapper.area}")
+                else:
+                    mapper.set_area(parts[1].strip())
+                    self.info(f"Uudet huoneet alueelle: {mapper.area}")
+            elif action == "find":
+                if len(parts) < 2:
+                    self.error("Anna haettava teksti")
+                else:
+                    self.find_rooms(parts[1].strip())
+            elif action == "where":
+                self.show_current()
+            elif action == "status":
+                self.show_status()
+            else:
+                self.show_usage()
+        except (MapError, sqlite3.Error) as e:
+            self.error(f"Kartta: {e}")
+
+        return True
+
+    def describe(self, row):
+        room_id, area, title, exits = row
+        return f"#{room_id:<6} [{area}] {title}  ({exits or '-'})"
+
+    def show_current(self):
+        mapper = self.client.automapper
+        row = mapper.graph.room(mapper.current) if mapper.current is not None else None
+        if row is None:
+            self.info("Sijainti tuntematon (kävele tai katso: look)")
+            return
+        self.info(f"Olet: {self.describe(row)}")
+
+    def find_rooms(self, text):
+        rows = self.client.automapper.graph.search(text)
+        if not rows:
+            self.info(f"Ei huoneita: {text}")
+            return
+        self.info(f"Huoneet ({len(rows)} kpl)")
+        for row in rows:
+            self.output(f"  {self.describe(row)}\n")
+
+    def show_status(self):
+        mapper = self.client.automapper
+        state = "ON" if mapper.enabled else "OFF"
+        rooms, edges = mapper.graph.stats()
+        loaded = ", ".join(sorted(mapper.graph.loaded_areas)) or "-"
+        self.info(f"Automappari {state}: {rooms} huonetta, {edges} kaarta")
+        self.output(f"  Alue: {mapper.area}  (muistissa: {loaded})\n")
+        self.output(f"  Tiedosto: {mapper.graph.path}\n")
+        if mapper.pending:
+            self.output(f"  Odottaa huonetta: {' '.join(mapper.pending)}\n")
+        if not mapper.enabled:
+            self.output("  Käynnistä: /map on\n")
@@ -0,0 +1,78 @@
+"""
+/path - Lyhin reitti kartalla tunnettuun huoneeseen ja speedwalk sinne
+"""
+
+import sqlite3
+import time
+
+from batcli_map import MapError, compress_path
+from cmds.base import Command
+
+
+class PathCommand(Command):
+    name = "path"
+    aliases = ["go"]
+    description = "Kulje lyhintä reittiä kartan huoneeseen"
+    usage = "/path [-s] <#id|otsikon osa>  (-s = näytä reitti, älä kävele)"
+
+    async def execute(self, args):
+        """Etsi reitti ja anna se speedwalkille."""
+        args = args.strip()
+        show_only = False
+        if args.startswith("-s "):
+            show_only = True
+            args = args[3:].strip()
+        if not args:
+            self.show_usage()
+            return True
+
+        mapper = self.client.automapper
+        if mapper.current is None:
+            self.error("Sijainti tuntematon - /map on ja kävele tai katso (look)")
+            return True
+
+        try:
+            goal = self.resolve_room(args)
+            if goal is None:
+                return True
+            started = time.perf_counter()
+            route = mapper.graph.shortest_path(mapper.current, goal)
+            elapsed = (time.perf_counter() - started) * 1000
+        except (MapError, sqlite3.Error) as e:
+            self.error(f"Kartta: {e}")
+            return True
+
+        if route is None:
+            self.error(f"Ei tunnettua reittiä huoneeseen #{goal}")
+            return True
+        if not route:
+            self.info("Olet jo perillä")
+            return True
+
+        walk = compress_path(route)
+        self.info(f"Reitti #{goal}: {walk} ({len(route)} askelta, {elapsed:.1f} ms)")
+        if not show_only:
+            self.client.start_walk(route)
+        return True
+
+    def resolve_room(self, text):
+        """Huoneen id numerosta tai otsikosta; monta osumaa listataan."""
+        graph = self.client.automapper.graph
+        if text.lstrip('#').isdigit():
+            room_id = int(text.lstrip('#'))
+            if graph.room(room_id) is None:
+                self.error(f"Huonetta #{room_id} ei ole kartalla")
+                return None
+            return room_id
+
+        rows = graph.search(text, limit=10)
+        if not rows:
+            self.error(f"Ei huoneita: {text}")
+            return None
+        exact = [row for row in rows if row[2].lower() == text.lower()]
+        if len(exact) == 1 or len(rows) == 1:
+            return (exact or rows)[0][0]
+        self.info(f"Useita huoneita '{text}' - valitse numerolla:")
+        for room_id, area, title, _exits in rows:
+            self.output(f"  #{room_id:<6} [{area}] {title}\n")
+        return None
@@ -0,0 +1,93 @@
+"""
+/profile - Näytteistävä profiloija (collapsed stack -tuloste flamegraphille)
+"""
+
+from datetime import datetime
+
+from cmds.base import Command
+
+
+class ProfileCommand(Command):
+    name = "profile"
+    aliases = ["prof"]
+    description = "Näytteistävä profiloija"
+    usage = "/profile sample [hz] | /profile stop [tiedosto] | /profile status"
+
+    async def execute(self, args):
+        """Käynnistä, pysäytä tai näytä profiloinnin tila."""
+        parts = args.split() if args else []
+        action = parts[0].lower() if parts else "status"
+
+        if action == "sample":
+            self.start_sampling(parts[1] if len(parts) > 1 else None)
+        elif action == "stop":
+            self.stop_sampling(parts[1] if len(parts) > 1 else None)
+        elif action == "status":
+            self.show_status()
+        else:
+            self.show_usage()
+
+        return True
+
+    def start_sampling(self, hz_arg):
+        """Käynnistä näytteistys."""
+        profiler = self.client.profiler
+        if profiler and profiler.running:
+            self.error("Profilointi on jo käynnissä")
+            return
+
+        hz = self.client.profile_hz
+        if hz_arg:
+            try:
+                hz = int(hz_arg)
+            except ValueError:
+                self.error(f"Virheellinen taajuus: {hz_arg}")
+                return
+
+        profiler = self.client.start_profiler(hz)
+        self.info(f"Profilointi käynnissä ({profiler.hz} näytettä/s)")
+        self.output("  Lopeta ja tallenna: /profile stop [tiedosto]\n")
+
+    def stop_sampling(self, filename):
+        """Pysäytä näytteistys ja kirjoita collapsed-tiedosto."""
+        profiler = self.client.profiler
+        if not profiler or not profiler.running:
+            self.error("Profilointi ei ole käynnissä")
+            return
+
+        profiler.stop()
+
+        logs_dir = self.client.logs_path()
+        if filename:
+            if not filename.endswith('.folded'):
+                filename += '.folded'
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            filename = f"profile-{timestamp}.folded"
+
+        try:
+            logs_dir.mkdir(exist_ok=True)
+            path = logs_dir / filename
+            profiler.write_collapsed(path)
+        except Exception as e:
+            self.error(f"Profiilin tallennus epäonnistui: {e}")
+            return
+
+        self.info(f"Profilointi lopetettu: {profiler.samples} näytettä")
+        self.output(f"  Tiedosto: {path}\n")
+        self.output(f"  Flamegraph: flamegraph.pl {path.name} > profile.svg\n")
+
+    def show_status(self):
+        """Näytä tila ja eniten näytteitä keränneet funktiot."""
+        profiler = self.client.profiler
+        if not profiler:
+            self.info("Profilointi OFF")
+            self.output("  Käynnistä: /profile sample [hz]\n")
+            return
+
+        state = "ON" if profiler.running else "OFF"
+        self.info(f"Profilointi {state}: {profiler.samples} näytettä "
+                  f"({profiler.hz} näytettä/s)")
+        total = profiler.samples or 1
+        for label, count in profiler.top_functions(5):
+            self.output(f"  {count * 100 / total:5.1f}%  {label}\n")
@@ -0,0 +1,70 @@
+"""
+/queue - Lähtevien komentojen jono ja nopeusraja
+"""
+
+from cmds.base import Command
+
+CLASS_NAMES = {"user": "käyttäjä", "action": "triggerit/ajastimet", "bulk": "massa"}
+
+
+class QueueCommand(Command):
+    name = "queue"
+    aliases = []
+    description = "Näytä tai tyhjennä lähtevien komentojen jono"
+    usage = "/queue | /queue flush [user|action|bulk] | /queue rate <n/s> [burst]"
+
+    async def execute(self, args):
+        """Näytä jono, tyhjennä se tai vaihda nopeusraja."""
+        parts = args.split() if args else []
+        action = parts[0].lower() if parts else "show"
+        outbound = self.client.outbound
+
+        if action == "show":
+            self.show_queue()
+        elif action == "flush":
+            self.flush(parts[1].lower() if len(parts) > 1 else None)
+        elif action == "rate" and len(parts) >= 2:
+            try:
+                rate = float(parts[1])
+                burst = int(parts[2]) if len(parts) > 2 else outbound.burst
+            except ValueError:
+                self.error("Virheellinen nopeus")
+                return True
+            outbound.rate = max(0.0, rate)
+            outbound.burst = max(1, burst)
+            outbound.tokens = min(outbound.tokens, outbound.burst)
+            self.info(f"Nopeusraja: {self.describe_rate()}")
+        else:
+            self.show_usage()
+
+        return True
+
+    def describe_rate(self):
+        outbound = self.client.outbound
+        if outbound.rate <= 0:
+            return "ei rajaa"
+        return f"{outbound.rate:g} komentoa/s, purske {outbound.burst}"
+
+    def flush(self, class_name):
+        """Poista jonottavat komennot (kaikki tai yksi luokka)."""
+        names = list(CLASS_NAMES)
+        if class_name is not None and class_name not in names:
+            self.error(f"Tuntematon luokka: {class_name} ({', '.join(names)})")
+            return
+        priority = None if class_name is None else names.index(class_name)
+        count = self.client.outbound.clear(priority)
+        self.info(f"{count} komentoa poistettu jonosta")
+
+    def show_queue(self):
+        """Näytä jonot luokittain."""
+        outbound = self.client.outbound
+        self.info(f"Lähtevä jono: {outbound.pending()} odottaa, {self.describe_rate()}")
+        if outbound.rate > 0:
+            self.output(f"  Tokeneita: {outbound.tokens:.1f}/{outbound.burst}\n")
+        for priority, (name, label) in enumerate(CLASS_NAMES.items()):
+            queue = outbound.queues[priority]
+            head = f"  seuraava: {outbound.peek(priority)}" if queue else ""
+            self.output(f"  {name:<7} {label:<20} {len(queue):>5} jonossa "
+                        f"{outbound.sent[priority]:>7} lähetetty{head}\n")
+        if outbound.dropped:
+            self.output(f"  Poistettu jonosta yhteensä: {outbound.dropped}\n")
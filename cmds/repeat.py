@@ -0,0 +1,43 @@
+"""
+/repeat - Toista komento N kertaa, heti tai välein
+"""
+
+from cmds.base import Command, parse_interval
+
+# Yläraja toistoille, ettei kirjoitusvirhe lähetä tuhansia komentoja
+REPEAT_MAX = 100
+
+
+class RepeatCommand(Command):
+    name = "repeat"
+    aliases = ["rep"]
+    description = "Toista komento N kertaa"
+    usage = "/repeat <N> [<väli>] <komento>  (esim. /repeat 3 kill rat, /repeat 5 2s kick)"
+
+    async def execute(self, args):
+        """Aja komento N kertaa heti tai ajastimella välein."""
+        parts = args.split(maxsplit=2) if args else []
+        if len(parts) < 2:
+            self.show_usage()
+            return True
+
+        try:
+            count = int(parts[0])
+        except ValueError:
+            self.error(f"Virheellinen toistomäärä: {parts[0]}")
+            return True
+        if not 1 <= count <= REPEAT_MAX:
+            self.error(f"Toistomäärän pitää olla 1-{REPEAT_MAX}")
+            return True
+
+        # Yksiköllinen aika toisena sanana = välein ("2s"), muuten heti
+        interval = parse_interval(parts[1], require_unit=True) if len(parts) > 2 else None
+        if interval is None:
+            # Kaikki toistot yhtenä eränä: yksi kirjoitus ja drain
+            command = args.split(maxsplit=1)[1]
+            await self.client.execute_lines([command] * count)
+            return True
+
+        timer = self.client.user_timers.add(interval, parts[2], count=count, delay=0)
+        self.info(f"Ajastin #{timer.id}: {parts[2]} {count} kertaa {timer.interval:g} s välein")
+        return True
@@ -0,0 +1,57 @@
+"""
+/search - Hae vierityspuskurista säännöllisellä lausekkeella
+"""
+
+import re
+
+from cmds.base import Command
+
+
+class SearchCommand(Command):
+    name = "search"
+    aliases = ["s", "find"]
+    description = "Hae tulostehistoriasta"
+    usage = "/search <regex> | /search -n | /search -p | /search -c"
+
+    async def execute(self, args):
+        """Aloita haku tai siirry osumasta toiseen."""
+        args = args.strip()
+        if not args:
+            self.show_status()
+            return True
+
+        if args in ("-n", "--next"):
+            self.step(1)
+        elif args in ("-p", "--prev"):
+            self.step(-1)
+        elif args in ("-c", "--clear"):
+            self.client.cancel_search()
+            self.client.scroll_offset = 0
+            self.client.refresh_status()
+            self.info("Haku lopetettu")
+        else:
+            try:
+                self.client.start_search(args)
+            except re.error as e:
+                self.error(f"Virheellinen hakulauseke: {e}")
+
+        return True
+
+    def step(self, direction):
+        """Siirry vanhempaan (1) tai uudempaan (-1) osumaan."""
+        if not self.client.search:
+            self.error("Ei aktiivista hakua")
+            return
+        if not self.client.search_step(direction):
+            self.info("Ei enempää osumia")
+
+    def show_status(self):
+        """Näytä aktiivisen haun tila."""
+        search = self.client.search
+        if not search:
+            self.show_usage()
+            self.output("  Pikanäppäimet: Ctrl-F hae, F3 vanhempi, Shift-F3 uudempi osuma\n")
+            return
+        state = "valmis" if search.done else "kesken"
+        self.info(f"Haku '{search.pattern.pattern}': "
+                  f"{len(search.matches)} osumaa ({state})")
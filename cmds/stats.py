@@ -0,0 +1,74 @@
+"""
+/stats - Suorituskykytilastot (tapahtumasilmukan viive, hitaat callbackit)
+"""
+
+from datetime import datetime
+
+from cmds.base import Command
+
+
+class StatsCommand(Command):
+    name = "stats"
+    aliases = ["st"]
+    description = "Näytä suorituskykytilastot"
+    usage = "/stats [reset] | /stats slow on|off"
+
+    async def execute(self, args):
+        """Näytä tai nollaa tilastot."""
+        parts = args.split() if args else []
+        action = parts[0].lower() if parts else ""
+
+        if not action:
+            self.show_stats()
+        elif action == "reset":
+            self.reset_stats()
+        elif action == "slow" and len(parts) > 1 and parts[1].lower() in ("on", "off"):
+            self.set_slow_callbacks(parts[1].lower() == "on")
+        else:
+            self.show_usage()
+
+        return True
+
+    def show_stats(self):
+        """Näytä viivehistogrammi, viimeisimmät piikit ja hitaat callbackit."""
+        monitor = self.client.lag_monitor
+
+        self.info("Suorituskyky")
+        self.output(f"  Silmukan viive: {monitor.histogram.summary()}\n")
+        probe = self.client.link_probe
+        if not probe.enabled:
+            self.output("  Yhteyden viive: ei mitata (PING_INTERVAL)\n")
+        elif probe.ewma is None:
+            self.output(f"  Yhteyden viive: ei vielä vastauksia ({probe.sent} koetinta)\n")
+        else:
+            self.output(f"  Yhteyden viive: RTT {probe.ewma * 1000:.0f} ms, "
+                        f"p95 {probe.p95() * 1000:.0f} ms ({len(probe.samples)} mittausta, "
+                        f"{probe.sent} koetinta)\n")
+
+        if monitor.spikes:
+            self.output(f"  Viimeisimmät piikit (>= {monitor.threshold * 1000:.0f} ms):\n")
+            for ts, lag, cause in list(monitor.spikes)[-5:]:
+                when = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+                self.output(f"    {when}  {lag * 1000:6.0f} ms  {cause}\n")
+
+        state = "ON" if monitor.slow_callback_reporting else "OFF"
+        self.output(f"  Hitaiden callbackien raportointi: {state}\n")
+        for ts, message in list(monitor.slow_callbacks)[-5:]:
+            when = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+            self.output(f"    {when}  {message}\n")
+
+    def reset_stats(self):
+        """Nollaa histogrammi ja piikkilistat."""
+        monitor = self.client.lag_monitor
+        monitor.histogram.reset()
+        monitor.spikes.clear()
+        monitor.slow_callbacks.clear()
+        self.info("Tilastot nollattu")
+
+    def set_slow_callbacks(self, enabled):
+        """Kytke asyncion hitaiden callbackien raportointi."""
+        self.client.lag_monitor.set_slow_callback_reporting(enabled)
+        if enabled:
+            self.info("Hitaiden callbackien raportointi ON (asyncio debug-tila)")
+        else:
+            self.info("Hitaiden callbackien raportointi OFF")
@@ -0,0 +1,85 @@
+"""
+/subst - Korvaa tekstiä palvelimen riveillä ennen näyttämistä
+"""
+
+import re
+
+from cmds.base import Command
+
+
+class SubstCommand(Command):
+    name = "subst"
+    aliases = ["sub"]
+    description = "Korvaa tekstiä palvelimen riveillä"
+    usage = "/subst <teksti|/regex/> => <korvaus> | /subst -d <id> | /subst"
+
+    async def execute(self, args):
+        """Lisää, poista tai listaa korvaukset."""
+        args = args.strip()
+        if not args or args in ("-l", "--list"):
+            self.show_rules()
+            return True
+
+        parts = args.split(maxsplit=1)
+        if parts[0] in ("-d", "--delete"):
+            if len(parts) < 2:
+                self.error("Anna poistettavan korvauksen numero")
+            else:
+                self.delete_rule(parts[1])
+            return True
+
+        if "=>" not in args:
+            self.show_usage()
+            return True
+
+        pattern, _, replacement = args.partition("=>")
+        pattern, replacement = pattern.strip(), replacement.strip()
+        if not pattern:
+            self.show_usage()
+            return True
+
+        is_regex = len(pattern) >= 2 and pattern.startswith('/') and pattern.endswith('/')
+        if is_regex:
+            pattern = pattern[1:-1]
+        try:
+            rule = self.client.output_filter.add_subst(pattern, replacement, is_regex=is_regex)
+        except re.error as e:
+            self.error(f"Virheellinen lauseke: {e}")
+            return True
+
+        self.info(f"Korvaus #{rule.id} luotu: {self.describe(rule)}")
+        return True
+
+    def delete_rule(self, arg):
+        """Poista korvaus numerolla."""
+        try:
+            rule_id = int(arg.lstrip('#'))
+        except ValueError:
+            self.error(f"Virheellinen numero: {arg}")
+            return
+
+        rule = self.client.output_filter.triggers.get(rule_id)
+        if rule is None or rule.is_gag:
+            self.error(f"Korvausta #{rule_id} ei ole olemassa")
+            return
+        self.client.output_filter.remove(rule_id)
+        self.info(f"Korvaus #{rule_id} poistettu")
+
+    @staticmethod
+    def describe(rule):
+        """Säännön kuvaus listaukseen."""
+        pattern = f"/{rule.pattern}/" if rule.is_regex else rule.pattern
+        return f"{pattern} => {rule.action}"
+
+    def show_rules(self):
+        """Listaa korvaukset osumineen."""
+        rules = [r for r in self.client.output_filter.triggers.values() if not r.is_gag]
+        if not rules:
+            self.info("Ei korvauksia")
+            self.output("  Luo: /subst <teksti> => <korvaus>\n")
+            self.output("  Regex: /subst /^(\\w+) tells you: / => [$1] \n")
+            return
+
+        self.info(f"Korvaukset ({len(rules)} kpl)")
+        for rule in rules:
+            self.output(f"  #{rule.id:<4} {rule.hits:>7}  {self.describe(rule)}\n")
@@ -0,0 +1,91 @@
+"""
+/timer - Ajasta komentoja toistuvasti tai kerran viiveellä
+"""
+
+from datetime import datetime, timedelta
+
+from cmds.base import Command, parse_interval
+
+
+class TimerCommand(Command):
+    name = "timer"
+    aliases = ["tm"]
+    description = "Ajasta komentoja"
+    usage = ("/timer add <väli> <komento> | /timer once <viive> <komento> | "
+             "/timer -d <id> | /timer clear")
+
+    async def execute(self, args):
+        """Lisää, poista tai listaa ajastimia."""
+        parts = args.split(maxsplit=2) if args else []
+        action = parts[0].lower() if parts else ""
+        manager = self.client.user_timers
+
+        if not action or action in ("-l", "list"):
+            self.show_timers()
+        elif action in ("add", "once"):
+            self.add_timer(parts[1:], once=(action == "once"))
+        elif action in ("-d", "del"):
+            if len(parts) < 2:
+                self.error("Anna poistettavan ajastimen numero")
+            else:
+                self.delete_timer(parts[1])
+        elif action == "clear":
+            count = len(manager.active)
+            manager.clear()
+            self.info(f"{count} ajastinta poistettu")
+        else:
+            self.show_usage()
+
+        return True
+
+    def add_timer(self, args, once):
+        """Lisää toistuva tai kertaluonteinen ajastin."""
+        if len(args) < 2:
+            self.show_usage()
+            return
+
+        interval = parse_interval(args[0])
+        if interval is None:
+            self.error(f"Virheellinen aika: {args[0]} (esim. 30, 1.5s, 2m, 1h)")
+            return
+
+        manager = self.client.user_timers
+        timer = manager.add(interval, args[1], count=1 if once else None)
+        kind = "kerran" if once else "toistuva"
+        self.info(f"Ajastin #{timer.id} ({kind}, {timer.interval:g} s): {timer.command}")
+
+    def delete_timer(self, arg):
+        """Poista ajastin numerolla."""
+        try:
+            timer_id = int(arg.lstrip('#'))
+        except ValueError:
+            self.error(f"Virheellinen ajastimen numero: {arg}")
+            return
+
+        if self.client.user_timers.remove(timer_id):
+            self.info(f"Ajastin #{timer_id} poistettu")
+        else:
+            self.error(f"Ajastinta #{timer_id} ei ole olemassa")
+
+    def show_timers(self):
+        """Listaa ajastimet seuraavan laukeaman mukaan."""
+        manager = self.client.user_timers
+        if not manager.active:
+            self.info("Ei ajastimia")
+            self.output("  Toistuva: /timer add 5m save\n")
+            self.output("  Kerran:   /timer once 30s say valmis\n")
+            self.output("  Toista:   /repeat 3 kill rat | /repeat 3 2s kill rat\n")
+            return
+
+        now = manager.timers.time()
+        wall = datetime.now()
+        self.info(f"Ajastimet ({len(manager.active)} kpl)")
+        self.output(f"  {'#':<5} {'väli':>8} {'seuraava':>9} {'kello':>9} {'ajoja':>6}  komento\n")
+        for timer in sorted(manager.active.values(), key=lambda t: t.due):
+            left = max(0.0, timer.due - now)
+            at = (wall + timedelta(seconds=left)).strftime("%H:%M:%S")
+            interval = f"{timer.interval:g}s"
+            if timer.remaining is not None:
+                interval += f" x{timer.remaining}"
+            self.output(f"  #{timer.id:<4} {interval:>8} {left:>8.1f}s {at:>9} "
+                        f"{timer.runs:>6}  {timer.command}\n")
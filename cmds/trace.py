@@ -0,0 +1,68 @@
+"""
+/trace - Päästä päähän -latenssin mittaus (p50/p95/p99)
+"""
+
+from datetime import datetime
+
+from cmds.base import Command
+
+
+class TraceCommand(Command):
+    name = "trace"
+    aliases = ["lat"]
+    description = "Mittaa latenssi socketista näytölle ja Enteristä palvelimelle"
+    usage = "/trace [on|off|show|reset|export [tiedosto]]"
+
+    async def execute(self, args):
+        """Hallitse latenssimittausta."""
+        parts = args.split() if args else []
+        action = parts[0].lower() if parts else "show"
+        tracer = self.client.tracer
+
+        if action == "on":
+            tracer.enabled = True
+            self.info("Latenssimittaus ON")
+        elif action == "off":
+            tracer.enabled = False
+            self.info("Latenssimittaus OFF")
+        elif action == "show":
+            self.show_report()
+        elif action == "reset":
+            tracer.reset()
+            self.info("Latenssimittaukset nollattu")
+        elif action == "export":
+            self.export_report(parts[1] if len(parts) > 1 else None)
+        else:
+            self.show_usage()
+
+        return True
+
+    def show_report(self):
+        """Näytä persentiilitaulukko."""
+        tracer = self.client.tracer
+        state = "ON" if tracer.enabled else "OFF"
+        self.info(f"Latenssimittaus {state}")
+        for line in tracer.report_lines():
+            self.output(f"  {line}\n")
+        if not tracer.enabled:
+            self.output("  Käynnistä: /trace on\n")
+
+    def export_report(self, filename):
+        """Kirjoita raportti tiedostoon logs-kansioon."""
+        if filename:
+            if not filename.endswith('.txt'):
+                filename += '.txt'
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            filename = f"latency-{timestamp}.txt"
+
+        try:
+            logs_dir = self.client.logs_path()
+            logs_dir.mkdir(exist_ok=True)
+            path = logs_dir / filename
+            self.client.tracer.export(path)
+        except Exception as e:
+            self.error(f"Raportin tallennus epäonnistui: {e}")
+            return
+
+        self.info(f"Latenssiraportti tallennettu: {path}")
@@ -0,0 +1,160 @@
+"""
+/trigger - Automaattiset reaktiot palvelimen tekstiin
+"""
+
+import re
+
+from cmds.base import Command
+
+
+class TriggerCommand(Command):
+    name = "trigger"
+    aliases = ["tr"]
+    description = "Luo ja hallitse triggereitä"
+    usage = ("/trigger <teksti|/regex/> => <komento> | /trigger /a/ ... /b/ => <komento>"
+             " | /trigger -d <id> | /trigger cooldown <id> <s> | /trigger stats")
+
+    async def execute(self, args):
+        """Hallitse triggereitä."""
+        args = args.strip()
+        if not args or args in ("-l", "--list"):
+            self.show_triggers()
+            return True
+
+        parts = args.split(maxsplit=1)
+        first = parts[0]
+
+        if first in ("-d", "--delete"):
+            if len(parts) < 2:
+                self.error("Anna poistettavan triggerin numero")
+                return True
+            self.delete_trigger(parts[1])
+        elif first == "stats":
+            self.show_stats()
+        elif first == "cooldown":
+            self.set_cooldown(parts[1].split() if len(parts) > 1 else [])
+        elif "=>" in args:
+            pattern, _, action = args.partition("=>")
+            self.create_trigger(pattern.strip(), action.strip())
+        else:
+            self.show_usage()
+
+        return True
+
+    def create_trigger(self, pattern, action):
+        """Luo triggeri. /.../ tulkitaan säännölliseksi lausekkeeksi."""
+        if not pattern or not action:
+            self.show_usage()
+            return
+
+        if " ... " in pattern:
+            self.create_multiline_trigger(pattern, action)
+            return
+
+        is_regex = self.is_regex(pattern)
+        if is_regex:
+            pattern = pattern[1:-1]
+
+        try:
+            trigger = self.client.triggers.add(pattern, action, is_regex=is_regex)
+        except re.error as e:
+            self.error(f"Virheellinen lauseke: {e}")
+            return
+
+        self.info(f"Triggeri #{trigger.id} luotu: {self.describe(trigger)}")
+
+    def create_multiline_trigger(self, pattern, action):
+        """Luo monirivinen triggeri: /a/ ... /b/ (välissä saa olla muita rivejä)."""
+        steps = [step.strip() for step in pattern.split(" ... ")]
+        if not all(self.is_regex(step) for step in steps):
+            self.error("Monirivisen triggerin jokainen askel kirjoitetaan /regex/")
+            return
+
+        try:
+            trigger = self.client.add_multiline_trigger(
+                [step[1:-1] for step in steps], action)
+        except re.error as e:
+            self.error(f"Virheellinen lauseke: {e}")
+            return
+
+        self.info(f"Monirivinen triggeri #{trigger.id} luotu: {self.describe(trigger)}")
+
+    @staticmethod
+    def is_regex(pattern):
+        """Onko kuvio kirjoitettu /.../ -muodossa."""
+        return len(pattern) >= 2 and pattern.startswith('/') and pattern.endswith('/')
+
+    def delete_trigger(self, arg):
+        """Poista triggeri numerolla."""
+        try:
+            trigger_id = int(arg.lstrip('#'))
+        except ValueError:
+            self.error(f"Virheellinen triggerin numero: {arg}")
+            return
+
+        if self.client.remove_trigger(trigger_id):
+            self.info(f"Triggeri #{trigger_id} poistettu")
+        else:
+            self.error(f"Triggeriä #{trigger_id} ei ole olemassa")
+
+    def set_cooldown(self, args):
+        """Aseta triggerille oma jäähdytysaika sekunteina."""
+        if len(args) != 2:
+            self.error("Käyttö: /trigger cooldown <id> <sekunnit>")
+            return
+        try:
+            trigger_id = int(args[0].lstrip('#'))
+            seconds = float(args[1])
+        except ValueError:
+            self.error("Virheellinen numero tai aika")
+            return
+
+        trigger = self.client.triggers.triggers.get(trigger_id)
+        if trigger is None:
+            self.error(f"Triggeriä #{trigger_id} ei ole olemassa")
+            return
+        trigger.cooldown = max(0.0, seconds)
+        self.info(f"Triggerin #{trigger_id} jäähdytys {trigger.cooldown:g} s")
+
+    def describe(self, trigger):
+        """Triggerin kuvaus listaukseen."""
+        if trigger.steps:
+            pattern = " ... ".join(f"/{step}/" for step in trigger.steps)
+        elif trigger.is_regex:
+            pattern = f"/{trigger.pattern}/"
+        else:
+            pattern = trigger.pattern
+        return f"{pattern} => {trigger.action}"
+
+    def show_triggers(self):
+        """Listaa triggerit."""
+        triggers = self.client.triggers.triggers
+        if not triggers:
+            self.info("Ei triggereitä")
+            self.output("  Luo: /trigger <teksti> => <komento>\n")
+            self.output("  Esim: /trigger You are hungry => eat bread\n")
+            self.output("  Regex: /trigger /^(\\w+) arrives/ => say hi $1\n")
+            self.output("  Monirivinen: /trigger /^(\\w+) says:$/ ... /^Exits: (.+)$/ => say $1 $2\n")
+            return
+
+        self.info(f"Triggerit ({len(triggers)} kpl)")
+        for trigger in triggers.values():
+            self.output(f"  #{trigger.id:<4} {self.describe(trigger)}\n")
+
+    def show_stats(self):
+        """Näytä osumat ja ajat triggereittäin."""
+        engine = self.client.triggers
+        self.info(f"Triggerit: {engine.lines_scanned} riviä sovitettu")
+        self.output(f"  Läpikäynti/rivi: {engine.scan_histogram.summary()}\n")
+        sched = self.client.action_scheduler
+        self.output(f"  Toiminnot: {sched.submitted} pyyntöä, {sched.executed} ajettu, "
+                    f"{sched.coalesced} yhdistetty, {sched.suppressed} jäähdytyksessä "
+                    f"(jäähdytys {sched.cooldown:g} s, enintään {sched.rate:g}/s)\n")
+        if not engine.triggers:
+            return
+        self.output(f"  {'#':<5} {'osumia':>7} {'ms/osuma':>9}  kuvio\n")
+        ranked = sorted(engine.triggers.values(), key=lambda t: -t.hits)
+        for trigger in ranked:
+            per_hit = trigger.action_time * 1000 / trigger.hits if trigger.hits else 0.0
+            self.output(f"  #{trigger.id:<4} {trigger.hits:>7} {per_hit:>9.3f}  "
+                        f"{self.describe(trigger)}\n")
@@ -0,0 +1,93 @@
+"""
+/walk - Speedwalk: tiivis polku (3n2e4s) liikkumiskomennoiksi
+"""
+
+import re
+
+from cmds.base import Command
+
+# Yksi askel: valinnainen määrä ja suunta tai (komento). Vinosuunnat
+# (ne nw se sw) ensin, joten "2ne" on kaksi kertaa ne; "n e" kulkee erikseen.
+_STEP_RE = re.compile(r'(\d*)(?:(ne|nw|se|sw|[nsewud])|\(([^()]+)\))')
+
+# Yläraja askelille, ettei kirjoitusvirhe (esim. 999n) tulvi palvelinta
+WALK_MAX_STEPS = 500
+
+
+def parse_speedwalk(path):
+    """Laajenna speedwalk-polku komennoiksi.
+
+    "3n2e(enter cave)s" -> n n n e e "enter cave" s ja "2ne" -> ne ne.
+    Välilyönnit erottavat askeleet ("n e" -> n e) mutta ohitetaan muuten.
+
+    Raises:
+        ValueError: jos polussa on tuntematon merkki tai liikaa askelia
+    """
+    steps = []
+    pos = 0
+    while pos < len(path):
+        if path[pos].isspace():
+            pos += 1
+            continue
+        m = _STEP_RE.match(path, pos)
+        if not m:
+            raise ValueError(f"tuntematon askel kohdassa {pos + 1}: {path[pos:pos + 10]}")
+        count = int(m.group(1)) if m.group(1) else 1
+        if len(steps) + count > WALK_MAX_STEPS:
+            raise ValueError(f"yli {WALK_MAX_STEPS} askelta")
+        steps.extend([m.group(2) or m.group(3).strip()] * count)
+        pos = m.end()
+    return steps
+
+
+class WalkCommand(Command):
+    name = "walk"
+    aliases = ["sw"]
+    description = "Speedwalk: kulje tiivis polku (3n2e4s)"
+    usage = "/walk [-p] <polku> | /walk stop  (-p = odota promptia askelten välissä)"
+
+    async def execute(self, args):
+        """Aloita, pysäytä tai näytä kävely."""
+        args = args.strip()
+        if not args:
+            self.show_status()
+            return True
+
+        if args in ("stop", "-c"):
+            if self.client.cancel_walk():
+                done, total = self.client.walk_progress
+                self.info(f"Kävely pysäytetty ({done}/{total})")
+            else:
+                self.info("Ei käynnissä olevaa kävelyä")
+            return True
+
+        paced = False
+        if args.startswith("-p "):
+            paced = True
+            args = args[3:]
+
+        try:
+            steps = parse_speedwalk(args)
+        except ValueError as e:
+            self.error(f"Virheellinen polku: {e}")
+            return True
+        if not steps:
+            self.show_usage()
+            return True
+
+        self.client.start_walk(steps, paced=paced)
+        mode = "promptin tahdissa" if paced else "yhdellä kertaa"
+        self.info(f"Kävellään {len(steps)} askelta {mode} (/walk stop keskeyttää)")
+        return True
+
+    def show_status(self):
+        """Näytä kävelyn eteneminen."""
+        task = self.client.walk_task
+        done, total = self.client.walk_progress
+        # Rajoitin voi vielä pitää askelia jonossa vaikka task on valmis
+        queued = self.client.outbound.queues[-1]
+        if (task is None or task.done()) and not queued:
+            self.show_usage()
+            self.output("  Esim: /walk 3n2e(enter cave)d\n")
+            return
+        self.info(f"Kävely käynnissä: {done}/{total} lähetetty, {len(queued)} jonossa")
@@ -0,0 +1,153 @@
+"""
+Yksikkötestit pysyvälle komentohistorialle (batcli_history).
+
+Aja:
+    python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+# Lisää projektin juuri importtipolkuun
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batcli_history  # noqa: E402
+from batcli_history import CommandHistory, build_index, read_tail, word_starts  # noqa: E402
+
+
+def indexed(history):
+    """Rakenna indeksi kuten client tekee taustasäikeessä."""
+    snapshot = list(history.entries)
+    history.set_index(build_index(snapshot), len(snapshot), history.generation)
+    return history
+
+
+class HistoryFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / batcli_history.HISTORY_FILENAME
+
+    def test_commands_survive_restart(self):
+        history = CommandHistory(self.path)
+        for cmd in ("look", "kill rat", "look"):
+            history.append(cmd)
+        again = CommandHistory(self.path)
+        self.assertFalse(again.loaded)
+        self.assertEqual(list(again), ["kill rat", "look"])
+
+    def test_only_the_tail_is_loaded(self):
+        self.path.write_text("".join(f"cmd {i}\n" for i in range(1000)), encoding="utf-8")
+        history = CommandHistory(self.path, max_entries=10)
+        self.assertEqual(list(history), [f"cmd {i}" for i in range(990, 1000)])
+
+    def test_read_tail_skips_cut_first_line(self):
+        self.path.write_text("x" * 100 + "\n" + "".join(f"r{i}\n" for i in range(5)), encoding="utf-8")
+        with mock.patch.object(batcli_history, "_READ_BLOCK", 8):
+            self.assertEqual(read_tail(self.path, 3), ["r2", "r3", "r4"])
+
+    def test_commands_added_before_load_stay_newest(self):
+        CommandHistory(self.path).append("old")
+        history = CommandHistory(self.path)
+        history.append("new")
+        self.assertEqual(list(history), ["old", "new"])
+
+    def test_duplicate_heavy_file_is_compacted(self):
+        self.path.write_text("look\n" * 50 + "kill\n", encoding="utf-8")
+        history = CommandHistory(self.path, max_entries=10)
+        history.load()
+        self.assertEqual(self.path.read_text(encoding="utf-8"), "look\nkill\n")
+
+
+    def test_repeated_command_is_written_once(self):
+        history = CommandHistory(self.path)
+        self.addCleanup(history.close)
+        history.load()
+        for _ in range(3):
+            history.append("kill rat")
+        self.assertEqual(self.path.read_text(encoding="utf-8"), "kill rat\n")
+
+    def test_file_is_compacted_during_session(self):
+        history = CommandHistory(self.path, max_entries=4)
+        self.addCleanup(history.close)
+        history.load()
+        for i in range(9):
+            history.append(("a", "b")[i % 2])
+        lines = self.path.read_text(encoding="utf-8").splitlines()
+        self.assertLessEqual(len(lines), 8)
+        self.assertEqual(lines[-2:], ["b", "a"])
+
+class HistoryNavigationTest(unittest.TestCase):
+    def test_reuse_moves_command_to_newest(self):
+        history = CommandHistory()
+        for cmd in ("a", "b", "a"):
+            history.append(cmd)
+        self.assertEqual(list(history), ["b", "a"])
+        pos, cmd = history.previous()
+        self.assertEqual(cmd, "a")
+        pos, cmd = history.previous(pos)
+        self.assertEqual(cmd, "b")
+        self.assertIsNone(history.previous(pos))
+        self.assertEqual(history.next(pos)[1], "a")
+
+    def test_cap_keeps_newest(self):
+        history = CommandHistory(max_entries=4)
+        for i in range(20):
+            history.append(f"c{i}")
+        self.assertLessEqual(len(history), 5)
+        self.assertEqual(list(history)[-1], "c19")
+
+
+class HistorySearchTest(unittest.TestCase):
+    def setUp(self):
+        self.history = CommandHistory()
+        for cmd in ("cast heal tiku", "kill rat", "cast fireball orc", "say hello"):
+            self.history.append(cmd)
+
+    def test_word_starts(self):
+        self.assertEqual(word_starts("cast  heal tiku"), [0, 6, 11])
+
+    def test_newest_word_start_match_wins(self):
+        for history in (self.history, indexed(self.history)):
+            self.assertEqual(history.search("cast")[1], "cast fireball orc")
+            self.assertEqual(history.search("he")[1], "say hello")
+            self.assertIsNone(history.search("ast"))  # Ei sanan alussa
+
+    def test_stepping_to_older_matches(self):
+        indexed(self.history)
+        pos, cmd, span = self.history.search("cast")
+        pos, cmd, span = self.history.search("cast", before=pos, span=span)
+        self.assertEqual(cmd, "cast heal tiku")
+        self.assertIsNone(self.history.search("cast", before=pos, span=span))
+
+    def test_narrowing_search_stays_inside_previous_span(self):
+        indexed(self.history)
+        self.history.append("cast light")  # Indeksoimaton, käydään läpi suoraan
+        self.assertEqual(self.history.search("c")[1], "cast light")
+        outer = self.history.index_range("c")
+        _pos, cmd, inner = self.history.search("cast h", span=outer)
+        self.assertEqual(cmd, "cast heal tiku")
+        self.assertTrue(outer[0] <= inner[0] < inner[1] <= outer[1])
+
+    def test_stale_index_is_ignored(self):
+        snapshot = list(self.history.entries)
+        generation = self.history.generation
+        self.history._compact()
+        self.assertFalse(self.history.set_index(build_index(snapshot), len(snapshot), generation))
+
+    def test_large_history_agrees_with_scan(self):
+        history = CommandHistory()
+        for i in range(3000):
+            history.append(f"w{i % 700} x{i}")
+        expected = history.search("w69 ")
+        indexed(history)
+        self.assertEqual(history.search("w69 ")[:2], expected[:2])
+        self.assertEqual(history.search("w")[1], "w199 x2999")
+
+
+if __name__ == "__main__":
+    unittest.main()
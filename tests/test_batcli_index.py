@@ -0,0 +1,121 @@
+"""
+Yksikkötestit sessiolokien FTS5-indeksille (batcli_index).
+
+Aja:
+    python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Lisää projektin juuri importtipolkuun
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batcli_index  # noqa: E402
+from batcli_index import LogIndex, parse_log_file  # noqa: E402
+
+
+SESSION = (
+    "\n" + "=" * 60 + "\n"
+    "Loggaus aloitettu: 2026-03-04 20:15:00\n"
+    + "=" * 60 + "\n\n"
+)
+
+
+class LogIndexTestBase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.logs = Path(self.tmp.name)
+        self.index = LogIndex(self.logs / batcli_index.INDEX_FILENAME)
+        self.addCleanup(self.index.close)
+
+    def write(self, name, text, mode="w"):
+        with open(self.logs / name, mode, encoding="utf-8") as f:
+            f.write(text)
+
+
+class ParseLogFileTest(LogIndexTestBase):
+    def test_timestamp_comes_from_session_marker(self):
+        self.write("202603042015.log", SESSION + "You kill the kobold.\n")
+        _path, _offset, _lineno, rows, _ts = parse_log_file(
+            str(self.logs / "202603042015.log"), 0, 0, None)
+        self.assertEqual(rows, [(6, "2026-03-04 20:15:00", "You kill the kobold.")])
+
+    def test_timestamp_falls_back_to_file_name(self):
+        self.write("202601021340.log", "rivi\n")
+        rows = parse_log_file(str(self.logs / "202601021340.log"), 0, 0, None)[3]
+        self.assertEqual(rows[0][1], "2026-01-02 13:40:00")
+
+    def test_incomplete_last_line_is_left_for_later(self):
+        self.write("a.log", "valmis\nkesken")
+        _path, offset, lineno, rows, _ts = parse_log_file(
+            str(self.logs / "a.log"), 0, 0, None)
+        self.assertEqual([r[2] for r in rows], ["valmis"])
+        self.assertEqual(offset, len("valmis\n"))
+        self.assertEqual(lineno, 1)
+
+
+class LogIndexUpdateTest(LogIndexTestBase):
+    def test_new_files_are_indexed(self):
+        self.write("202603042015.log", SESSION + "You kill the kobold.\n")
+        self.write("202603052015.log", "A goblin arrives.\n")
+        files, lines = self.index.update(self.logs, workers=2)
+        self.assertEqual((files, lines), (2, 2))
+        self.assertEqual(self.index.stats(), (2, 2))
+
+    def test_unchanged_files_are_skipped(self):
+        self.write("a.log", "rivi\n")
+        self.index.update(self.logs, workers=1)
+        self.assertEqual(self.index.update(self.logs, workers=1), (0, 0))
+
+    def test_grown_file_is_read_from_where_it_stopped(self):
+        self.write("a.log", "eka\n")
+        self.index.update(self.logs, workers=1)
+        self.write("a.log", "toka\n", mode="a")
+        os.utime(self.logs / "a.log", (1, 1))  # mtime muuttuu varmasti
+        self.assertEqual(self.index.update(self.logs, workers=1), (1, 1))
+        hit = self.index.search("toka")[0]
+        self.assertEqual(hit["lineno"], 2)
+        self.assertEqual(self.index.stats(), (1, 2))
+
+    def test_rewritten_file_is_reindexed(self):
+        self.write("a.log", "vanha rivi joka on pitka\n")
+        self.index.update(self.logs, workers=1)
+        self.write("a.log", "uusi\n")
+        self.index.update(self.logs, workers=1)
+        self.assertEqual(self.index.search("vanha"), [])
+        self.assertEqual(len(self.index.search("uusi")), 1)
+
+
+class LogIndexSearchTest(LogIndexTestBase):
+    def setUp(self):
+        super().setUp()
+        self.write("202603042015.log", SESSION + "".join(
+            f"rivi {i}\n" for i in range(5)) + "Tiku tells you: hello\n"
+            + "".join(f"loppu {i}\n" for i in range(5)))
+        self.index.update(self.logs, workers=1)
+
+    def test_hit_has_file_timestamp_and_context(self):
+        hit = self.index.search("tells", context=1)[0]
+        self.assertTrue(hit["path"].endswith("202603042015.log"))
+        self.assertEqual(hit["ts"], "2026-03-04 20:15:00")
+        self.assertEqual([t for _n, t in hit["context"]],
+                         ["rivi 4", "Tiku tells you: hello", "loppu 0"])
+
+    def test_invalid_fts_syntax_falls_back_to_words(self):
+        self.assertEqual(len(self.index.search("tells you:")), 1)
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.search("rivi", limit=2)), 2)
+
+    def test_format_hit_marks_the_matching_line(self):
+        lines = batcli_index.format_hit(self.index.search("hello", context=1)[0])
+        self.assertIn("> Tiku tells you: hello", lines[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
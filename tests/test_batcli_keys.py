@@ -0,0 +1,75 @@
+"""
+Yksikkötestit näppäinkartalle (batcli_keys).
+
+Aja:
+    python3 -m unittest discover -s tests
+"""
+
+import curses
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Lisää projektin juuri importtipolkuun
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batcli_keys import (  # noqa: E402
+    DEFAULT_KEYMAP, Keymap, KeymapError, describe_key, parse_binding, parse_key,
+)
+
+
+class ParseKeyTest(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(parse_key("F5"), [curses.KEY_F5])
+        self.assertEqual(parse_key("C-x C-s"), [("\x18", "\x13")])
+        self.assertEqual(parse_key("M-h"), [("\x1b", "h")])
+        self.assertEqual(parse_key("Enter"), ["\n", "\r", curses.KEY_ENTER])
+        self.assertEqual(parse_key("KP7"), [("\x1b", "O", "w"), curses.KEY_A1])
+        self.assertEqual(parse_key("\\e[24~"), [("\x1b", "[", "2", "4", "~")])
+
+    def test_unknown_key_and_action(self):
+        with self.assertRaises(KeymapError):
+            parse_key("Hyper-x")
+        with self.assertRaises(KeymapError):
+            Keymap().bind(parse_key("F1"), "explode")
+        with self.assertRaises(KeymapError):
+            parse_binding("F1 send look")
+
+    def test_describe_round_trips(self):
+        for spec in ("F5", "C-x C-s", "M-h", "KP8", "Tab", "x"):
+            self.assertEqual(describe_key(parse_key(spec)[0]), spec)
+
+
+class KeymapTest(unittest.TestCase):
+    def test_sequence_registers_prefixes(self):
+        keymap = Keymap()
+        keymap.bind(parse_key("C-x C-q"), "alias", "/quit")
+        self.assertIn("\x18", keymap.prefixes)
+        self.assertEqual(keymap.bindings[("\x18", "\x11")].method, "key_alias")
+
+    def test_unbind_restores_default(self):
+        keymap = Keymap()
+        keymap.bind(parse_key("Tab"), "send", "score")
+        keymap.bind(parse_key("M-x"), "send", "look")
+        self.assertEqual(keymap.unbind(parse_key("Tab")), 1)
+        self.assertEqual(keymap.bindings["\t"].action, DEFAULT_KEYMAP["\t"])
+        self.assertEqual(keymap.unbind(parse_key("M-x")), 1)
+        self.assertNotIn(("\x1b", "x"), keymap.bindings)
+        self.assertEqual(keymap.prefixes, set())
+
+    def test_load_file_reports_bad_lines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "keys.conf"
+            path.write_text("# sidonnat\nF1 = send cast heal\n\nF2 = fly\nKP8 = send north\n",
+                            encoding="utf-8")
+            keymap = Keymap()
+            errors = keymap.load(path)
+            self.assertEqual(errors, ["keys.conf:4: Tuntematon toiminto: fly"])
+            self.assertEqual(keymap.bindings[curses.KEY_F1].arg, "cast heal")
+            self.assertEqual(Keymap().load(Path(tmp) / "missing.conf"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
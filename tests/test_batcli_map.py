@@ -0,0 +1,122 @@
+"""
+Yksikkötestit automapparille (batcli_map).
+
+Aja:
+    python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Lisää projektin juuri importtipolkuun
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batcli_map import (  # noqa: E402
+    Automapper, RoomGraph, compress_path, parse_exits,
+)
+
+
+class MapTestBase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "map.sqlite3"
+        self.graph = RoomGraph(self.path)
+        self.addCleanup(self.graph.close)
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse_exits(self):
+        self.assertEqual(parse_exits("north, South and east"), "e,n,s")
+        self.assertEqual(parse_exits("up and portal"), "portal,u")
+
+    def test_compress_path(self):
+        self.assertEqual(compress_path(["n", "n", "n", "e", "ne", "ne"]), "3ne2(ne)")
+
+
+class RoomGraphTest(MapTestBase):
+    def add_line(self, area, count):
+        rooms = [self.graph.add_room(area, f"{area} {i}", "e,w") for i in range(count)]
+        for a, b in zip(rooms, rooms[1:]):
+            self.graph.link(a, "e", b)
+            self.graph.link(b, "w", a)
+        return rooms
+
+    def test_shortest_path(self):
+        rooms = self.add_line("town", 4)
+        self.graph.link(rooms[0], "n", rooms[3])  # Oikotie
+        self.assertEqual(self.graph.shortest_path(rooms[0], rooms[3]), ["n"])
+        self.assertEqual(self.graph.shortest_path(rooms[3], rooms[1]), ["w", "w"])
+
+    def test_areas_load_lazily_from_disk(self):
+        town = self.add_line("town", 2)
+        forest = self.add_line("forest", 2)
+        self.graph.link(town[1], "e", forest[0])
+        self.graph.close()
+
+        graph = RoomGraph(self.path)
+        self.addCleanup(graph.close)
+        self.assertEqual(graph.loaded_areas, set())
+        self.assertEqual(graph.shortest_path(town[0], forest[1]), ["e", "e", "e"])
+        self.assertEqual(graph.loaded_areas, {"town", "forest"})
+
+    def test_commits_do_not_wait_for_fsync(self):
+        self.assertEqual(self.graph.db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(self.graph.db.execute("PRAGMA synchronous").fetchone()[0], 1)
+
+    def test_no_route(self):
+        a = self.graph.add_room("x", "a", "")
+        b = self.graph.add_room("x", "b", "")
+        self.assertIsNone(self.graph.shortest_path(a, b))
+
+
+class AutomapperTest(MapTestBase):
+    def setUp(self):
+        super().setUp()
+        self.mapper = Automapper(self.graph)
+        self.mapper.enabled = True
+
+    def room(self, title, exits):
+        for line in (title, "A long description.", f"Obvious exits are: {exits}."):
+            self.mapper.on_line(line)
+
+    def test_walking_builds_edges(self):
+        self.mapper.on_command("look")
+        self.room("Town square", "north and east")
+        square = self.mapper.current
+        self.mapper.on_command("north")
+        self.room("Temple", "south")
+        temple = self.mapper.current
+        self.assertNotEqual(square, temple)
+        self.assertEqual(self.graph.target(square, "n"), temple)
+        self.assertEqual(self.graph.room(temple)[3], "s")
+
+    def test_batched_moves_and_failed_move(self):
+        self.mapper.on_command("look")
+        self.room("A", "east")
+        a = self.mapper.current
+        for cmd in ("e", "e", "e"):
+            self.mapper.on_command(cmd)
+        self.room("B", "east and west")
+        self.room("C", "west")
+        self.mapper.on_line("You can't go that way.")
+        self.assertEqual(self.graph.shortest_path(a, self.mapper.current), ["e", "e"])
+        self.assertEqual(len(self.mapper.pending), 0)
+
+    def test_known_room_is_reused(self):
+        self.mapper.on_command("look")
+        self.room("A", "east")
+        a = self.mapper.current
+        self.mapper.on_command("e")
+        self.room("B", "west")
+        self.mapper.on_command("w")
+        self.room("A", "east")
+        self.assertEqual(self.mapper.current, a)
+        self.assertEqual(self.graph.stats(), (2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
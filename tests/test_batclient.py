@@ -11,10 +11,16 @@ Aja:
     python3 tests/test_batclient.py
 """
 
+import asyncio
 import os
+import re
 import sys
+import tempfile
+import threading
+import time
 import unittest
 from collections import deque
+from unittest import mock
 
 # Lisää projektin juuri importtipolkuun
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -22,16 +28,69 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import curses  # noqa: E402
 
 import batclient  # noqa: E402
-from batclient import BatClient, format_debug_bytes, THEMES, _to_curses_rgb  # noqa: E402
+from batcli_history import CommandHistory  # noqa: E402
+from batcli_keys import ACTIONS, Keymap, parse_binding  # noqa: E402
+from batcli_map import Automapper, RoomGraph  # noqa: E402
+from cmds.base import parse_interval  # noqa: E402
+from cmds.walk import parse_speedwalk  # noqa: E402
+from batclient import (  # noqa: E402
+    ActionScheduler, AhoCorasick, AliasEngine, AliasError, BatClient, Connector, OutboundQueue,
+    OutputFilter, SpamFolder, Histogram, LagMonitor, LatencyTracer, LinkProbe, MetricsServer,
+    SamplingProfiler, StreamMatcher, TimerHeap, TimerManager, TriggerEngine, WordIndex,
+    format_debug_bytes, interleave_families,
+    THEMES, _to_curses_rgb,
+)
 
 
 def make_client():
     """Luo BatClient ilman __init__:iä (ei curses-alustusta)."""
     c = BatClient.__new__(BatClient)
+    c.reader = None
     c.writer = None
     c.echo_off = False
     c.user_aliases = {}
+    c.alias_engine = AliasEngine()
     c.telnet_partial = b""
+    c.lag_monitor = LagMonitor()
+    c.tracer = LatencyTracer()
+    c.bytes_received = 0
+    c.lines_received = 0
+    c.lines_appended = 0
+    c.strip_cache = {}
+    c.row_cache = {}
+    c.row_cache_width = None
+    c.search = None
+    c.search_task = None
+    c.search_mode = False
+    c.triggers = TriggerEngine()
+    c.stream_matcher = StreamMatcher()
+    c.output_filter = OutputFilter()
+    c.gag_log = False
+    c.spam_folder = SpamFolder()
+    c.timers = TimerHeap()
+    c.action_scheduler = ActionScheduler(c.timers, lambda cmd: c.execute_line(cmd))
+    c.user_timers = TimerManager(c.timers, lambda cmd: c.execute_line(cmd))
+    c.outbound = OutboundQueue()
+    c.outbound_wakeup = None
+    c.prompt_event = asyncio.Event()
+    c.server_event = asyncio.Event()
+    c.ping_event = asyncio.Event()
+    c.link_probe = LinkProbe()
+    c.command_history = CommandHistory()
+    c.history_index = -1
+    c.history_task = None
+    c.history_search_mode = False
+    c.history_search_states = []
+    c.history_saved_input = ""
+    c.word_index = WordIndex()
+    c.completion = None
+    c.keymap = Keymap()
+    c.key_pending = ()
+    c.prompts_seen = 0
+    c.last_server_text = ""
+    c.walk_task = None
+    c.walk_progress = (0, 0)
+    c.automapper = Automapper(RoomGraph(":memory:"))
     return c
 
 
@@ -187,7 +246,7 @@ class SendCommandTest(unittest.IsolatedAsyncioTestCase):
         self.c = make_client()
         self.c.writer = FakeWriter()
         self.c.reader = object()
-        self.c.command_history = deque(maxlen=100)
+        self.c.command_history = CommandHistory()
         self.c.history_index = -1
 
     async def test_normal_command_goes_to_history(self):
@@ -204,6 +263,22 @@ class SendCommandTest(unittest.IsolatedAsyncioTestCase):
         await self.c.send_command("hunter2", is_password=True)
         self.assertEqual(self.c.writer.sent, [b"hunter2\n"])
 
+    async def test_batch_is_one_write_with_per_command_history(self):
+        await self.c.send_commands(["tiku", "hunter2", "", "look"], secret=(1,))
+        self.assertEqual(self.c.writer.sent, [b"tiku\nhunter2\n\nlook\n"])
+        self.assertEqual(list(self.c.command_history), ["tiku", "look"])
+
+    async def test_password_typed_with_echo_off_is_masked_in_queue(self):
+        self.c.outbound = OutboundQueue(rate=1, burst=1)
+        self.c.echo_off = True
+        await self.c.send_commands(["hunter2", "hunter3"])
+        self.assertEqual(self.c.outbound.peek(batclient.PRIORITY_USER), "********")
+
+    async def test_automated_commands_stay_out_of_history(self):
+        await self.c.send_commands(["cast heal"], priority=batclient.PRIORITY_ACTION)
+        await self.c.send_commands(["n", "e"], priority=batclient.PRIORITY_BULK)
+        self.assertEqual(list(self.c.command_history), [])
+
 class ExpandAliasTest(unittest.TestCase):
     def setUp(self):
         self.c = make_client()
@@ -227,6 +302,43 @@ class ExpandAliasTest(unittest.TestCase):
         self.c.user_aliases = {"kk": "kill kobold"}
         self.assertEqual(self.c.expand_alias(""), "")
 
+    def test_parameters(self):
+        self.c.user_aliases = {"gt": "tell $1 $*", "k2": "kill $2"}
+        self.assertEqual(self.c.expand_commands("gt tiku moi"), ["tell tiku tiku moi"])
+        self.assertEqual(self.c.expand_commands("k2 a"), ["kill"])
+
+    def test_command_list_and_nesting(self):
+        self.c.user_aliases = {"kk": "kill $1;loot", "loot": "get all from corpse"}
+        self.assertEqual(self.c.expand_commands("kk rat"),
+                         ["kill rat", "get all from corpse"])
+
+    def test_arguments_go_to_last_command_without_parameters(self):
+        self.c.user_aliases = {"two": "smile;bow"}
+        self.assertEqual(self.c.expand_commands("two bob"), ["smile", "bow bob"])
+
+    def test_semicolon_in_arguments_is_not_split(self):
+        self.c.user_aliases = {"t": "tell", "gt": "tell $1 $*;smile"}
+        self.assertEqual(self.c.expand_commands("t bob hi; there"), ["tell bob hi; there"])
+        self.assertEqual(self.c.expand_commands("gt bob a;b"), ["tell bob bob a;b", "smile"])
+
+    def test_self_reference_is_sent_as_is(self):
+        self.c.user_aliases = {"look": "look;glance", "a": "b", "b": "a"}
+        self.assertEqual(self.c.expand_commands("look"), ["look", "glance"])
+        self.assertEqual(self.c.expand_commands("a"), ["a"])
+
+    def test_fan_out_limit(self):
+        self.c.user_aliases = {f"a{i}": f"a{i + 1};a{i + 1}" for i in range(12)}
+        with self.assertRaises(AliasError):
+            self.c.expand_commands("a0")
+
+    def test_cache_sees_changed_alias(self):
+        self.c.user_aliases = {"kk": "kill kobold"}
+        self.c.expand_commands("kk")
+        self.assertEqual(self.c.expand_commands("kk"), ["kill kobold"])
+        self.assertEqual(self.c.alias_engine.cache_hits, 1)
+        self.c.user_aliases["kk"] = "kick kobold"
+        self.assertEqual(self.c.expand_commands("kk"), ["kick kobold"])
+
 
 class StripAnsiTest(unittest.TestCase):
     def setUp(self):
@@ -417,7 +529,11 @@ def make_screen_client():
     c.input_buffer = ""
     c.cursor_pos = 0
     c.log_file = None
+    c.debug_mode = False
+    c.status_emoji = False
+    c.reconnecting = False
     c.output_win = FakeWindow()
+    c.status_win = FakeWindow()
     c.input_win = FakeWindow()
     return c
 
@@ -540,5 +656,1442 @@ class RefreshOutputTest(unittest.TestCase):
         self.assertEqual(self.c.output_win.drawn(), ["aa", "bb"])
 
 
+def profiled_leaf(profiler):
+    """Tunnettu lehtifunktio profiloijan testeille."""
+    profiler.sample_once()
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def test_sample_records_current_stack(self):
+        p = SamplingProfiler(target_ident=threading.get_ident())
+        profiled_leaf(p)
+        self.assertEqual(p.samples, 1)
+        self.assertEqual(p.top_functions(1)[0][0], "batclient.py:sample_once")
+
+    def test_collapsed_format_root_to_leaf_with_count(self):
+        p = SamplingProfiler(target_ident=threading.get_ident())
+        for _ in range(3):
+            profiled_leaf(p)
+        line = p.collapsed()[0]
+        stack, count = line.rsplit(" ", 1)
+        self.assertEqual(count, "3")
+        self.assertTrue(stack.endswith(
+            "test_batclient.py:profiled_leaf;batclient.py:sample_once"))
+
+    def test_unknown_thread_is_ignored(self):
+        p = SamplingProfiler(target_ident=-1)
+        p.sample_once()
+        self.assertEqual(p.samples, 0)
+
+    def test_hz_is_clamped(self):
+        self.assertEqual(SamplingProfiler(hz=0).hz, 1)
+        self.assertEqual(SamplingProfiler(hz=10 ** 6).hz, batclient.PROFILE_MAX_HZ)
+
+    def test_background_thread_collects_samples(self):
+        p = SamplingProfiler(hz=1000)
+        p.start()
+        deadline = batclient.time.monotonic() + 2.0
+        while p.samples < 3 and batclient.time.monotonic() < deadline:
+            batclient.time.sleep(0.01)
+        p.stop()
+        self.assertFalse(p.running)
+        self.assertGreaterEqual(p.samples, 3)
+
+
+class HistogramTest(unittest.TestCase):
+    def test_empty_histogram_reports_zero(self):
+        self.assertEqual(Histogram().percentile(99), 0.0)
+
+    def test_percentiles_follow_the_distribution(self):
+        h = Histogram()
+        for _ in range(90):
+            h.observe(0.001)
+        for _ in range(10):
+            h.observe(0.2)
+        self.assertLessEqual(h.percentile(50), 0.001)
+        self.assertGreater(h.percentile(99), 0.1)
+        self.assertEqual(h.count, 100)
+
+    def test_percentile_never_exceeds_max(self):
+        h = Histogram()
+        h.observe(0.003)
+        self.assertLessEqual(h.percentile(100), 0.003)
+
+    def test_values_beyond_last_bucket_are_kept(self):
+        h = Histogram()
+        h.observe(60.0)
+        self.assertEqual(h.counts[-1], 1)
+        self.assertGreater(h.percentile(99), 5.0)
+        self.assertLessEqual(h.percentile(100), 60.0)
+
+
+class LagMonitorTest(unittest.TestCase):
+    def test_small_lag_is_not_a_spike(self):
+        m = LagMonitor(threshold=0.1)
+        self.assertIsNone(m.record(10.0, 10.01))
+        self.assertEqual(m.histogram.count, 1)
+
+    def test_spike_is_blamed_on_longest_activity(self):
+        m = LagMonitor(interval=0.05, threshold=0.1)
+        now = batclient.time.monotonic()
+        m._activities.append(("get_wch", now - 0.3, now - 0.29))
+        m._activities.append(("/help", now - 0.29, now - 0.01))
+        lag, cause = m.record(now - 0.3, now)
+        self.assertAlmostEqual(lag, 0.3)
+        self.assertEqual(cause, "/help")
+        self.assertEqual(m.spikes[-1][2], "/help")
+
+    def test_spike_without_known_activity(self):
+        m = LagMonitor(threshold=0.1)
+        self.assertEqual(m.record(1.0, 2.0)[1], "tuntematon")
+
+    def test_activity_is_recorded(self):
+        m = LagMonitor()
+        with m.activity("resize"):
+            pass
+        self.assertEqual(m.blame(0.0), "resize")
+
+    def test_activities_are_cleared_after_each_tick(self):
+        m = LagMonitor(threshold=0.1)
+        with m.activity("/help"):
+            pass
+        m.record(1.0, 1.0)
+        self.assertIsNone(m.blame(0.0))
+
+
+class LagMonitorTimedTest(unittest.IsolatedAsyncioTestCase):
+    async def test_awaits_are_not_counted_as_activity(self):
+        m = LagMonitor()
+
+        async def connect():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        self.assertEqual(await m.timed("/connect", connect()), "ok")
+        self.assertTrue(m._activities)
+        self.assertTrue(all(end - start < 0.04 for _label, start, end in m._activities))
+
+    async def test_cancellation_reaches_the_command(self):
+        m = LagMonitor()
+        cancelled = []
+
+        async def command():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        task = asyncio.ensure_future(m.timed("/walk", command()))
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(cancelled, [True])
+
+
+class LatencyTracerTest(unittest.TestCase):
+    def test_disabled_tracer_records_nothing(self):
+        t = LatencyTracer()
+        t.record("render", t.start())
+        t.mark("input")
+        t.finish("input")
+        self.assertEqual(t.histograms["render"].count, 0)
+        self.assertEqual(t.histograms["input"].count, 0)
+
+    def test_enabled_tracer_records_spans(self):
+        t = LatencyTracer(enabled=True)
+        t.record("render", t.start())
+        self.assertEqual(t.histograms["render"].count, 1)
+
+    def test_finish_without_mark_is_ignored(self):
+        t = LatencyTracer(enabled=True)
+        t.finish("input")
+        self.assertEqual(t.histograms["input"].count, 0)
+
+    def test_cancelled_mark_is_not_recorded(self):
+        t = LatencyTracer(enabled=True)
+        t.mark("input")
+        t.cancel("input")
+        t.finish("input")
+        self.assertEqual(t.histograms["input"].count, 0)
+
+    def test_export_writes_every_span(self):
+        t = LatencyTracer(enabled=True)
+        t.record("server", t.start())
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "lat.txt")
+            t.export(path)
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        for name, _desc in batclient.TRACE_SPANS:
+            self.assertIn(name, text)
+        self.assertIn("server +Inf 0", text)
+
+
+class TracePointTest(unittest.IsolatedAsyncioTestCase):
+    async def test_send_command_finishes_input_span(self):
+        c = make_client()
+        c.writer = FakeWriter()
+        c.reader = object()
+        c.command_history = CommandHistory()
+        c.tracer.enabled = True
+        c.tracer.mark("input")
+        await c.send_command("look")
+        self.assertEqual(c.tracer.histograms["input"].count, 1)
+
+    async def test_process_and_render_spans(self):
+        c = make_screen_client()
+        c.tracer.enabled = True
+        c.process_server_text("rivi\n", False)
+        self.assertEqual(c.tracer.histograms["process"].count, 1)
+        self.assertEqual(c.tracer.histograms["render"].count, 1)
+
+
+def make_metrics_client():
+    c = make_client()
+    c.reader = None
+    c.reconnecting = True
+    c.reconnect_attempt = 2
+    c.started_at = batclient.time.monotonic()
+    c.output_lines = deque(["a", "b", "c"])
+    c.log_file = None
+    return c
+
+
+class MetricsRenderTest(unittest.TestCase):
+    def test_exposes_connection_and_reconnect_state(self):
+        text = MetricsServer(make_metrics_client()).render()
+        self.assertIn("batcli_connected 0\n", text)
+        self.assertIn("batcli_reconnecting 1\n", text)
+        self.assertIn("batcli_reconnect_attempt 2\n", text)
+        self.assertIn("batcli_scrollback_lines 3\n", text)
+
+    def test_counts_received_lines(self):
+        c = make_screen_client()
+        c.process_server_text("eka\ntoka\nkesken", False)
+        self.assertEqual(c.lines_received, 2)
+
+    def test_histogram_buckets_are_cumulative(self):
+        c = make_metrics_client()
+        c.tracer.histograms["render"].observe(0.0002)
+        c.tracer.histograms["render"].observe(0.2)
+        text = MetricsServer(c).render()
+        self.assertIn('batcli_render_seconds_bucket{le="0.00025"} 1\n', text)
+        self.assertIn('batcli_render_seconds_bucket{le="0.25"} 2\n', text)
+        self.assertIn('batcli_render_seconds_bucket{le="+Inf"} 2\n', text)
+        self.assertIn("batcli_render_seconds_count 2\n", text)
+
+    def test_rate_is_measured_between_scrapes(self):
+        c = make_metrics_client()
+        server = MetricsServer(c)
+        server.render()
+        server._last_scrape = (batclient.time.monotonic() - 2.0, 0, 0)
+        c.bytes_received = 1000
+        text = server.render()
+        line = [l for l in text.splitlines() if l.startswith("batcli_bytes_per_second ")][0]
+        self.assertAlmostEqual(float(line.split()[1]), 500.0, delta=20)
+
+
+class MetricsServerTest(unittest.IsolatedAsyncioTestCase):
+    async def scrape(self, server, target="/metrics"):
+        port = server.servers[0].sockets[0].getsockname()[1]
+        reader, writer = await batclient.asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {target} HTTP/1.0\r\n\r\n".encode())
+        data = await reader.read()
+        writer.close()
+        return data.decode()
+
+    async def test_scrape_over_localhost_http(self):
+        server = MetricsServer(make_metrics_client(), port=0)
+        await server.start()
+        try:
+            response = await self.scrape(server)
+        finally:
+            await server.close()
+        self.assertTrue(response.startswith("HTTP/1.0 200 OK"))
+        self.assertIn("batcli_reconnect_attempt 2", response)
+
+    async def test_unknown_path_is_404(self):
+        server = MetricsServer(make_metrics_client(), port=0)
+        await server.start()
+        try:
+            response = await self.scrape(server, "/nope")
+        finally:
+            await server.close()
+        self.assertTrue(response.startswith("HTTP/1.0 404"))
+
+    async def test_scrape_over_unix_socket(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "batcli.sock")
+            server = MetricsServer(make_metrics_client(), path=path)
+            await server.start()
+            try:
+                reader, writer = await batclient.asyncio.open_unix_connection(path)
+                writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+                response = (await reader.read()).decode()
+                writer.close()
+            finally:
+                await server.close()
+            self.assertIn("batcli_connected 0", response)
+            self.assertFalse(os.path.exists(path))
+
+    async def test_regular_file_is_not_removed(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "batcli.log")
+            with open(path, "w") as f:
+                f.write("loki\n")
+            server = MetricsServer(make_metrics_client(), path=path)
+            with self.assertRaises(OSError):
+                await server.start()
+            await server.close()
+            with open(path) as f:
+                self.assertEqual(f.read(), "loki\n")
+
+    async def test_socket_of_a_running_instance_is_kept(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "batcli.sock")
+            first = MetricsServer(make_metrics_client(), path=path)
+            await first.start()
+            try:
+                second = MetricsServer(make_metrics_client(), path=path)
+                with self.assertRaises(OSError):
+                    await second.start()
+                await second.close()
+                self.assertTrue(os.path.exists(path))
+            finally:
+                await first.close()
+
+    async def test_stale_socket_is_replaced(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "batcli.sock")
+            stale = batclient.socket.socket(batclient.socket.AF_UNIX)
+            stale.bind(path)
+            stale.close()  # Jäänne: tiedosto jää, kukaan ei kuuntele
+            server = MetricsServer(make_metrics_client(), path=path)
+            await server.start()
+            await server.close()
+            self.assertFalse(os.path.exists(path))
+
+
+class ScrollbackSearchTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        patcher = mock.patch.object(batclient.curses, "doupdate")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def run_search(self, regex):
+        search = self.c.start_search(regex)
+        await self.c.search_task
+        return search
+
+    async def test_matches_are_indexed_newest_first(self):
+        self.c.add_output("goblin\nrat\n\x1b[1mgob\x1b[0mlin\n")
+        search = await self.run_search("goblin")
+        self.assertEqual(search.matches, [2, 0])
+        self.assertTrue(search.done)
+
+    async def test_ansi_codes_are_ignored_and_cached(self):
+        self.c.add_output("\x1b[1mgob\x1b[0mlin\n")
+        await self.run_search("goblin")
+        self.assertEqual(self.c.strip_cache["\x1b[1mgob\x1b[0mlin"], "goblin")
+
+    async def test_jump_scrolls_match_into_view(self):
+        self.c.add_output("osuma\n" + "rivi\n" * 40)
+        await self.run_search("osuma")
+        self.assertGreater(self.c.scroll_offset, 0)
+        self.assertIn("osuma", self.c.output_win.drawn())
+
+    async def test_jump_counts_rows_from_cache(self):
+        self.c.add_output("osuma\n" + "\x1b[1mrivi\x1b[0m\n" * 500)
+        with mock.patch.object(self.c, "parse_ansi", wraps=self.c.parse_ansi) as parse:
+            await self.run_search("osuma")
+        # Vain näkyvät rivit parsitaan, ei koko osuman alapuolista puskuria
+        self.assertLess(parse.call_count, 100)
+        self.assertIn("osuma", self.c.output_win.drawn())
+        self.assertEqual(self.c.row_cache["\x1b[1mrivi\x1b[0m"], 1)
+
+    async def test_line_rows_matches_wrapped_rows(self):
+        line = "\x1b[1m" + "sana " * 30 + "\x1b[0m"
+        width = 20
+        expected = len(self.c.wrap_segments(self.c.parse_ansi(line), width))
+        self.assertEqual(self.c.line_rows(line, width), expected)
+        self.assertEqual(self.c.line_rows(line, 40),
+                         len(self.c.wrap_segments(self.c.parse_ansi(line), 40)))
+
+    async def test_step_moves_between_matches(self):
+        self.c.add_output("a1\n" + "x\n" * 30 + "a2\n" + "x\n" * 30)
+        search = await self.run_search(r"a\d")
+        self.assertEqual(search.position, 0)
+        self.assertTrue(self.c.search_step(1))
+        self.assertEqual(search.position, 1)
+        self.assertIn("a1", self.c.output_win.drawn())
+        self.assertFalse(self.c.search_step(1))
+
+    async def test_scans_in_chunks_and_yields(self):
+        self.c.add_output("hit\n" * 25)
+        with mock.patch.object(batclient, "SEARCH_CHUNK_LINES", 10):
+            search = self.c.start_search("hit")
+            await batclient.asyncio.sleep(0)
+            await batclient.asyncio.sleep(0)
+            self.assertFalse(search.done)
+            self.assertLess(len(search.matches), 25)
+            await self.c.search_task
+        self.assertEqual(len(search.matches), 25)
+
+    async def test_evicted_matches_are_skipped(self):
+        self.c.output_lines = deque(maxlen=3)
+        self.c.add_output("vanha\nuusi\n")
+        search = await self.run_search("vanha|uusi")
+        self.c.add_output("x\ny\n")  # "vanha" ja "uusi" putoavat pois
+        self.assertFalse(self.c.search_step(1))
+        self.assertEqual(search.matches, [1, 0])
+
+    async def test_invalid_regex_raises(self):
+        with self.assertRaises(batclient.re.error):
+            self.c.start_search("(")
+
+    async def test_no_match_message(self):
+        self.c.add_output("rivi\n")
+        await self.run_search("olematon")
+        self.assertEqual(self.c.output_lines[-1], "*** Ei osumia: olematon ***")
+
+
+ANALYZE_SAMPLE = (
+    "Loggaus aloitettu: 2026-03-04 20:15:00\n"
+    "A small kobold is DEAD, R.I.P.\n"
+    "You gain 1234 experience.\n"
+    "Tiku [sales]: selling a sword\n"
+    "Dino [sales]: no thanks\n"
+    "Tiku [newbie]: hello\n"
+    "You die.\n"
+    "A small kobold is DEAD, R.I.P.\n"
+)
+
+
+class AnalyzeLogsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_single_file_counts(self):
+        stats = batclient.analyze_log_file(self.write("a.log", ANALYZE_SAMPLE))
+        self.assertEqual(stats["lines"], 8)
+        self.assertEqual(stats["sessions"], 1)
+        self.assertEqual(stats["kills"], 2)
+        self.assertEqual(stats["victims"], {"A small kobold": 2})
+        self.assertEqual((stats["exp_gains"], stats["exp"]), (1, 1234))
+        self.assertEqual(stats["deaths"], 1)
+        self.assertEqual(stats["channels"], {"sales": 2, "newbie": 1})
+
+    def test_merge_adds_counters_and_dicts(self):
+        total = batclient.new_log_stats()
+        part = {**batclient.new_log_stats(), "kills": 2, "channels": {"sales": 1}}
+        batclient.merge_log_stats(total, part)
+        batclient.merge_log_stats(total, part)
+        self.assertEqual(total["kills"], 4)
+        self.assertEqual(total["channels"], {"sales": 2})
+
+    def test_files_are_analyzed_in_parallel_and_merged(self):
+        for i in range(3):
+            self.write(f"20260304201{i}.log", ANALYZE_SAMPLE)
+        self.write("notes.txt", ANALYZE_SAMPLE)  # Ei .log -> ohitetaan
+        stats = batclient.analyze_logs(self.tmp.name, workers=2)
+        self.assertEqual(stats["files"], 3)
+        self.assertEqual(stats["kills"], 6)
+        self.assertEqual(stats["channels"]["sales"], 6)
+
+    def test_report_lists_top_channels(self):
+        stats = batclient.analyze_log_file(self.write("a.log", ANALYZE_SAMPLE))
+        report = "\n".join(batclient.format_log_stats(stats))
+        self.assertIn("Tappoja:      2", report)
+        self.assertIn("       2  sales", report)
+
+    def test_parse_args(self):
+        args = batclient.parse_args(["--analyze", "logs", "-j", "4"])
+        self.assertEqual((args.analyze, args.jobs), ("logs", 4))
+        self.assertIsNone(batclient.parse_args([]).analyze)
+
+
+class AhoCorasickTest(unittest.TestCase):
+    def make(self, *words):
+        ac = AhoCorasick()
+        for word in words:
+            ac.add(word, word)
+        ac.build()
+        return ac
+
+    def test_finds_overlapping_literals(self):
+        ac = self.make("he", "she", "his", "hers")
+        self.assertEqual(sorted(ac.search("ushers")), ["he", "hers", "she"])
+
+    def test_each_value_reported_once(self):
+        self.assertEqual(self.make("ab").search("ababab"), ["ab"])
+
+    def test_no_match(self):
+        self.assertEqual(self.make("kobold").search("a goblin arrives"), [])
+
+    def test_search_builds_lazily(self):
+        ac = AhoCorasick()
+        ac.add("rat", 1)
+        self.assertEqual(ac.search("a rat"), [1])
+
+
+class CountingRegex:
+    """Käännetty lauseke joka kirjaa omat hakunsa listaan."""
+
+    def __init__(self, regex, calls):
+        self.regex = regex
+        self.calls = calls
+
+    def search(self, *args):
+        self.calls.append(self.regex.pattern)
+        return self.regex.search(*args)
+
+
+class TriggerEngineTest(unittest.TestCase):
+    def test_literal_and_regex_in_one_pass(self):
+        e = TriggerEngine()
+        lit = e.add("hungry", "eat bread")
+        rx = e.add(r"^(\w+) arrives", "say hi $1", is_regex=True)
+        hits = e.match("Tiku arrives, looking hungry")
+        self.assertEqual([t for t, _m in hits], [lit, rx])
+        self.assertEqual(rx.expand_action(hits[1][1]), "say hi Tiku")
+
+    def test_regex_groups_are_the_triggers_own(self):
+        e = TriggerEngine()
+        e.add(r"(\d+) gold", "a $1", is_regex=True)
+        t = e.add(r"(\w+) tells you: (.*)", "tell $1 got $2", is_regex=True)
+        hits = e.match("Dino tells you: moi")
+        self.assertEqual(t.expand_action(hits[0][1]), "tell Dino got moi")
+
+    def test_backreference_trigger_is_run_separately(self):
+        e = TriggerEngine()
+        t = e.add(r"(\w+) \1", "echo", is_regex=True)
+        e.add(r"kobold", "kill", is_regex=True)
+        self.assertEqual([x for x, _m in e.match("bye bye")], [t])
+
+    def test_overlapping_regex_triggers_all_fire(self):
+        e = TriggerEngine()
+        a = e.add("hits you", "a", is_regex=True)
+        b = e.add("you", "b", is_regex=True)
+        self.assertEqual([t for t, _m in e.match("Orc hits you")], [a, b])
+        e = TriggerEngine()
+        a = e.add(r"^(\w+) arrives", "say hi $1", is_regex=True)
+        b = e.add(r"arrives from the (\w+)", "look $1", is_regex=True)
+        hits = e.match("Bob arrives from the north")
+        self.assertEqual([t.expand_action(m) for t, m in hits], ["say hi Bob", "look north"])
+        self.assertEqual(e.match("nothing here"), [])
+
+    def test_only_the_hit_trigger_regex_is_rerun(self):
+        e = TriggerEngine()
+        for i in range(50):
+            e.add(f"monster{i} arrives", "x", is_regex=True)
+        spam = e.add(r"(\w+) shouts", "y", is_regex=True)
+        same_spot = e.add(r"Orc shouts (\w+)", "z", is_regex=True)
+        e.compile()
+        calls = []
+        for trigger in e.triggers.values():
+            trigger.regex = CountingRegex(trigger.regex, calls)
+        hits = e.match("Orc shouts hello")
+        self.assertEqual([t for t, _m in hits], [spam, same_spot])
+        self.assertEqual(spam.expand_action(hits[0][1]), "y")
+        self.assertEqual(hits[1][1].group(1), "hello")
+        self.assertEqual(len(calls), 2)
+
+    def test_same_named_group_in_two_triggers(self):
+        e = TriggerEngine()
+        a = e.add(r"(?P<who>\w+) arrives", "say hi $1", is_regex=True)
+        b = e.add(r"(?P<who>\w+) leaves", "say bye $1", is_regex=True)
+        self.assertEqual([t for t, _m in e.match("Bob arrives")], [a])
+        self.assertEqual([t for t, _m in e.match("Bob leaves")], [b])
+
+    def test_removed_trigger_no_longer_matches(self):
+        e = TriggerEngine()
+        t = e.add("rat", "kill rat")
+        self.assertTrue(e.remove(t.id))
+        self.assertEqual(e.match("a rat"), [])
+        self.assertFalse(e.remove(t.id))
+
+    def test_invalid_regex_raises(self):
+        with self.assertRaises(batclient.re.error):
+            TriggerEngine().add("(", "x", is_regex=True)
+
+    def test_scan_is_counted(self):
+        e = TriggerEngine()
+        e.add("x", "y")
+        e.match("abc")
+        self.assertEqual(e.lines_scanned, 1)
+        self.assertEqual(e.scan_histogram.count, 1)
+
+
+class CheckTriggersTest(unittest.TestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.fired = []
+        self.c.fire_trigger = lambda t, m: self.fired.append(t.expand_action(m))
+
+    def test_server_lines_fire_triggers(self):
+        self.c.triggers.add(r"^(\w+) arrives", "say hi $1", is_regex=True)
+        self.c.process_server_text("Tiku arrives.\nrat\n", False)
+        self.assertEqual(self.fired, ["say hi Tiku"])
+        self.assertEqual(self.c.triggers.triggers[1].hits, 1)
+
+    def test_ansi_codes_do_not_hide_matches(self):
+        self.c.triggers.add("You are hungry", "eat bread")
+        self.c.process_server_text("\x1b[1mYou are\x1b[0m hungry\n", False)
+        self.assertEqual(self.fired, ["eat bread"])
+
+    def test_partial_line_waits_for_newline(self):
+        self.c.triggers.add("hungry", "eat bread")
+        self.c.process_server_text("You are hun", False)
+        self.assertEqual(self.fired, [])
+        self.c.process_server_text("gry\n", False)
+        self.assertEqual(self.fired, ["eat bread"])
+
+
+class OutputFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.log_file = mock.Mock()
+
+    def test_gagged_lines_skip_buffer_and_log(self):
+        rule = self.c.output_filter.add_gag(r"^\w+ hits \w+", is_regex=True)
+        self.c.process_server_text("Tiku hits rat.\nYou are hungry.\n", False)
+        self.assertEqual(list(self.c.output_lines), ["You are hungry."])
+        self.c.log_file.write.assert_called_once_with("You are hungry.\n")
+        self.assertEqual((rule.hits, rule.saved), (1, len("Tiku hits rat.") + 1))
+
+    def test_gag_log_keeps_original_text_in_log(self):
+        self.c.gag_log = True
+        self.c.output_filter.add_gag("spam")
+        self.c.process_server_text("spam\nok\n", False)
+        self.assertEqual(list(self.c.output_lines), ["ok"])
+        self.c.log_file.write.assert_called_once_with("spam\nok\n")
+
+    def test_fully_gagged_chunk_does_not_redraw(self):
+        self.c.output_filter.add_gag("spam")
+        with mock.patch.object(self.c, "refresh_output") as refresh:
+            self.c.process_server_text("spam\nspam\n", False)
+        refresh.assert_not_called()
+
+    def test_subst_keeps_colors_and_expands_groups(self):
+        self.c.output_filter.add_subst(r"(\w+) tells you", "[$1]", is_regex=True)
+        self.c.output_filter.add_subst("hello", "moi")
+        self.c.process_server_text("Tiku tells you: \x1b[1mhello\x1b[0m\n", False)
+        self.assertEqual(list(self.c.output_lines), ["[Tiku]: \x1b[1mmoi\x1b[0m"])
+
+    def test_subst_never_rewrites_inside_color_codes(self):
+        self.c.output_filter.add_subst(r"(\w+) tells you", "[$1]", is_regex=True)
+        self.c.process_server_text("\x1b[1mTiku tells you\x1b[0m: hi\n", False)
+        self.assertEqual(list(self.c.output_lines), ["[Tiku]: hi"])
+
+    def test_gag_overlapping_earlier_subst_still_gags(self):
+        self.c.output_filter.add_subst(r"^(\w+) hits", "$1 HITS", is_regex=True)
+        gag = self.c.output_filter.add_gag(r"hits you", is_regex=True)
+        self.c.process_server_text("Orc hits you.\nOrc hits rat.\n", False)
+        self.assertEqual(list(self.c.output_lines), ["Orc HITS rat."])
+        self.assertEqual(gag.hits, 1)
+
+    def test_same_named_group_in_two_rules(self):
+        self.c.output_filter.add_subst(r"(?P<who>\w+) arrives", "[$1]", is_regex=True)
+        self.c.output_filter.add_gag(r"(?P<who>\w+) leaves", is_regex=True)
+        self.c.process_server_text("Bob arrives\nBob leaves\n", False)
+        self.assertEqual(list(self.c.output_lines), ["[Bob]"])
+
+    def test_triggers_see_gagged_lines(self):
+        fired = []
+        self.c.fire_trigger = lambda t, m: fired.append(t.action)
+        self.c.output_filter.add_gag("hungry")
+        self.c.triggers.add("hungry", "eat bread")
+        self.c.process_server_text("You are hungry.\n", False)
+        self.assertEqual(fired, ["eat bread"])
+
+
+class SpamFoldTest(unittest.TestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.spam_folder.set_mode("exact")
+
+    def test_repeated_lines_update_last_line_in_place(self):
+        self.c.add_output("Tiku hits rat.\nTiku hits rat.\nTiku hits rat.\nok\n")
+        self.assertEqual(list(self.c.output_lines), ["Tiku hits rat. (x3)", "ok"])
+        self.assertEqual(self.c.lines_appended, 2)
+
+    def test_numbers_mode_shows_latest_line(self):
+        self.c.spam_folder.set_mode("numbers")
+        self.c.add_output("You hit for 12.\n")
+        self.c.add_output("You hit for 7.\n")
+        self.assertEqual(list(self.c.output_lines), ["You hit for 7. (x2)"])
+
+    def test_blank_lines_and_off_mode_are_not_folded(self):
+        self.c.add_output("\n\n")
+        self.c.spam_folder.set_mode("off")
+        self.c.add_output("a\na\n")
+        self.assertEqual(list(self.c.output_lines), ["", "", "a", "a"])
+
+    def test_cleared_buffer_starts_a_new_count(self):
+        self.c.add_output("a\n")
+        self.c.output_lines.clear()
+        self.c.add_output("a\n")
+        self.assertEqual(list(self.c.output_lines), ["a"])
+
+
+class StreamMatcherTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.m = StreamMatcher(window=10)
+        self.delivered = []
+
+    async def handler(self, match):
+        self.delivered.append(match)
+
+    def feed(self, *lines):
+        done = []
+        for line in lines:
+            done.extend(self.m.feed(line))
+        return done
+
+    async def test_steps_with_gap_lines(self):
+        self.m.add([r"^(\w+) says:$", r"^Exits: (.+)$"], self.handler, max_gap=3)
+        done = self.feed("Tiku says:", "hello", "there", "Exits: north")
+        self.assertEqual(len(done), 1)
+        self.assertEqual(done[0].groups, ("Tiku", "north"))
+        self.assertEqual(done[0].lines, ["Tiku says:", "hello", "there", "Exits: north"])
+        await asyncio.sleep(0)
+        self.assertEqual(self.delivered, done)
+
+    async def test_gap_limit_drops_partial(self):
+        self.m.add(["^start$", "^end$"], self.handler, max_gap=1)
+        self.assertEqual(self.feed("start", "a", "b", "end"), [])
+        self.assertEqual(self.m.partials, [])
+
+    async def test_newer_start_replaces_stalled_partial(self):
+        self.m.add([r"^(\w+)$", r"^Exits: (.+)$"], None)
+        done = self.feed("Forest", "Clearing", "Exits: east")
+        self.assertEqual(done[0].groups, ("Clearing", "east"))
+        self.assertEqual(self.m.partials, [])
+
+    async def test_partials_are_bounded_by_window(self):
+        self.m.add(["^a$", "^b$"], None, max_gap=100)
+        self.feed("a", *["x"] * 10)
+        self.assertEqual(self.m.partials, [])
+
+    async def test_client_runs_multiline_trigger(self):
+        c = make_screen_client()
+        executed = []
+
+        async def execute_line(cmd):
+            executed.append(cmd)
+        c.execute_line = execute_line
+        c.add_multiline_trigger([r"^(\w+) says:$", r"^Exits: (.+)$"], "say $1 $2")
+        c.process_server_text("Tiku says:\nhi\n\x1b[1mExits:\x1b[0m north\n", False)
+        await asyncio.sleep(0.01)
+        self.assertEqual(executed, ["say Tiku north"])
+        self.assertTrue(c.remove_trigger(1))
+        self.assertEqual(c.stream_matcher.patterns, [])
+
+
+class TimerHeapTest(unittest.IsolatedAsyncioTestCase):
+    async def test_entries_fire_in_time_order(self):
+        timers = TimerHeap()
+        fired = []
+        now = timers.time()
+        timers.push(now + 0.02, fired.append, "b")
+        timers.push(now + 0.01, fired.append, "a")
+        cancelled = timers.push(now + 0.01, fired.append, "x")
+        timers.cancel(cancelled)
+        self.assertEqual(len(timers), 2)
+        await asyncio.sleep(0.05)
+        self.assertEqual(fired, ["a", "b"])
+        self.assertEqual(timers.heap, [])
+
+    async def test_failing_callback_does_not_stop_other_timers(self):
+        errors = []
+        timers = TimerHeap(on_error=lambda cb, e: errors.append(e))
+        fired = []
+
+        def boom():
+            raise RuntimeError("boom")
+        now = timers.time()
+        timers.push(now + 0.01, boom)
+        timers.push(now + 0.01, fired.append, "same round")
+        timers.push(now + 0.03, fired.append, "later")
+        await asyncio.sleep(0.06)
+        self.assertEqual(fired, ["same round", "later"])
+        self.assertEqual([str(e) for e in errors], ["boom"])
+        self.assertEqual(timers.errors, 1)
+
+
+class TimerManagerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.ran = []
+
+        async def run(cmd):
+            self.ran.append(cmd)
+        self.manager = TimerManager(TimerHeap(), run)
+
+    async def test_count_limited_timer_removes_itself(self):
+        timer = self.manager.add(0.1, "kick", count=3, delay=0)
+        await asyncio.sleep(0.25)
+        self.assertEqual(self.ran, ["kick"] * 3)
+        self.assertNotIn(timer.id, self.manager.active)
+
+    async def test_periodic_schedule_does_not_drift(self):
+        timer = self.manager.add(0.1, "save")
+        first_due = timer.due
+        await asyncio.sleep(0.25)
+        self.assertEqual(timer.runs, 2)
+        self.assertAlmostEqual(timer.due, first_due + 0.2, places=9)
+
+    async def test_missed_runs_are_skipped(self):
+        timer = self.manager.add(0.1, "save", delay=0)
+        time.sleep(0.35)  # Silmukka jumissa
+        await asyncio.sleep(0.01)
+        self.assertEqual(timer.runs, 1)
+        self.assertGreater(timer.due, self.manager.timers.time())
+
+    async def test_removed_timer_does_not_fire(self):
+        timer = self.manager.add(0.1, "save")
+        self.assertTrue(self.manager.remove(timer.id))
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.ran, [])
+
+
+class ParseIntervalTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(parse_interval("30"), 30)
+        self.assertEqual(parse_interval("1.5s"), 1.5)
+        self.assertEqual(parse_interval("2m"), 120)
+        self.assertEqual(parse_interval("250ms"), 0.25)
+        self.assertIsNone(parse_interval("kill"))
+        self.assertIsNone(parse_interval("3", require_unit=True))
+
+
+class OutboundQueueTest(unittest.TestCase):
+    def test_user_commands_go_first(self):
+        q = OutboundQueue(rate=0)
+        q.push(["n", "e"], batclient.PRIORITY_BULK)
+        q.push(["kick"], batclient.PRIORITY_ACTION)
+        q.push(["flee"])
+        self.assertEqual(q.take(0.0), ["flee", "kick", "n", "e"])
+
+    def test_secret_commands_are_masked(self):
+        q = OutboundQueue(rate=0)
+        q.push(["tiku", "hunter2"], secret=(1,))
+        self.assertEqual(q.peek(batclient.PRIORITY_USER), "tiku")
+        q.queues[batclient.PRIORITY_USER].popleft()
+        self.assertEqual(q.peek(batclient.PRIORITY_USER), "********")
+        self.assertEqual(q.take(0.0), ["hunter2"])
+        self.assertIsNone(q.peek(batclient.PRIORITY_USER))
+
+    def test_token_bucket_limits_and_refills(self):
+        q = OutboundQueue(rate=10, burst=2)
+        q.push(["a", "b", "c", "d"], batclient.PRIORITY_BULK)
+        self.assertEqual(q.take(0.0), ["a", "b"])
+        self.assertEqual(q.take(0.05), [])
+        self.assertAlmostEqual(q.next_ready(0.05), 0.1)
+        self.assertEqual(q.take(0.1), ["c"])
+        self.assertEqual(q.clear(), 1)
+
+
+class RateLimitedSendTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_client()
+        self.c.writer = FakeWriter()
+        self.c.reader = object()
+        self.c.command_history = CommandHistory()
+        self.c.outbound = OutboundQueue(rate=50, burst=2)
+
+    async def test_rest_of_batch_is_sent_later(self):
+        await self.c.send_commands(["n", "e", "s"], priority=batclient.PRIORITY_BULK)
+        self.assertEqual(self.c.writer.sent, [b"n\ne\n"])
+        await self.c.send_command("flee")  # Ohittaa jonon kun token vapautuu
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.c.writer.sent, [b"n\ne\n", b"flee\n", b"s\n"])
+
+
+class SpeedwalkTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.writer = FakeWriter()
+        self.c.reader = object()
+        self.c.command_history = CommandHistory()
+
+    def test_parse(self):
+        self.assertEqual(parse_speedwalk("3n2e (enter cave)d"),
+                         ["n", "n", "n", "e", "e", "enter cave", "d"])
+        self.assertEqual(parse_speedwalk("2ne sw n e"), ["ne", "ne", "sw", "n", "e"])
+        with self.assertRaises(ValueError):
+            parse_speedwalk("3x")
+
+    async def test_unpaced_walk_is_one_write(self):
+        await self.c.start_walk(["n", "n", "e"])
+        self.assertEqual(self.c.writer.sent, [b"n\nn\ne\n"])
+        self.assertEqual(self.c.walk_progress, (3, 3))
+
+    async def test_paced_walk_waits_for_prompt(self):
+        self.c.start_walk(["n", "e"], paced=True)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.c.writer.sent, [b"n\n"])
+        self.c.process_server_text("Forest\n> ", True)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.c.writer.sent, [b"n\n", b"e\n"])
+
+    async def test_cancel_stops_remaining_steps(self):
+        self.c.start_walk(["n", "e"], paced=True)
+        await asyncio.sleep(0.01)
+        self.assertTrue(self.c.cancel_walk())
+        self.c.process_server_text("> ", True)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.c.writer.sent, [b"n\n"])
+
+
+class AutomapperHookTest(unittest.TestCase):
+    def test_server_lines_reach_mapper(self):
+        c = make_screen_client()
+        c.writer = FakeWriter()
+        c.reader = object()
+        c.command_history = CommandHistory()
+        c.automapper.enabled = True
+        c.automapper.on_command("look")
+        c.process_server_text("Square\nObvious exits are: north.\n", False)
+        c.automapper.on_command("n")
+        c.process_server_text("\x1b[1mTemple\x1b[0m\nExits: south\n", False)
+        graph = c.automapper.graph
+        self.assertEqual(graph.room(c.automapper.current)[2], "Temple")
+        self.assertEqual(graph.shortest_path(1, 2), ["n"])
+
+
+class ConnectorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await asyncio.start_server(self.on_client, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.addr = (batclient.socket.AF_INET, ("127.0.0.1", self.port))
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def on_client(self, reader, writer):
+        writer.close()
+
+    async def test_addresses_are_cached_until_ttl(self):
+        conn = Connector(ttl=60)
+        for _ in range(2):
+            _reader, writer = await conn.open("127.0.0.1", self.port)
+            writer.close()
+        self.assertEqual((conn.lookups, conn.cache_hits), (1, 1))
+        sock = writer.get_extra_info("socket")
+        self.assertTrue(sock.getsockopt(batclient.socket.IPPROTO_TCP, batclient.socket.TCP_NODELAY))
+        self.assertTrue(sock.getsockopt(batclient.socket.SOL_SOCKET, batclient.socket.SO_KEEPALIVE))
+
+    async def test_stale_cache_is_used_when_resolver_fails(self):
+        conn = Connector(ttl=0)
+        await conn.resolve("127.0.0.1", self.port)
+        loop = asyncio.get_running_loop()
+        with mock.patch.object(loop, "getaddrinfo", side_effect=OSError("dns down")):
+            self.assertEqual(await conn.resolve("127.0.0.1", self.port), [self.addr])
+            conn.forget("127.0.0.1", self.port)
+            with self.assertRaises(OSError):
+                await conn.resolve("127.0.0.1", self.port)
+
+    async def test_failed_address_falls_through_to_next(self):
+        refused = (batclient.socket.AF_INET, ("127.0.0.1", 1))
+        sock, sockaddr = await Connector()._race([refused, self.addr])
+        sock.close()
+        self.assertEqual(sockaddr, self.addr[1])
+
+    async def test_slow_address_is_raced(self):
+        conn = Connector(happy_eyeballs_delay=0.01)
+        real_connect = conn._connect_one
+
+        async def connect(family, sockaddr):
+            if sockaddr == "slow":
+                await asyncio.sleep(5)
+            return await real_connect(*self.addr)
+
+        with mock.patch.object(conn, "_connect_one", connect):
+            start = time.monotonic()
+            sock, _sockaddr = await conn._race([(0, "slow"), self.addr])
+        sock.close()
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    async def test_refused_retry_is_served_from_cache(self):
+        self.server.close()
+        await self.server.wait_closed()
+        conn = Connector()
+        for _ in range(3):
+            with self.assertRaises(ConnectionRefusedError):
+                await conn.open("127.0.0.1", self.port)
+        self.assertEqual((conn.lookups, conn.cache_hits), (1, 2))
+        self.assertIn(("127.0.0.1", self.port), conn.cache)
+
+    async def test_unreachable_address_is_forgotten(self):
+        conn = Connector()
+
+        async def connect(family, sockaddr):
+            raise OSError(batclient.errno.EHOSTUNREACH, "No route to host")
+
+        with mock.patch.object(conn, "_connect_one", connect):
+            with self.assertRaises(OSError):
+                await conn.open("127.0.0.1", self.port)
+        self.assertEqual(conn.cache, {})
+
+    def test_interleave_families(self):
+        addrs = [(10, "a"), (10, "b"), (2, "c"), (2, "d"), (2, "e")]
+        self.assertEqual([a for _f, a in interleave_families(addrs)], ["a", "c", "b", "d", "e"])
+
+
+class PasteInputTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.writer = FakeWriter()
+        self.c.reader = object()
+        self.c.history_index = -1
+
+    def test_group_paste_keys(self):
+        keys = ["a", "b", "\n", batclient.curses.KEY_LEFT, "c", "\t", "d", "e"]
+        self.assertEqual(batclient.group_paste_keys(keys), [
+            (True, "ab\n"), (False, batclient.curses.KEY_LEFT), (True, "c de")])
+
+    def test_tab_outside_text_stays_a_key(self):
+        self.assertEqual(batclient.group_paste_keys(["\t", "a", "b", "\t"]), [
+            (False, "\t"), (True, "ab"), (False, "\t")])
+        self.assertEqual(batclient.group_paste_keys(["c", "\t"]), [
+            (False, "c"), (False, "\t")])
+
+    async def test_pasted_lines_are_sent_as_one_batch(self):
+        self.c.input_buffer = "say "
+        self.c.cursor_pos = 4
+        with mock.patch.object(self.c, "refresh_input") as refresh:
+            await self.c.handle_keys(list("hello\r\nkill rat\nlook\nkes"))
+        self.assertEqual(self.c.writer.sent, [b"say hello\nkill rat\nlook\n"])
+        self.assertEqual((self.c.input_buffer, self.c.cursor_pos), ("kes", 3))
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(list(self.c.command_history), ["say hello", "kill rat", "look"])
+
+    async def test_text_without_newline_is_one_edit(self):
+        self.c.input_buffer = "ab"
+        self.c.cursor_pos = 1
+        await self.c.handle_keys(list("XYZ"))
+        self.assertEqual((self.c.input_buffer, self.c.cursor_pos), ("aXYZb", 4))
+        self.assertEqual(self.c.writer.sent, [])
+
+    async def test_tab_in_paste_does_not_complete(self):
+        with mock.patch.object(self.c, "complete_word") as complete:
+            await self.c.handle_keys(list("say a\tb"))
+        complete.assert_not_called()
+        self.assertEqual(self.c.input_buffer, "say a b")
+
+    async def test_quit_in_paste_stops(self):
+        self.assertFalse(await self.c.insert_text("/quit\nlook\n"))
+        self.assertEqual(self.c.writer.sent, [])
+
+
+class KeyBindingTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.writer = FakeWriter()
+        self.c.reader = object()
+        self.c.history_index = -1
+
+    def bind(self, line):
+        self.c.keymap.bind(*parse_binding(line))
+
+    def test_every_action_is_implemented(self):
+        for action in ACTIONS:
+            self.assertTrue(hasattr(self.c, "key_" + action.replace("-", "_")), action)
+
+    async def test_default_keys_edit_the_line(self):
+        await self.c.handle_keys(list("abc"))
+        for key in (curses.KEY_LEFT, "\x7f", "\x01", "X", curses.KEY_DC):
+            await self.c.handle_key(key)
+        self.assertEqual((self.c.input_buffer, self.c.cursor_pos), ("Xc", 1))
+        await self.c.handle_key("\n")
+        self.assertEqual(self.c.writer.sent, [b"Xc\n"])
+        self.assertEqual(self.c.input_buffer, "")
+
+    async def test_bound_send_leaves_input_untouched(self):
+        self.bind("F1 = send cast 'cure light wounds'")
+        self.c.input_buffer = "kesken"
+        self.c.cursor_pos = 2
+        await self.c.handle_key(curses.KEY_F1)
+        self.assertEqual(self.c.writer.sent, [b"cast 'cure light wounds'\n"])
+        self.assertEqual((self.c.input_buffer, self.c.cursor_pos), ("kesken", 2))
+
+    async def test_alias_binding_expands_alias(self):
+        self.c.user_aliases = {"hh": "cast heal tiku"}
+        self.bind("M-h = alias hh")
+        await self.c.handle_keys(["\x1b", "h"])
+        self.assertEqual(self.c.writer.sent, [b"cast heal tiku\n"])
+        self.assertEqual(self.c.input_buffer, "")
+
+    async def test_keypad_sequence_and_unmatched_prefix(self):
+        self.bind("KP8 = send north")
+        await self.c.handle_keys(["\x1b", "O", "x"])
+        self.assertEqual(self.c.writer.sent, [b"north\n"])
+        # ESC ja sitten jotain muuta: ESC toimii itsekseen ja merkit kirjoitetaan
+        await self.c.handle_keys(["\x1b", "O", "k"])
+        self.assertEqual(self.c.input_buffer, "Ok")
+        self.assertEqual(self.c.key_pending, ())
+
+    async def test_lone_escape_flushes_on_timeout(self):
+        self.bind("M-x = send look")
+        await self.c.handle_key("\x06")  # Ctrl-F
+        await self.c.handle_key("\x1b")
+        self.assertTrue(self.c.search_mode)
+        await self.c.flush_key_pending()
+        self.assertFalse(self.c.search_mode)
+
+    async def test_bound_printable_is_not_pasted(self):
+        self.bind("` = send score")
+        await self.c.handle_keys(list("ab`c"))
+        self.assertEqual(self.c.writer.sent, [b"score\n"])
+        self.assertEqual(self.c.input_buffer, "abc")
+
+
+class WordIndexTest(unittest.TestCase):
+    def test_frequent_and_recent_words_rank_first(self):
+        index = WordIndex(half_life=10)
+        for _ in range(5):
+            index.add_line("Tiku hits the kobold.")
+        index.add_line("A kobold shaman arrives.")
+        self.assertEqual(index.complete("ko"), ["kobold"])
+        self.assertEqual(index.complete("ti"), ["Tiku"])
+        for _ in range(100):
+            index.add_line("Tikkurila is far away.")
+        self.assertEqual(index.complete("tik"), ["Tikkurila", "Tiku"])
+
+    def test_short_words_and_numbers_are_skipped(self):
+        index = WordIndex()
+        index.add_line("You hit it 12 times for 345 dmg")
+        self.assertEqual(sorted(index.words), ["dmg", "for", "hit", "times", "you"])
+
+    def test_decay_survives_rescale(self):
+        index = WordIndex(half_life=1)
+        index.add_line("goblin")
+        for _ in range(400):
+            index.add_line("")
+        index.add_line("goblin")
+        self.assertAlmostEqual(index.score("goblin"), 1.0, places=6)
+
+    def test_prune_keeps_heaviest(self):
+        index = WordIndex(max_words=4)
+        for _ in range(3):
+            index.add_line("alpha bravo")
+        index.add_line("charlie delta echo foxtrot")
+        self.assertIn("alpha", index.words)
+        self.assertLessEqual(len(index.words), 5)
+        self.assertEqual(index.keys, sorted(index.words))
+
+
+class TabCompletionTest(unittest.TestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.process_server_text(
+            "Kobold shaman arrives.\nKobolds are here.\nkobold bites you.\n", False)
+
+    def tab(self, text):
+        self.c.input_buffer = text
+        self.c.cursor_pos = len(text)
+        self.c.complete_word()
+
+    def test_tab_cycles_through_candidates_and_back(self):
+        self.tab("kill ko")
+        self.assertEqual(self.c.input_buffer, "kill kobold")
+        self.c.complete_word()
+        self.assertEqual(self.c.input_buffer, "kill Kobolds")
+        self.c.complete_word()
+        self.assertEqual(self.c.input_buffer, "kill ko")
+
+    def test_first_word_completes_client_commands_and_aliases(self):
+        self.tab("/trig")
+        self.assertEqual(self.c.input_buffer, "/trigger")
+        self.c.completion = None
+        self.c.user_aliases = {"kk": "kill kobold", "kobo": "look"}
+        self.tab("kob")
+        self.assertEqual(self.c.input_buffer, "kobo")
+
+    def test_no_candidates_leaves_input(self):
+        self.tab("say zz")
+        self.assertEqual((self.c.input_buffer, self.c.completion), ("say zz", None))
+
+
+class HistoryKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        for cmd in ("cast heal tiku", "kill rat", "cast fireball orc"):
+            self.c.command_history.append(cmd)
+
+    def type(self, text):
+        for char in text:
+            self.assertTrue(self.c.history_search_key(ord(char), char))
+
+    def test_ctrl_p_and_ctrl_n(self):
+        self.c.history_step(older=True)
+        self.c.history_step(older=True)
+        self.assertEqual(self.c.input_buffer, "kill rat")
+        self.c.history_step(older=False)
+        self.assertEqual(self.c.input_buffer, "cast fireball orc")
+        self.c.history_step(older=False)
+        self.assertEqual((self.c.input_buffer, self.c.history_index), ("", -1))
+
+    def test_reverse_search_narrows_and_steps_older(self):
+        self.c.input_buffer = "kesken"
+        self.c.start_history_search()
+        self.type("cast")
+        self.assertEqual(self.c.input_buffer, "cast fireball orc")
+        self.assertTrue(self.c.history_search_key(18, None))  # Ctrl-R
+        self.assertEqual(self.c.input_buffer, "cast heal tiku")
+        self.assertIn("(r-haku) 'cast': ", self.c.input_win.drawn()[0])
+        self.assertTrue(self.c.history_search_key(18, None))
+        self.assertIn("ei löydy", self.c.input_win.drawn()[0])
+        self.assertEqual(self.c.input_buffer, "cast heal tiku")
+
+    def test_backspace_returns_to_previous_match(self):
+        self.c.start_history_search()
+        self.type("k")
+        self.assertEqual(self.c.input_buffer, "kill rat")
+        self.type("x")
+        self.c.history_search_key(127, None)
+        self.assertEqual(self.c.input_buffer, "kill rat")
+
+    def test_escape_restores_and_enter_accepts(self):
+        self.c.input_buffer = "kesken"
+        self.c.start_history_search()
+        self.type("kill")
+        self.assertTrue(self.c.history_search_key(27, None))
+        self.assertEqual((self.c.history_search_mode, self.c.input_buffer), (False, "kesken"))
+        self.c.start_history_search()
+        self.type("kill")
+        self.assertFalse(self.c.history_search_key(10, None))  # Enter suoritetaan normaalisti
+        self.assertEqual((self.c.history_search_mode, self.c.input_buffer), (False, "kill rat"))
+
+
+class LinkProbeTest(unittest.TestCase):
+    def test_ewma_and_p95(self):
+        probe = LinkProbe(alpha=0.5)
+        for rtt in (0.1, 0.2):
+            probe.observe(rtt)
+        self.assertAlmostEqual(probe.ewma, 0.15)
+        probe.samples.clear()
+        for ms in range(1, 101):
+            probe.observe(ms / 1000)
+        self.assertEqual(probe.p95(), 0.095)
+        self.assertTrue(probe.status().startswith("RTT "))
+
+    def test_misses_count_only_after_server_has_answered(self):
+        probe = LinkProbe(max_misses=2)
+        self.assertFalse(probe.miss(False))
+        self.assertFalse(probe.miss(False))  # Palvelin ei ehkä tue TIMING-MARKia
+        probe.observe(0.05)
+        self.assertFalse(probe.miss(False))
+        self.assertFalse(probe.miss(True))  # Muu data nollaa laskurin
+        self.assertFalse(probe.miss(False))
+        self.assertTrue(probe.miss(False))
+
+    def test_payload(self):
+        self.assertEqual(LinkProbe().payload,
+                         bytes([batclient.IAC, batclient.DO, batclient.TELOPT_TM]))
+        self.assertEqual(LinkProbe(command="time").payload, b"time\n")
+
+
+class PingLoopTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.writer = FakeWriter()
+        self.c.reader = object()
+        self.c.running = True
+        self.c.auto_reconnect = False
+        self.c.intentional_disconnect = False
+        self.c.link_probe = LinkProbe(interval=0.01, timeout=0.05)
+        patcher = mock.patch.object(batclient.curses, "doupdate")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_timing_mark_reply_is_not_acknowledged(self):
+        tm = batclient.TELOPT_TM
+        self.c.handle_telnet("", bytes([batclient.IAC, batclient.WILL, tm]))
+        self.assertTrue(self.c.ping_event.is_set())
+        self.assertEqual(self.c.writer.sent, [])
+
+    async def test_reply_is_measured(self):
+        task = asyncio.create_task(self.c.ping_loop())
+        for _ in range(100):
+            await asyncio.sleep(0.005)
+            if self.c.writer.sent:
+                break
+        self.c.handle_telnet("", bytes([batclient.IAC, batclient.WONT, batclient.TELOPT_TM]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await task
+        self.assertEqual(len(self.c.link_probe.samples), 1)
+
+    async def test_command_probe_goes_through_outbound_queue(self):
+        self.c.link_probe = LinkProbe(interval=0.01, timeout=0.05, command="time")
+        self.c.outbound = OutboundQueue(rate=1.0, burst=1)
+        task = asyncio.create_task(self.c.ping_loop())
+        for _ in range(100):
+            await asyncio.sleep(0.005)
+            if self.c.writer.sent:
+                break
+        self.c.server_event.set()
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await task
+        self.assertEqual(self.c.writer.sent, [b"time\n"])
+        self.assertEqual(self.c.outbound.sent[batclient.PRIORITY_BULK], 1)
+        self.assertLess(self.c.outbound.tokens, 1)
+
+    async def test_command_probe_waits_for_queued_commands(self):
+        self.c.link_probe = LinkProbe(interval=0.01, timeout=0.05, command="time")
+        self.c.outbound.push(["look"], batclient.PRIORITY_BULK)
+        task = asyncio.create_task(self.c.ping_loop())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await task
+        self.assertEqual(self.c.writer.sent, [])
+        self.assertEqual(self.c.link_probe.sent, 0)
+
+    async def test_half_open_connection_is_dropped(self):
+        writer = self.c.writer
+        self.c.link_probe.answered = True
+        task = asyncio.create_task(self.c.ping_loop())
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if self.c.writer is None:
+                break
+        task.cancel()
+        await task
+        self.assertIsNone(self.c.writer)
+        self.assertTrue(writer.closed)
+        self.assertIn("koettimeen", "".join(self.c.output_lines))
+
+
+class AutoLoginTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_screen_client()
+        self.c.writer = FakeWriter()
+        self.c.reader = object()
+        self.c.command_history = CommandHistory()
+        self.c.username = "tiku"
+        self.c.password = "hunter2"
+        self.c.login_prompt_re = re.compile(batclient.LOGIN_PROMPT_RE)
+        self.c.password_prompt_re = re.compile(batclient.PASSWORD_PROMPT_RE)
+        self.c.login_timeout = 1.0
+
+    async def test_waits_for_name_prompt_and_echo_negotiation(self):
+        task = asyncio.create_task(self.c.auto_login())
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.c.writer.sent, [])
+        self.c.process_server_text("Welcome!\nEnter your name: ", False)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.c.writer.sent, [b"tiku\n"])
+        # WILL ECHO: handle_telnet asettaa echo_off ja tekstiä tulee perään
+        self.c.echo_off = True
+        self.c.process_server_text("Password: ", False)
+        await task
+        self.assertEqual(self.c.writer.sent, [b"tiku\n", b"hunter2\n"])
+        self.assertEqual(list(self.c.command_history), ["tiku"])
+
+    async def test_prompt_marker_is_enough_for_the_name(self):
+        task = asyncio.create_task(self.c.auto_login())
+        self.c.process_server_text("BatMUD> ", True)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.c.writer.sent, [b"tiku\n"])
+        self.c.process_server_text("Password: ", True)
+        await task
+        self.assertEqual(self.c.writer.sent[-1], b"hunter2\n")
+
+    async def test_other_question_does_not_get_the_password(self):
+        self.c.login_timeout = 0.05
+        task = asyncio.create_task(self.c.auto_login())
+        self.c.process_server_text("Enter your name: ", True)
+        await asyncio.sleep(0.01)
+        self.c.process_server_text("Create a new character (y/n)? ", True)
+        await task
+        self.assertEqual(self.c.writer.sent, [b"tiku\n"])
+
+    async def test_timeout_sends_name_but_never_the_password(self):
+        self.c.login_timeout = 0.02
+        await self.c.auto_login()
+        self.assertEqual(self.c.writer.sent, [b"tiku\n"])
+
+
+class ActionSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.ran = []
+
+        async def run(cmd):
+            self.ran.append(cmd)
+        self.sched = ActionScheduler(TimerHeap(), run, rate=100, cooldown=10)
+
+    async def test_burst_produces_one_action(self):
+        for _ in range(50):
+            self.sched.submit("eat bread")
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.ran, ["eat bread"])
+        self.assertEqual(self.sched.coalesced, 49)
+        self.sched.submit("eat bread")
+        self.assertEqual(self.sched.suppressed, 1)
+
+    async def test_rate_limit_spaces_commands(self):
+        self.sched.rate = 20
+        for cmd in ("a", "b", "c"):
+            self.sched.submit(cmd)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.ran, ["a"])
+        await asyncio.sleep(0.12)
+        self.assertEqual(self.ran, ["a", "b", "c"])
+
+    async def test_trigger_cooldown_overrides_default(self):
+        self.sched.submit("x", cooldown=0)
+        await asyncio.sleep(0.01)
+        self.sched.submit("x", cooldown=0)
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.ran, ["x", "x"])
+
+
+class ExecuteLineTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.c = make_client()
+        self.c.writer = FakeWriter()
+        self.c.reader = object()
+        self.c.command_history = CommandHistory()
+
+    async def test_double_slash_sends_single_slash(self):
+        await self.c.execute_line("//who")
+        self.assertEqual(self.c.writer.sent, [b"/who\n"])
+
+    async def test_alias_is_expanded(self):
+        self.c.user_aliases = {"kk": "kill kobold"}
+        await self.c.execute_line("kk")
+        self.assertEqual(self.c.writer.sent, [b"kill kobold\n"])
+
+    async def test_alias_commands_are_sent_as_one_batch(self):
+        self.c.user_aliases = {"kl": "kill $1;get all from corpse"}
+        await self.c.execute_lines(["kl rat", "look"])
+        self.assertEqual(self.c.writer.sent, [b"kill rat\nget all from corpse\nlook\n"])
+
+    async def test_client_command_flushes_batch_first(self):
+        order = []
+
+        async def handle_client_command(cmd):
+            order.append(list(self.c.writer.sent))
+            return True
+        self.c.handle_client_command = handle_client_command
+        self.c.user_aliases = {"x": "a;/clear;b"}
+        await self.c.execute_line("x")
+        self.assertEqual(order, [[b"a\n"]])
+        self.assertEqual(self.c.writer.sent, [b"a\n", b"b\n"])
+
+
 if __name__ == "__main__":
     unittest.main()